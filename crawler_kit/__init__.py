@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/27 10:00
+# @Desc    : HTTP plumbing shared by both crawlers: politeness layer, metrics, response cache and record / replay.
+#            Each crawler folder has a crawler_kit/__init__.py pointing here, so the crawlers import it as
+#            `from crawler_kit.throttle import Politeness` when run from their own folder
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/12 10:00
+# @Desc    : On-disk HTTP response cache with conditional requests (ETag / Last-Modified), size and TTL eviction,
+#            plugged under the shared clients as an httpx transport (the requests adapter lives in the PTT http_client)
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # evict the least recently used entries above this size
+CACHE_TTL = 7 * 24 * 3600  # seconds an entry is kept at all
+CACHE_MAX_AGE = 0  # seconds an entry is served without asking the server, 0 means always revalidate
+# bodies are stored decoded, so the httpx and requests clients can share one cache file: drop the headers of the
+# encoded body
+ENCODED_BODY_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+class CacheEntry:
+    """
+    One cached response
+    """
+    __slots__ = ("status_code", "headers", "body", "stored_at")
+
+    def __init__(self, status_code: int, headers: List[Tuple[str, str]], body: bytes, stored_at: float):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.stored_at = stored_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """
+        Validators to send with the next request, the server answers 304 when the page did not change
+        :return:
+        """
+        headers = {}
+        for key, value in self.headers:
+            if key.lower() == "etag":
+                headers["If-None-Match"] = value
+            elif key.lower() == "last-modified":
+                headers["If-Modified-Since"] = value
+        return headers
+
+
+class ResponseCache:
+    """
+    SQLite-backed response store with hit / miss counters
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL,
+                 max_age: float = CACHE_MAX_AGE, methods: Tuple[str, ...] = ("GET",)):
+        """
+        :param cache_dir: directory of the cache database
+        :param max_bytes: max total size of the cached bodies
+        :param ttl: seconds an entry is kept at all
+        :param max_age: seconds an entry is served without a request
+        :param methods: cached http methods, POST bodies are part of the cache key
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_age = max_age
+        self.methods = methods
+        self.hits = 0  # served from the cache without a request
+        self.revalidated = 0  # server answered 304, body served from the cache
+        self.misses = 0  # body downloaded
+        self.bytes_saved = 0  # body bytes not downloaded thanks to the cache
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "http_cache.sqlite"))
+        # a lost cache entry only costs one download, skip the fsync on every commit
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                status_code INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,))
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(method: str, url: str, body: bytes = b"") -> str:
+        return hashlib.sha256(method.encode() + b" " + url.encode() + b"\n" + (body or b"")).hexdigest()
+
+    def load(self, cache_key: str) -> Optional[CacheEntry]:
+        row = self._conn.execute("SELECT status_code, headers, body, stored_at FROM responses WHERE cache_key = ?",
+                                 (cache_key,)).fetchone()
+        if row is None:
+            return None
+        if row[3] < time.time() - self.ttl:
+            self._delete(cache_key)
+            return None
+        headers = json.loads(row[1])
+        # the rows of older caches kept the headers as a dict
+        headers = list(headers.items()) if isinstance(headers, dict) else [tuple(pair) for pair in headers]
+        if any(key.lower() == "content-encoding" for key, _ in headers):
+            # still encoded, stored by an older transport, the requests adapter could not serve it
+            self.discard(cache_key)
+            return None
+        return CacheEntry(row[0], headers, row[2], row[3])
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored_at < self.max_age
+
+    def is_storable(self, headers: List[Tuple[str, str]]) -> bool:
+        """
+        Whether a 200 response is worth storing: it can be served while fresh or revalidated with a validator, and
+        the server does not forbid storing it
+        :param headers: header pairs of the response
+        :return:
+        """
+        has_validator = False
+        for key, value in headers:
+            if key.lower() == "cache-control" and "no-store" in value.lower():
+                return False
+            if key.lower() in ("etag", "last-modified"):
+                has_validator = True
+        return has_validator or self.max_age > 0
+
+    def discard(self, cache_key: str):
+        self._delete(cache_key)
+        self._conn.commit()
+
+    def store(self, cache_key: str, status_code: int, headers: List[Tuple[str, str]], body: bytes):
+        now = time.time()
+        self._delete(cache_key)
+        self._conn.execute(
+            "INSERT INTO responses (cache_key, status_code, headers, body, size, stored_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", (cache_key, status_code, json.dumps(headers), body, len(body), now, now))
+        self._total_bytes += len(body)
+        self._evict()
+        self._conn.commit()
+
+    def touch(self, cache_key: str, refreshed: bool = False):
+        """
+        Record an access, a 304 also restarts the entry's age
+        :param cache_key:
+        :param refreshed: the server confirmed the entry is still valid
+        :return:
+        """
+        now = time.time()
+        if refreshed:
+            self._conn.execute("UPDATE responses SET accessed_at = ?, stored_at = ? WHERE cache_key = ?",
+                               (now, now, cache_key))
+        else:
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE cache_key = ?", (now, cache_key))
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+            "cached_bytes": self._total_bytes,
+        }
+
+    def close(self):
+        self._conn.close()
+
+    def _delete(self, cache_key: str):
+        row = self._conn.execute("SELECT size FROM responses WHERE cache_key = ?", (cache_key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+            self._total_bytes -= row[0]
+
+    def _evict(self):
+        # drop the least recently used entries until the cache fits in max_bytes
+        while self._total_bytes > self.max_bytes:
+            row = self._conn.execute(
+                "SELECT cache_key, size FROM responses ORDER BY accessed_at LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._conn.execute("DELETE FROM responses WHERE cache_key = ?", (row[0],))
+            self._total_bytes -= row[1]
+
+
+def decoded_headers(headers) -> List[Tuple[str, str]]:
+    """
+    Header pairs of a response whose body is stored decoded
+    :param headers: header pairs of the response as received
+    :return:
+    """
+    return [(key, value) for key, value in headers if key.lower() not in ENCODED_BODY_HEADERS]
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport answering from a ResponseCache and revalidating stale entries with conditional requests
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, cache: ResponseCache):
+        self.transport = transport
+        self.cache = cache
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method not in self.cache.methods:
+            return await self.transport.handle_async_request(request)
+
+        cache_key = self.cache.make_key(request.method, str(request.url), request.content)
+        entry = self.cache.load(cache_key)
+        if entry is not None:
+            if self.cache.is_fresh(entry):
+                self.cache.hits += 1
+                self.cache.bytes_saved += len(entry.body)
+                self.cache.touch(cache_key)
+                return self._from_entry(entry, request)
+            request.headers.update(entry.conditional_headers())
+
+        response = await self.transport.handle_async_request(request)
+        if response.status_code == 304 and entry is not None:
+            await response.aclose()
+            self.cache.revalidated += 1
+            self.cache.bytes_saved += len(entry.body)
+            self.cache.touch(cache_key, refreshed=True)
+            return self._from_entry(entry, request)
+
+        self.cache.misses += 1
+        # a list of pairs keeps the repeated headers such as Set-Cookie
+        headers = response.headers.multi_items()
+        if response.status_code != 200 or not self.cache.is_storable(headers):
+            if entry is not None:
+                self.cache.discard(cache_key)
+            return response
+        body = await response.aread()
+        await response.aclose()
+        headers = decoded_headers(headers)
+        self.cache.store(cache_key, response.status_code, headers, body)
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request,
+                              extensions=response.extensions)
+
+    async def aclose(self):
+        await self.transport.aclose()
+        self.cache.close()
+
+    @staticmethod
+    def _from_entry(entry: CacheEntry, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(entry.status_code, headers=entry.headers, content=entry.body, request=request)
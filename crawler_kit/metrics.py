@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/16 14:00
+# @Desc    : Crawl-wide metrics: counters, max gauges and latency histograms with labels, written at the end of a run
+#            as a Prometheus text or JSON snapshot
+
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Cumulative histogram with Prometheus buckets: counts[i] is the number of observations <= buckets[i]
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q quantile, inf above the last bucket
+        :param q: 0 to 1
+        :return:
+        """
+        rank = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Registry of the metrics of one crawl run, every metric is identified by its name and labels
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[LabelsKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelsKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelsKey, Histogram]] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> LabelsKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Add value to a counter
+        :param name: e.g. http_response_bytes_total
+        :param value:
+        :param labels: e.g. endpoint="article"
+        :return:
+        """
+        series = self.counters.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def gauge_max(self, name: str, value: float, **labels):
+        """
+        Keep the max value seen, used for queue depths
+        :param name:
+        :param value:
+        :param labels:
+        :return:
+        """
+        series = self.gauges.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = max(series.get(key, value), value)
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Add an observation to a latency histogram
+        :param name: e.g. http_request_seconds
+        :param value: seconds
+        :param labels:
+        :return:
+        """
+        series = self.histograms.setdefault(name, {})
+        key = self._key(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Observe the seconds spent in the with block
+        :param name:
+        :param labels:
+        :return:
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        self.counters.clear()
+        self.gauges.clear()
+        self.histograms.clear()
+
+    def to_dict(self) -> Dict[str, List[Dict]]:
+        """
+        JSON friendly snapshot, histograms with count, sum, p50, p99 and buckets
+        :return:
+        """
+        snapshot: Dict[str, List[Dict]] = {}
+        for name, series in list(self.counters.items()) + list(self.gauges.items()):
+            snapshot[name] = [{"labels": dict(key), "value": value} for key, value in series.items()]
+        for name, series in self.histograms.items():
+            snapshot[name] = [{
+                "labels": dict(key),
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "p50": histogram.quantile(0.5),
+                "p99": histogram.quantile(0.99),
+                "buckets": {str(bound): count for bound, count in zip(histogram.buckets, histogram.counts)},
+            } for key, histogram in series.items()]
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        """
+        Prometheus text exposition format
+        :return:
+        """
+        lines: List[str] = []
+        for metric_type, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+            for name, series in metrics.items():
+                lines.append(f"# TYPE {name} {metric_type}")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        for name, series in self.histograms.items():
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in series.items():
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', str(bound)),))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, file_path: str):
+        """
+        Write the snapshot, JSON for a .json file, Prometheus text otherwise
+        :param file_path:
+        :return:
+        """
+        with open(file_path, "w", encoding="utf-8") as f:
+            if file_path.endswith(".json"):
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            else:
+                f.write(self.to_prometheus())
+
+
+def _format_labels(key: LabelsKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# registry shared by the fetch and parse functions of a run
+metrics = Metrics()
+
+
+def record_response(endpoint: str, status_code: int, body_size: int, seconds: float,
+                    registry: Optional[Metrics] = None):
+    """
+    Record one http response: latency histogram, status counter and body bytes, labelled by endpoint
+    :param endpoint: e.g. index, article, screener
+    :param status_code:
+    :param body_size: body bytes
+    :param seconds: request latency
+    :param registry: defaults to the shared registry
+    :return:
+    """
+    registry = registry or metrics
+    registry.observe("http_request_seconds", seconds, endpoint=endpoint)
+    registry.inc("http_responses_total", endpoint=endpoint, status=status_code)
+    registry.inc("http_response_bytes_total", body_size, endpoint=endpoint)
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/23 10:00
+# @Desc    : Record / replay of real HTTP responses: a cassette directory filled by an httpx transport during a crawl,
+#            served again by a local HTTP server with configurable latency and error injection
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+# headers describing the recorded connection rather than the response, the replay server sets its own
+HOP_HEADERS = ("connection", "keep-alive", "transfer-encoding", "content-length", "date", "set-cookie")
+REPLAY_ERROR_STATUS = 503  # status of an injected error, the crawlers retry it
+
+
+class CassetteEntry:
+    """
+    One recorded response
+    """
+    __slots__ = ("method", "url", "status_code", "headers", "body_file")
+
+    def __init__(self, method: str, url: str, status_code: int, headers: Dict[str, str], body_file: str):
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.body_file = body_file
+
+
+class Cassette:
+    """
+    Directory of recorded responses: one <key>.body file per request, still content-encoded as sent by the server,
+    and an index.jsonl line with its status and headers. Requests are matched on method, path and body, the host and
+    the query string are ignored so the replay works from any address and without the session tokens of the recording.
+    A request recorded twice keeps its last response.
+    """
+
+    def __init__(self, dir_path: str):
+        """
+        :param dir_path: cassette directory, created if missing
+        """
+        self.dir_path = dir_path
+        self.entries: Dict[str, CassetteEntry] = {}
+        self._lock = threading.Lock()
+        os.makedirs(dir_path, exist_ok=True)
+        index_path = os.path.join(dir_path, "index.jsonl")
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        key = entry.pop("key")
+                        self.entries[key] = CassetteEntry(**entry)
+
+    @staticmethod
+    def make_key(method: str, path: str, body: bytes = b"") -> str:
+        return hashlib.sha256(method.encode() + b" " + path.encode() + b"\n" + (body or b"")).hexdigest()
+
+    def record(self, method: str, url: str, body: bytes, status_code: int, headers: Dict[str, str],
+               response_body: bytes):
+        """
+        Store one response
+        :param method: request method
+        :param url: request url, only its path is matched
+        :param body: request body
+        :param status_code:
+        :param headers: response headers
+        :param response_body: raw response body
+        :return:
+        """
+        key = self.make_key(method, httpx.URL(url).path, body)
+        entry = CassetteEntry(method, url, status_code,
+                              {name: value for name, value in headers.items() if name.lower() not in HOP_HEADERS},
+                              f"{key}.body")
+        with self._lock:
+            with open(os.path.join(self.dir_path, entry.body_file), "wb") as f:
+                f.write(response_body)
+            with open(os.path.join(self.dir_path, "index.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "method": method, "url": url, "status_code": status_code,
+                                    "headers": entry.headers, "body_file": entry.body_file}, ensure_ascii=False))
+                f.write("\n")
+            self.entries[key] = entry
+
+    def lookup(self, method: str, path: str, body: bytes = b"") -> Optional[Tuple[CassetteEntry, bytes]]:
+        """
+        Recorded response of a request
+        :param method:
+        :param path: url path, without the query string
+        :param body:
+        :return: entry and body, None if the request was not recorded
+        """
+        entry = self.entries.get(self.make_key(method, path, body))
+        if entry is None:
+            return None
+        with open(os.path.join(self.dir_path, entry.body_file), "rb") as f:
+            return entry, f.read()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport storing every response of the wrapped transport in a cassette, put it right above the network
+    transport so it records what the server sent, retries and errors included
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, cassette: Cassette):
+        self.transport = transport
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self.transport.handle_async_request(request)
+        if response.status_code == 304:
+            # answer to a conditional request of the response cache, there is no body to replay
+            return response
+        # keep the raw (still content-encoded) body, the client decodes it as usual
+        body = b"".join([chunk async for chunk in response.stream])
+        await response.aclose()
+        headers = dict(response.headers.multi_items())
+        self.cassette.record(request.method, str(request.url), request.content, response.status_code, headers, body)
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request,
+                              extensions=response.extensions)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Threading server answering from a cassette, with a listen backlog large enough for the concurrent crawlers
+    """
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address: Tuple[str, int], cassette: Cassette, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, reset_rate: float = 0.0, error_status: int = REPLAY_ERROR_STATUS,
+                 seed: Optional[int] = None):
+        """
+        :param address: (host, port), port 0 for a random one
+        :param cassette: recorded responses
+        :param latency: seconds to sleep before answering each request
+        :param jitter: extra seconds, uniformly drawn between 0 and jitter, added to the latency
+        :param error_rate: share of the requests answered with error_status instead of the recorded response
+        :param reset_rate: share of the requests whose connection is closed without any answer
+        :param error_status: status of the injected errors
+        :param seed: seed of the injected latency and errors, None for a random one
+        """
+        super().__init__(address, ReplayHandler)
+        self.cassette = cassette
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.error_status = error_status
+        self.served = 0  # recorded responses sent
+        self.missed = 0  # requests not in the cassette, answered 404
+        self.errors = 0  # injected errors
+        self.resets = 0  # injected connection resets
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> Tuple[float, float]:
+        """
+        Delay and fate of the next request
+        :return: seconds to sleep, uniform number in [0, 1) compared with the reset and error rates
+        """
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter), self._random.random()
+
+    def stats(self) -> Dict[str, int]:
+        return {"served": self.served, "missed": self.missed, "errors": self.errors, "resets": self.resets}
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """
+    Answer any GET or POST from the cassette of the server
+    """
+    # keep-alive connections, as the crawlers expect from the real hosts
+    protocol_version = "HTTP/1.1"
+    server: ReplayServer
+
+    def setup(self):
+        super().setup()
+        # headers and body are two writes, without it the second one waits for the delayed ack of the client
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _replay(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        delay, fate = self.server.draw()
+        time.sleep(delay)
+        if fate < self.server.reset_rate:
+            self.server.resets += 1
+            # linger 0: the close sends a RST, the client sees a connection reset rather than an empty answer
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.connection.close()
+            self.close_connection = True
+            return
+        if fate < self.server.reset_rate + self.server.error_rate:
+            self.server.errors += 1
+            self._send(self.server.error_status, {"Retry-After": "0"}, b"")
+            return
+        recorded = self.server.cassette.lookup(self.command, self.path.split("?")[0], body)
+        if recorded is None:
+            self.server.missed += 1
+            self._send(404, {"Content-Type": "text/plain"}, b"not recorded")
+            return
+        entry, response_body = recorded
+        self.server.served += 1
+        self._send(entry.status_code, entry.headers, response_body)
+
+    def _send(self, status_code: int, headers: Dict[str, str], body: bytes):
+        self.send_response(status_code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _replay
+    do_POST = _replay
+
+    def log_message(self, format, *args):
+        # keep the benchmark output clean
+        pass
+
+
+def start_replay_server(cassette_dir: str, **options) -> Tuple[ReplayServer, str]:
+    """
+    Serve a cassette on a random local port in a daemon thread
+    :param cassette_dir: directory filled by a RecordingTransport
+    :param options: latency, jitter, error_rate, reset_rate, error_status, seed of ReplayServer
+    :return: (server, base host), call server.shutdown() to stop it
+    """
+    server = ReplayServer(("127.0.0.1", 0), Cassette(cassette_dir), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Serve a recorded cassette, point BASE_HOST / HOST to it")
+    arg_parser.add_argument("cassette", help="cassette directory")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    arg_parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds per request")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help=f"share of {REPLAY_ERROR_STATUS} answers")
+    arg_parser.add_argument("--reset-rate", type=float, default=0.0, help="share of dropped connections")
+    arg_parser.add_argument("--seed", type=int, default=None)
+    args = arg_parser.parse_args()
+
+    replay_server = ReplayServer(("127.0.0.1", args.port), Cassette(args.cassette), args.latency, args.jitter,
+                                 args.error_rate, args.reset_rate, seed=args.seed)
+    print(f"Replaying {len(replay_server.cassette)} responses on http://127.0.0.1:{args.port}, "
+          f"press Ctrl+C to stop...")
+    try:
+        replay_server.serve_forever()
+    except KeyboardInterrupt:
+        print(replay_server.stats())
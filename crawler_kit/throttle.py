@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/13 10:00
+# @Desc    : Politeness layer of the async crawler: per-host token bucket, AIMD concurrency and jittered retries
+#            with a retry budget, plugged under the shared client as an httpx transport, and a global connection
+#            budget shared fairly by several crawls
+
+import asyncio
+import email.utils
+import random
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+import httpx
+
+from crawler_kit.metrics import metrics
+
+HOST_RATE_LIMIT = 20.0  # max requests per second to one host
+INITIAL_CONCURRENCY = 8  # requests in flight to one host at the start
+MAX_CONCURRENCY = 64  # upper bound of the adaptive concurrency of one host
+MAX_RETRIES = 4  # retries of one request
+RETRY_BACKOFF_BASE = 0.5  # seconds, the backoff ceiling doubles on every retry
+RETRY_BACKOFF_MAX = 30.0  # seconds, max backoff ceiling and max honoured Retry-After
+RETRY_BUDGET_RATIO = 0.2  # retries allowed per request sent, on top of RETRY_BUDGET_MIN
+RETRY_BUDGET_MIN = 10  # retries always allowed
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)  # responses meaning the host is overloaded
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: `rate` requests per second on average, bursts of up to `burst` requests
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        :param rate: tokens added per second
+        :param burst: bucket size, defaults to one second worth of tokens
+        """
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0):
+        """
+        Wait until `tokens` tokens are available and take them
+        :param tokens:
+        :return:
+        """
+        # the lock makes the waiters take their turn in order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit: one more slot after `limit` healthy responses in a row, halved when the host is overloaded
+    """
+
+    def __init__(self, initial: int = INITIAL_CONCURRENCY, max_limit: int = MAX_CONCURRENCY,
+                 decrease_interval: float = 1.0):
+        """
+        :param initial: limit at the start
+        :param max_limit: upper bound of the limit
+        :param decrease_interval: seconds between two decreases, the requests already in flight when the host
+                                  got overloaded would halve the limit again otherwise
+        """
+        self.limit = initial
+        self.max_limit = max_limit
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self._healthy = 0
+        self._decreased_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, overloaded: bool = False):
+        """
+        Free a slot and adapt the limit
+        :param overloaded: the request timed out or got a RETRY_STATUS_CODES response
+        :return:
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                self._healthy = 0
+                now = time.monotonic()
+                if now - self._decreased_at >= self.decrease_interval:
+                    self.limit = max(1, self.limit // 2)
+                    self._decreased_at = now
+            else:
+                self._healthy += 1
+                if self._healthy >= self.limit:
+                    self.limit = min(self.max_limit, self.limit + 1)
+                    self._healthy = 0
+            self._condition.notify_all()
+
+
+class RetryBudget:
+    """
+    Caps the retries to a ratio of the requests sent, so a failing host does not get a retry storm
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_retries: int = RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.requests = 0
+        self.retries = 0
+
+    def can_retry(self) -> bool:
+        return self.retries < self.min_retries + self.ratio * self.requests
+
+
+class Politeness:
+    """
+    Politeness state shared by all requests of one crawl run: a token bucket and a concurrency limiter per host,
+    one retry budget and the counters
+    """
+
+    def __init__(self, rate: Optional[float] = HOST_RATE_LIMIT, initial_concurrency: int = INITIAL_CONCURRENCY,
+                 max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = RETRY_BACKOFF_BASE, backoff_max: float = RETRY_BACKOFF_MAX,
+                 retry_budget: Optional[RetryBudget] = None):
+        """
+        :param rate: max requests per second to one host, None for no rate limit
+        :param initial_concurrency: requests in flight to one host at the start
+        :param max_concurrency: upper bound of the adaptive concurrency
+        :param max_retries: retries of one request
+        :param backoff_base: seconds, the backoff ceiling doubles on every retry
+        :param backoff_max: seconds, max backoff ceiling and max honoured Retry-After
+        :param retry_budget: defaults to RETRY_BUDGET_RATIO of the requests
+        """
+        self.rate = rate
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget = retry_budget or RetryBudget()
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+        self.overloaded = 0  # timeouts and RETRY_STATUS_CODES responses
+        self.gave_up = 0  # requests still failing after their retries
+
+    def bucket(self, host: str) -> Optional[TokenBucket]:
+        if self.rate is None:
+            return None
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate)
+        return self.buckets[host]
+
+    def limiter(self, host: str) -> AdaptiveConcurrencyLimiter:
+        if host not in self.limiters:
+            self.limiters[host] = AdaptiveConcurrencyLimiter(self.initial_concurrency, self.max_concurrency)
+        return self.limiters[host]
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Seconds to wait before a retry: the server's Retry-After if any, else full jitter exponential backoff
+        :param attempt: 0 for the first retry
+        :param retry_after: seconds asked by the server
+        :return:
+        """
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "requests": self.retry_budget.requests,
+            "retries": self.retry_budget.retries,
+            "overloaded": self.overloaded,
+            "gave_up": self.gave_up,
+            "concurrency": {host: limiter.limit for host, limiter in self.limiters.items()},
+        }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After header in seconds, it is either a number of seconds or an http date
+    :param value:
+    :return:
+    """
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class PoliteTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport sending every request through the host's token bucket and concurrency limiter, and retrying
+    transport errors (timeouts, resets, protocol errors) and RETRY_STATUS_CODES responses with backoff while the retry
+    budget allows it
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, politeness: Politeness):
+        self.transport = transport
+        self.politeness = politeness
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        politeness = self.politeness
+        bucket = politeness.bucket(request.url.host)
+        limiter = politeness.limiter(request.url.host)
+        politeness.retry_budget.requests += 1
+        attempt = 0
+        while True:
+            if bucket is not None:
+                await bucket.acquire()
+            await limiter.acquire()
+            overloaded = False
+            try:
+                response = await self.transport.handle_async_request(request)
+                overloaded = response.status_code in RETRY_STATUS_CODES
+            except httpx.TransportError:
+                # timeouts, network errors and protocol errors such as a server disconnecting without an answer
+                overloaded = True
+                politeness.overloaded += 1
+                if attempt >= politeness.max_retries or not politeness.retry_budget.can_retry():
+                    politeness.gave_up += 1
+                    metrics.inc("http_gave_up_total", host=request.url.host)
+                    raise
+                retry_after = None
+                response = None
+            finally:
+                # free the slot whatever happened, one kept by a failed or cancelled request blocks the host for good
+                await limiter.release(overloaded=overloaded)
+            if response is not None:
+                if not overloaded:
+                    return response
+                politeness.overloaded += 1
+                if attempt >= politeness.max_retries or not politeness.retry_budget.can_retry():
+                    politeness.gave_up += 1
+                    metrics.inc("http_gave_up_total", host=request.url.host)
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                await response.aclose()
+
+            politeness.retry_budget.retries += 1
+            metrics.inc("http_retries_total", host=request.url.host)
+            await asyncio.sleep(politeness.backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def request_host(request: httpx.Request) -> str:
+    return request.url.host
+
+
+class FairSlots:
+    """
+    Global budget of `total` requests in flight shared by several keys (e.g. the boards of a multi-board crawl):
+    the waiting keys get the free slots in round robin, so a board with a long backlog does not starve the others
+    """
+
+    def __init__(self, total: int, per_key: Optional[int] = None, key: Callable[[httpx.Request], str] = request_host):
+        """
+        :param total: max requests in flight over all keys
+        :param per_key: max requests in flight of one key, None to let one key use the whole idle budget
+        :param key: key of a request, the host by default
+        """
+        self.total = total
+        self.per_key = per_key
+        self.key = key
+        self.in_flight = 0
+        self.key_in_flight: Dict[str, int] = {}
+        self.granted: Dict[str, int] = {}
+        # waiters of every key in arrival order, and the keys having waiters in round robin order
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {}
+        self._turns: Deque[str] = deque()
+
+    def _key_free(self, key: str) -> bool:
+        return self.per_key is None or self.key_in_flight.get(key, 0) < self.per_key
+
+    def _grant(self, key: str):
+        self.in_flight += 1
+        self.key_in_flight[key] = self.key_in_flight.get(key, 0) + 1
+        self.granted[key] = self.granted.get(key, 0) + 1
+
+    async def acquire(self, key: str):
+        """
+        Wait for a slot, a key already waiting gets its slots in arrival order
+        :param key:
+        :return:
+        """
+        if key not in self._waiters and self.in_flight < self.total and self._key_free(key):
+            self._grant(key)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        if key not in self._waiters:
+            self._waiters[key] = deque()
+            self._turns.append(key)
+        self._waiters[key].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # cancelled after the slot was handed over, give it to the next waiter
+            if not waiter.cancelled():
+                self.release(key)
+            raise
+
+    def release(self, key: str):
+        """
+        Free the slot of a request and hand the free slots to the next keys in turn
+        :param key:
+        :return:
+        """
+        self.in_flight -= 1
+        self.key_in_flight[key] -= 1
+        skipped = 0
+        while self._turns and self.in_flight < self.total and skipped < len(self._turns):
+            next_key = self._turns.popleft()
+            waiters = self._waiters[next_key]
+            while waiters and waiters[0].done():
+                # cancelled waiter
+                waiters.popleft()
+            if not waiters:
+                del self._waiters[next_key]
+                continue
+            if not self._key_free(next_key):
+                self._turns.append(next_key)
+                skipped += 1
+                continue
+            self._grant(next_key)
+            waiters.popleft().set_result(None)
+            skipped = 0
+            # back of the line
+            if waiters:
+                self._turns.append(next_key)
+            else:
+                del self._waiters[next_key]
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": {key: len(waiters) for key, waiters in self._waiters.items()},
+            "granted": dict(self.granted),
+        }
+
+
+class FairShareTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport holding one slot of the fair share budget per request, its retries included
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, slots: FairSlots):
+        self.transport = transport
+        self.slots = slots
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = self.slots.key(request)
+        with metrics.timer("fair_slot_wait_seconds", key=key):
+            await self.slots.acquire(key)
+        try:
+            return await self.transport.handle_async_request(request)
+        finally:
+            self.slots.release(key)
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -4,19 +4,47 @@
 # @Desc    : Code of asynchronised crawler, target: https://www.ptt.cc/bbs/Stock/index.html,
 #            extract posts and comments of first N pages
 
-from typing import List
+import argparse
+import re
+from collections import deque
+from typing import Dict, List, Optional
 
 import asyncio
+import time
 import httpx
 from bs4 import BeautifulSoup
 
-from common import PostContent, PostComment, PostContentDetail, parse_post_content, dataclass_to_dict
+from checkpoint import CrawlCheckpoint
+from common import LazyPostContentDetail, PostContent, PostContentDetail, dataclass_to_dict, page_encoding
+from crawler_kit.http_cache import ResponseCache
+from crawler_kit.metrics import metrics, record_response
+from crawler_kit.replay import Cassette
+from crawler_kit.throttle import Politeness, TokenBucket
+from http_client import create_async_client
+from parse_pool import ParsePool
+from parser_backends import get_parser_backend
+from seen_index import SeenArticleIndex
+from storage import JsonlPostSink, ParquetPostSink
 
+BOARD = "Stock"  # board name, as in https://www.ptt.cc/bbs/<board>/index.html
 FIRST_N_PAGE = 2  # extract first N page
+PARSER_BACKEND = "lxml"  # html parser backend: bs4, parsel, lxml, selectolax
+LAZY_DETAIL = False  # parse article content / comments on first access, the jsonl / parquet exports read them all
+DETAIL_CONCURRENCY = 10  # max number of detail pages fetched at the same time, 1 means sequential
+LIST_CONCURRENCY = 5  # max number of index pages fetched at the same time
+HOST_RATE_LIMIT = 20.0  # max requests per second to the host, retries included, None for no limit
+PARSE_WORKERS = 0  # processes (or threads) parsing the pages, 0 parses in the event loop
+PARSE_EXECUTOR = "process"  # process, or thread for a parser releasing the GIL
 BASE_HOST = "https://www.ptt.cc"
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-}
+STREAM_EXPORT = True  # append every post to a .jsonl file while crawling, otherwise dump one json array at the end
+PARQUET_EXPORT = False  # write a parquet dataset of posts and comments instead, needs pyarrow
+INCREMENTAL = False  # only fetch detail pages of new posts and posts whose push count changed since the last run
+SEEN_INDEX_PATH = "ptt_seen_articles.db"  # sqlite index of the fetched articles used by the incremental mode
+HTTP_CACHE_DIR = ".http_cache"  # on-disk response cache revalidated with ETag / Last-Modified, None to disable
+VERBOSE = True  # print every page and post, turn it off on large runs
+CHECKPOINT_PATH = "ptt_crawl_checkpoint_{board}.json"  # progress of the run, continued with --resume, None to disable
+METRICS_PATH = "ptt_crawler_metrics.prom"  # metrics snapshot written at the end of the run, .json for json, None to skip
+RECORD_DIR = None  # cassette directory recording every response for replay.py, None to disable
 
 
 def parse_post_use_bs(html_content: str) -> PostContent:
@@ -41,130 +69,454 @@ def parse_post_use_bs(html_content: str) -> PostContent:
     # extract post link
     post_content.detail_link = soup.select("div.r-ent div.title a")[0]["href"] if len(
         soup.select("div.r-ent div.title a")) > 0 else ""
+    # extract push count
+    post_content.push_count = soup.select("div.r-ent div.nrec")[0].text.strip() if len(
+        soup.select("div.r-ent div.nrec")) > 0 else ""
     return post_content
 
 
-async def get_latest_page_number() -> int:
+async def send_get(client: httpx.AsyncClient, url: str, endpoint: str) -> httpx.Response:
+    """
+    GET a page and record its latency, status and size
+    :param client: shared http client
+    :param url:
+    :param endpoint: metrics label: latest_index, index or article
+    :return:
+    """
+    start = time.perf_counter()
+    response = await client.get(url=url)
+    record_response(endpoint, response.status_code, len(response.content), time.perf_counter() - start)
+    return response
+
+
+async def get_latest_page_number(client: httpx.AsyncClient, board: str = BOARD) -> int:
     """
     Get the latest page number
+    :param client: shared http client
+    :param board: board name
     :return:
     """
-    uri = "/bbs/Stock/index.html"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url=BASE_HOST + uri, headers=HEADERS)
-        if response.status_code != 200:
-            raise Exception("send request got error status code, reason：", response.text)
-        soup = BeautifulSoup(response.text, "lxml")
+    uri = f"/bbs/{board}/index.html"
+    response = await send_get(client, BASE_HOST + uri, "latest_index")
+    if response.status_code != 200:
+        raise Exception("send request got error status code, reason：", response.text)
+    soup = BeautifulSoup(response.content, "lxml",
+                         from_encoding=page_encoding(response.headers.get("Content-Type"), response.content))
 
-        css_selector = "#action-bar-container > div > div.btn-group.btn-group-paging > a:nth-child(2)"
-        pagination_link = soup.select(css_selector)[0]["href"].strip()
+    css_selector = "#action-bar-container > div > div.btn-group.btn-group-paging > a:nth-child(2)"
+    pagination_link = soup.select(css_selector)[0]["href"].strip()
 
-        # pagination_link: /bbs/Stock/index7084.html -> 7084
-        latest_page_number = int(pagination_link.replace("/bbs/Stock/index", "").replace(".html", ""))
+    # pagination_link: /bbs/Stock/index7084.html -> 7084
+    latest_page_number = int(re.search(r"index(\d+)\.html", pagination_link).group(1))
     return latest_page_number
 
 
-async def fetch_bbs_posts_list(latest_number: int) -> List[PostContent]:
+async def fetch_bbs_posts_page(client: httpx.AsyncClient, page_number: int,
+                               rate_limiter: Optional[TokenBucket] = None,
+                               parse_pool: Optional[ParsePool] = None, board: str = BOARD) -> List[PostContent]:
     """
-    Fetch the note list from the latest page number to the latest page number - FIRST_N_PAGE
+    Fetch the note list of one index page
+    :param client: shared http client
+    :param page_number: index page number
+    :param rate_limiter: optional token bucket shared by the index page requests, for a client without the
+                         Politeness of run_crawler which already holds every request to HOST_RATE_LIMIT
+    :param parse_pool: optional parse stage, the page is parsed in the event loop without it
+    :param board: board name
     :return:
     """
-    posts_list: List[PostContent] = []
+    if VERBOSE:
+        print(f"Start getting the list of posts on page {page_number}...")
+    if rate_limiter is not None:
+        await rate_limiter.acquire()
+
+    # assemble the uri
+    uri = f"/bbs/{board}/index{page_number}.html"
+    response = await send_get(client, BASE_HOST + uri, "index")
+    if response.status_code != 200:
+        print(f"Page {page_number} post fetch exception, cause: {response.text}")
+        return []
 
+    # parse the raw bytes once with the declared encoding, no str copy of the page and no charset sniffing
+    encoding = page_encoding(response.headers.get("Content-Type"), response.content)
+    if parse_pool is not None:
+        # the pool observes parse_seconds without the wait for a free worker
+        page_posts: List[PostContent] = await parse_pool.parse_post_list(response.content, encoding)
+    else:
+        with metrics.timer("parse_seconds", page_type="index"):
+            page_posts: List[PostContent] = get_parser_backend(PARSER_BACKEND).parse_post_list_bytes(
+                response.content, encoding)
+    if VERBOSE:
+        print(f"End Get the list of posts on page {page_number}, this time getting :{len(page_posts)} posts...")
+    return page_posts
+
+
+def get_page_numbers(latest_number: int) -> List[int]:
+    """
+    Index page numbers from the latest page number to the latest page number - FIRST_N_PAGE
+    :param latest_number: latest page number
+    :return:
+    """
     # true start page number = latest page number + 1
     start_page_number = latest_number + 1
     end_page_number = start_page_number - FIRST_N_PAGE
-    for page_number in range(start_page_number, end_page_number, -1):
-        print(f"Start getting the list of posts on page {page_number}...")
+    return list(range(start_page_number, end_page_number, -1))
 
-        # assemble the uri
-        uri = f"/bbs/Stock/index{page_number}.html"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url=BASE_HOST + uri, headers=HEADERS)
-            if response.status_code != 200:
-                print(f"Page {page_number} post fetch exception, cause: {response.text}")
-                continue
 
-            soup = BeautifulSoup(response.text, "lxml")
-            all_post_elements = soup.select("div.r-ent")
-            for post_element in all_post_elements:
-                # using .prettify() to fetch the html content of the element
-                post_content: PostContent = parse_post_use_bs(post_element.prettify())
-                posts_list.append(post_content)
-            print(f"End Get the list of posts on page {page_number}, this time getting :{len(all_post_elements)} posts...")
-    return posts_list
+async def fetch_bbs_posts_list(client: httpx.AsyncClient, latest_number: int,
+                               concurrency: int = LIST_CONCURRENCY,
+                               parse_pool: Optional[ParsePool] = None, board: str = BOARD,
+                               rate_limiter: Optional[TokenBucket] = None) -> List[PostContent]:
+    """
+    Fetch the note list from the latest page number to the latest page number - FIRST_N_PAGE,
+    `concurrency` index pages at a time, the posts are merged in page order
+    :param client: shared http client
+    :param latest_number: latest page number
+    :param concurrency: number of index pages fetched at the same time
+    :param parse_pool: optional parse stage
+    :param board: board name
+    :param rate_limiter: optional token bucket of the index page requests, see fetch_bbs_posts_page
+    :return:
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch_page(page_number: int) -> List[PostContent]:
+        async with semaphore:
+            return await fetch_bbs_posts_page(client, page_number, rate_limiter, parse_pool, board)
+
+    # gather returns the pages in the order of get_page_numbers whatever order they finish in
+    pages = await asyncio.gather(*[fetch_page(page_number) for page_number in get_page_numbers(latest_number)])
+    return [post_content for page_posts in pages for post_content in page_posts]
 
 
-async def fetch_bbs_post_detail(post_content: PostContent) -> PostContentDetail:
+async def fetch_bbs_post_detail(client: httpx.AsyncClient, post_content: PostContent,
+                                parse_pool: Optional[ParsePool] = None) -> PostContentDetail:
     """
     Fetch the post detail page
+    :param client: shared http client
     :param post_content:
+    :param parse_pool: optional parse stage, the page is parsed in the event loop without it
     :return:
     """
-    print(f"Start getting posts {post_content.detail_link} detail page ....")
+    if VERBOSE:
+        print(f"Start getting posts {post_content.detail_link} detail page ....")
     post_content_detail = PostContentDetail()
 
     # reuse the post_content object
     post_content_detail.title = post_content.title
     post_content_detail.author = post_content.author
     post_content_detail.detail_link = BASE_HOST + post_content.detail_link
+    post_content_detail.push_count = post_content.push_count
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url=BASE_HOST + post_content.detail_link, headers=HEADERS)
-        if response.status_code != 200:
-            print(f"Post: {post_content.title} Get Exception, Reason: {response.text}")
-            return post_content_detail
-
-        soup = BeautifulSoup(response.text, "lxml")
-        post_content_detail.publish_datetime = soup.select("#main-content > div:nth-child(4) > span.article-meta-value")[
-            0].text
-        post_content_detail.content = parse_post_content(response.text)
-
-        # extract all comments
-        post_content_detail.post_comments = []
-        all_comment_elements = soup.select("#main-content > div.push")
-        for comment_element in all_comment_elements:
-            post_comment = PostComment()
-            if len(comment_element.select("span")) < 3:
-                continue
-
-            post_comment.comment_user_name = comment_element.select("span")[1].text.strip()
-            post_comment.comment_content = comment_element.select("span")[2].text.strip().replace(": ", "")
-            post_comment.comment_time = comment_element.select("span")[3].text.strip()
-            post_content_detail.post_comments.append(post_comment)
+    response = await send_get(client, BASE_HOST + post_content.detail_link, "article")
+    if response.status_code != 200:
+        print(f"Post: {post_content.title} Get Exception, Reason: {response.text}")
+        return post_content_detail
 
+    # extract publish date, content and comments with the configured parser backend, straight from the raw bytes
+    encoding = page_encoding(response.headers.get("Content-Type"), response.content)
+    if LAZY_DETAIL:
+        # nothing is parsed until a consumer reads publish_date, content or post_comments, so no comments_total
+        return LazyPostContentDetail(response.content, encoding, PARSER_BACKEND, title=post_content_detail.title,
+                                     author=post_content_detail.author, detail_link=post_content_detail.detail_link,
+                                     push_count=post_content_detail.push_count)
+    if parse_pool is not None:
+        # the pool observes parse_seconds without the wait for a free worker
+        parsed_detail: PostContentDetail = await parse_pool.parse_post_detail(response.content, encoding)
+    else:
+        with metrics.timer("parse_seconds", page_type="article"):
+            parsed_detail: PostContentDetail = get_parser_backend(PARSER_BACKEND).parse_post_detail_bytes(
+                response.content, encoding)
+    post_content_detail.publish_date = parsed_detail.publish_date
+    post_content_detail.content = parsed_detail.content
+    post_content_detail.post_comments = parsed_detail.post_comments
+
+    metrics.inc("comments_total", len(post_content_detail.post_comments))
+    if VERBOSE:
         print(post_content_detail)
     return post_content_detail
 
 
-async def run_crawler(save_posts: List[PostContentDetail]):
+async def fetch_bbs_post_detail_queue(client: httpx.AsyncClient, post_queue: asyncio.Queue,
+                                      save_posts: List[PostContentDetail], concurrency: int = DETAIL_CONCURRENCY,
+                                      parse_pool: Optional[ParsePool] = None):
     """
-    Crawler main function
-    :param save_posts: data container
+    Fetch the detail pages of the (index, post) items of post_queue through a pool of `concurrency` workers, every
+    detail is appended to save_posts as soon as all the posts with a smaller index are done, so save_posts keeps
+    the index order. Every worker stops at the first None of the queue, put one None per worker when done.
+    :param client: shared http client
+    :param post_queue: queue of (index, post), indexes start at 0 without gaps
+    :param save_posts: data container, a list or a sink with append()
+    :param concurrency: number of workers
+    :param parse_pool: optional parse stage, a worker waits for its page to be parsed before fetching the next one
+    :return:
+    """
+    # finished details waiting for an earlier post, keyed by index
+    finished: Dict[int, PostContentDetail] = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while True:
+            item = await post_queue.get()
+            metrics.gauge_max("post_queue_depth_max", post_queue.qsize())
+            if item is None:
+                return
+            index, post_content = item
+            finished[index] = await fetch_bbs_post_detail(client, post_content, parse_pool)
+            metrics.gauge_max("finished_waiting_max", len(finished))
+            # release the finished prefix in the original order
+            while next_index in finished:
+                save_posts.append(finished.pop(next_index))
+                next_index += 1
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, concurrency))]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        # one worker failed, e.g. the data container raised, stop the others
+        for worker_task in workers:
+            worker_task.cancel()
+        raise
+
+
+async def fetch_bbs_post_detail_list(client: httpx.AsyncClient, post_list: List[PostContent],
+                                     save_posts: List[PostContentDetail], concurrency: int = DETAIL_CONCURRENCY,
+                                     parse_pool: Optional[ParsePool] = None):
+    """
+    Fetch the detail pages of post_list through a pool of `concurrency` workers, save_posts keeps the order of post_list
+    :param client: shared http client
+    :param post_list: posts to fetch, posts without detail link are skipped
+    :param save_posts: data container, a list or a sink with append()
+    :param concurrency: number of workers
+    :param parse_pool: optional parse stage
     :return:
     """
-    # step1: get the latest page number
-    latest_number: int = await get_latest_page_number()
+    post_list = [post_content for post_content in post_list if post_content.detail_link]
+    concurrency = max(1, min(concurrency, len(post_list)))
+    post_queue: asyncio.Queue = asyncio.Queue()
+    for index, post_content in enumerate(post_list):
+        post_queue.put_nowait((index, post_content))
+    for _ in range(concurrency):
+        post_queue.put_nowait(None)
+    await fetch_bbs_post_detail_queue(client, post_queue, save_posts, concurrency, parse_pool)
 
-    # step2: get the post list from the latest page number to the (latest page number - FIRST_N_PAGE)
-    post_list: List[PostContent] = await fetch_bbs_posts_list(latest_number)
 
-    # step3: get the post detail
-    for post_content in post_list:
-        if not post_content.detail_link:
-            continue
-        post_content_detail = await fetch_bbs_post_detail(post_content)
-        save_posts.append(post_content_detail)
+async def fetch_bbs_posts_pipeline(client: httpx.AsyncClient, latest_number: int,
+                                   save_posts: List[PostContentDetail], concurrency: int = DETAIL_CONCURRENCY,
+                                   seen_index: Optional[SeenArticleIndex] = None,
+                                   parse_pool: Optional[ParsePool] = None,
+                                   checkpoint: Optional[CrawlCheckpoint] = None, board: str = BOARD):
+    """
+    Producer / consumer crawl: the index pages are fetched LIST_CONCURRENCY at a time and their posts are queued
+    in page order while the detail workers already consume the queue, so the detail pages of page N are fetched
+    while page N+1 is downloading. The bounded queue keeps the index pages from running far ahead of the details.
+    :param client: shared http client
+    :param latest_number: latest page number
+    :param save_posts: data container, a list or a sink with append()
+    :param concurrency: number of detail workers
+    :param seen_index: optional index of the incremental mode, unchanged posts are not queued
+    :param parse_pool: optional parse stage shared by the index and detail pages
+    :param checkpoint: optional progress of the run, completed pages and articles are skipped
+    :param board: board name
+    :return:
+    """
+    post_queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    index = 0
+
+    async def queue_page(page_number: int, page_posts: List[PostContent]):
+        nonlocal index
+        # a failed index page comes back empty
+        fetched = bool(page_posts)
+        page_posts = [post_content for post_content in page_posts if post_content.detail_link]
+        if seen_index is not None:
+            page_posts = seen_index.filter_changed(page_posts, verbose=VERBOSE)
+        if checkpoint is not None:
+            page_posts = checkpoint.expect_page(page_number, page_posts, fetched)
+        for post_content in page_posts:
+            # blocks while the workers are behind
+            await post_queue.put((index, post_content))
+            metrics.gauge_max("post_queue_depth_max", post_queue.qsize())
+            index += 1
+
+    async def produce():
+        page_numbers = get_page_numbers(latest_number)
+        if checkpoint is not None:
+            page_numbers = checkpoint.pending_pages(page_numbers)
+        pending_pages = deque()
+        cancelled = False
+        try:
+            for page_number in page_numbers:
+                pending_pages.append((page_number, asyncio.ensure_future(
+                    fetch_bbs_posts_page(client, page_number, parse_pool=parse_pool, board=board))))
+                # hand the oldest page over first so the queue stays in page order
+                if len(pending_pages) >= LIST_CONCURRENCY:
+                    page_number, page_future = pending_pages.popleft()
+                    await queue_page(page_number, await page_future)
+            while pending_pages:
+                page_number, page_future = pending_pages.popleft()
+                await queue_page(page_number, await page_future)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            for _, page_future in pending_pages:
+                page_future.cancel()
+            # stop the workers even if an index page failed, nobody reads the queue anymore after a cancel
+            if not cancelled:
+                for _ in range(concurrency):
+                    await post_queue.put(None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        await fetch_bbs_post_detail_queue(client, post_queue, save_posts, concurrency, parse_pool)
+    except BaseException:
+        # the workers failed, stop fetching index pages
+        producer.cancel()
+        raise
+    await producer
+
+
+async def crawl_board(client: httpx.AsyncClient, board: str, save_posts: List[PostContentDetail],
+                      concurrency: int = DETAIL_CONCURRENCY, seen_index: Optional[SeenArticleIndex] = None,
+                      parse_pool: Optional[ParsePool] = None, checkpoint: Optional[CrawlCheckpoint] = None):
+    """
+    Crawl the first N pages of one board with an open client
+    :param client: shared http client
+    :param board: board name
+    :param save_posts: data container, a list or a sink with append() such as storage.JsonlPostSink
+    :param concurrency: number of detail pages fetched at the same time, 1 means sequential
+    :param seen_index: optional index of the incremental mode
+    :param parse_pool: optional parse stage
+    :param checkpoint: optional progress of the run, completed pages and articles are skipped
+    :return:
+    """
+    # step1: get the latest page number, a resumed run keeps the page window of the first run
+    if checkpoint is not None and checkpoint.latest_number is not None:
+        latest_number: int = checkpoint.latest_number
+        print(f"Resume {board} from page {latest_number + 1}, {len(checkpoint.done_pages)} pages and "
+              f"{len(checkpoint.done_articles)} articles already done")
+    else:
+        latest_number: int = await get_latest_page_number(client, board)
+    if checkpoint is not None:
+        checkpoint.latest_number = latest_number
+        save_posts = checkpoint.track(save_posts)
+
+    if seen_index is not None:
+        save_posts = seen_index.track(save_posts)
+
+    if concurrency > 1:
+        # step2 + step3: fetch the detail pages while the next index pages are downloading
+        await fetch_bbs_posts_pipeline(client, latest_number, save_posts, concurrency, seen_index, parse_pool,
+                                       checkpoint, board)
+        return
+
+    page_numbers = get_page_numbers(latest_number)
+    if checkpoint is not None:
+        page_numbers = checkpoint.pending_pages(page_numbers)
+    for page_number in page_numbers:
+        # step2: get the post list of the page
+        page_posts: List[PostContent] = await fetch_bbs_posts_page(client, page_number, parse_pool=parse_pool,
+                                                                   board=board)
+        # a failed index page comes back empty
+        fetched = bool(page_posts)
+        page_posts = [post_content for post_content in page_posts if post_content.detail_link]
+        if seen_index is not None:
+            # skip the posts whose push count did not change since they were fetched
+            page_posts = seen_index.filter_changed(page_posts, verbose=VERBOSE)
+        if checkpoint is not None:
+            page_posts = checkpoint.expect_page(page_number, page_posts, fetched)
+
+        # step3: get the post detail
+        for post_content in page_posts:
+            post_content_detail = await fetch_bbs_post_detail(client, post_content, parse_pool)
+            save_posts.append(post_content_detail)
+
+
+def open_checkpoint(board: str, resume: bool) -> Optional[CrawlCheckpoint]:
+    """
+    Checkpoint of a board run, loaded from CHECKPOINT_PATH when resuming
+    :param board: board name
+    :param resume: continue the previous run
+    :return: None when CHECKPOINT_PATH is None
+    """
+    if not CHECKPOINT_PATH:
+        return None
+    checkpoint_path = CHECKPOINT_PATH.format(board=board)
+    return CrawlCheckpoint.load(checkpoint_path) if resume else CrawlCheckpoint(checkpoint_path)
+
+
+async def run_crawler(save_posts: List[PostContentDetail], concurrency: int = DETAIL_CONCURRENCY,
+                      resume: bool = False, board: str = BOARD):
+    """
+    Crawler main function
+    :param save_posts: data container, a list or a sink with append() such as storage.JsonlPostSink
+    :param concurrency: number of detail pages fetched at the same time, 1 means sequential
+    :param resume: continue the run recorded in CHECKPOINT_PATH instead of starting over
+    :param board: board name
+    :return:
+    """
+    metrics.reset()
+    seen_index = SeenArticleIndex(SEEN_INDEX_PATH) if INCREMENTAL else None
+    # a recording run downloads every page, the revalidated ones would only record a 304
+    cache = ResponseCache(HTTP_CACHE_DIR) if HTTP_CACHE_DIR and not RECORD_DIR else None
+    max_connections = max(concurrency, 1) + LIST_CONCURRENCY
+    # backs off below max_connections while the host answers 429/5xx or times out
+    politeness = Politeness(rate=HOST_RATE_LIMIT, initial_concurrency=max_connections, max_concurrency=max_connections)
+    # download and parse in different stages, the parse pool uses the other cores
+    parse_pool = ParsePool(PARSER_BACKEND, PARSE_WORKERS, PARSE_EXECUTOR) if PARSE_WORKERS > 0 else None
+    checkpoint = open_checkpoint(board, resume)
+    recorder = Cassette(RECORD_DIR) if RECORD_DIR else None
+    try:
+        # one pooled keep-alive client for the whole run
+        async with create_async_client(max_connections=max_connections, cache=cache, politeness=politeness,
+                                       recorder=recorder) as client:
+            await crawl_board(client, board, save_posts, concurrency, seen_index, parse_pool, checkpoint)
+    finally:
+        if checkpoint is not None:
+            checkpoint.save()
+        if seen_index is not None:
+            seen_index.close()
+        if parse_pool is not None:
+            parse_pool.close()
 
     print("Task completed, total posts: ", len(save_posts))
+    if cache is not None:
+        print("HTTP cache: ", cache.stats())
+    print("Politeness: ", politeness.stats())
+    metrics.inc("posts_total", len(save_posts))
+    if METRICS_PATH:
+        metrics.write_snapshot(METRICS_PATH)
+        print("Metrics snapshot: ", METRICS_PATH)
 
 
 if __name__ == '__main__':
-    all_posts_content_detail: List[PostContentDetail] = []
-    asyncio.run(run_crawler(all_posts_content_detail))
-
-    # export the data to json
-    import json
-    with open("ptt_stock_posts.json", "w", encoding="utf-8") as f:
-        f.write(json.dumps([dataclass_to_dict(post) for post in all_posts_content_detail], ensure_ascii=False, indent=4))
-    print("Export data to ptt_stock_posts.json successfully!")
+    arg_parser = argparse.ArgumentParser(description="Crawl the posts and comments of the first N pages of a PTT board")
+    arg_parser.add_argument("--board", default=BOARD, help=f"board name, default {BOARD}")
+    arg_parser.add_argument("--resume", action="store_true",
+                            help=f"continue the interrupted run recorded in {CHECKPOINT_PATH}")
+    arg_parser.add_argument("--record", default=RECORD_DIR, metavar="DIR",
+                            help="record every response to a cassette directory, replayed by replay.py")
+    args = arg_parser.parse_args()
+    RECORD_DIR = args.record
+
+    if PARQUET_EXPORT:
+        # every run adds its part files to the dataset directory
+        with ParquetPostSink(f"ptt_{args.board.lower()}_posts_parquet") as posts_sink:
+            asyncio.run(run_crawler(posts_sink, resume=args.resume, board=args.board))
+        print(f"Export data to ptt_{args.board.lower()}_posts_parquet successfully!")
+    elif STREAM_EXPORT:
+        # a resumed run adds the missing posts to the file of the interrupted one, an incremental run the new and
+        # changed posts to the file of the earlier runs, whose posts it does not fetch again
+        with JsonlPostSink(f"ptt_{args.board.lower()}_posts.jsonl", append=args.resume or INCREMENTAL) as posts_sink:
+            asyncio.run(run_crawler(posts_sink, resume=args.resume, board=args.board))
+        print(f"Export data to ptt_{args.board.lower()}_posts.jsonl successfully!")
+    else:
+        all_posts_content_detail: List[PostContentDetail] = []
+        asyncio.run(run_crawler(all_posts_content_detail, resume=args.resume, board=args.board))
+
+        # export the data to json
+        import json
+        with open(f"ptt_{args.board.lower()}_posts.json", "w", encoding="utf-8") as f:
+            f.write(json.dumps([dataclass_to_dict(post) for post in all_posts_content_detail], ensure_ascii=False,
+                               indent=4))
+        print(f"Export data to ptt_{args.board.lower()}_posts.json successfully!")
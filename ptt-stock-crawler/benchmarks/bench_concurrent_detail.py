@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/02 11:00
+# @Desc    : Benchmark sequential vs worker pool detail fetching of the async crawler against the mock PTT server,
+#            run from ptt-stock-crawler: python -m benchmarks.bench_concurrent_detail
+
+import asyncio
+import contextlib
+import os
+import time
+from typing import List
+
+import asyn_crawler
+from common import PostContentDetail
+from mock_server import start_mock_server
+
+PAGES = 50  # index pages to backfill, 20 posts per page
+LATENCY = 0.05  # seconds the mock server sleeps per request
+CONCURRENCY_LEVELS = [1, 10, 32]
+
+
+def run_once(concurrency: int) -> float:
+    """
+    Run the async crawler once and return the elapsed seconds
+    :param concurrency: detail page concurrency
+    :return:
+    """
+    save_posts: List[PostContentDetail] = []
+    start = time.perf_counter()
+    # the crawler prints every post, keep the benchmark output readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(asyn_crawler.run_crawler(save_posts, concurrency=concurrency))
+    elapsed = time.perf_counter() - start
+    assert all(post.content for post in save_posts), "some detail pages were not fetched"
+    return elapsed
+
+
+if __name__ == '__main__':
+    server, base_host = start_mock_server(latency=LATENCY)
+    asyn_crawler.BASE_HOST = base_host
+    # local mock server, no need to be polite
+    asyn_crawler.HOST_RATE_LIMIT = None
+    asyn_crawler.FIRST_N_PAGE = PAGES
+
+    print(f"Backfill {PAGES} pages from {base_host}, {LATENCY * 1000:.0f}ms latency per request")
+    baseline = None
+    for level in CONCURRENCY_LEVELS:
+        seconds = run_once(level)
+        baseline = baseline or seconds
+        print(f"concurrency={level:<4d} {seconds:8.2f}s  speedup x{baseline / seconds:.1f}")
+    server.shutdown()
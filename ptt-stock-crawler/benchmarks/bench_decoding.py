@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/24 10:00
+# @Desc    : CPU per megabyte of html of the decode + parse step: sniffed charset, decoded str and the raw bytes fast
+#            path of the lxml backend, on utf-8 and Big5 (cp950) pages,
+#            run from ptt-stock-crawler: python -m benchmarks.bench_decoding
+
+import os
+import time
+from typing import Callable, List, Tuple
+
+import charset_normalizer
+
+from mock_server import render_article_page, render_index_page
+from parser_backends import get_parser_backend
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+ROUNDS = 20  # parse every page ROUNDS times
+BACKEND = "lxml"
+
+# (page type, raw body)
+Page = Tuple[str, bytes]
+
+
+def sniffed_str(page_type: str, content: bytes, encoding: str):
+    # response.text without a charset header: the body is sniffed, then decoded, then parsed
+    html_content = str(charset_normalizer.from_bytes(content).best())
+    backend = get_parser_backend(BACKEND)
+    return backend.parse_post_list(html_content) if page_type == "index" else backend.parse_post_detail(html_content)
+
+
+def decoded_str(page_type: str, content: bytes, encoding: str):
+    # the previous fetch path: response.text with the header charset, then the str is parsed
+    html_content = content.decode(encoding, errors="replace")
+    backend = get_parser_backend(BACKEND)
+    return backend.parse_post_list(html_content) if page_type == "index" else backend.parse_post_detail(html_content)
+
+
+def raw_bytes(page_type: str, content: bytes, encoding: str):
+    backend = get_parser_backend(BACKEND)
+    if page_type == "index":
+        return backend.parse_post_list_bytes(content, encoding)
+    return backend.parse_post_detail_bytes(content, encoding)
+
+
+def bench(parse_func: Callable, pages: List[Page], encoding: str) -> float:
+    """
+    Return the CPU milliseconds per MiB of html of parse_func
+    :param parse_func: decode + parse step
+    :param pages: raw pages
+    :param encoding: encoding of the pages
+    :return:
+    """
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        for page_type, content in pages:
+            parse_func(page_type, content, encoding)
+    elapsed = time.process_time() - start
+    return elapsed * 1000 / (ROUNDS * sum(len(content) for _, content in pages) / 2 ** 20)
+
+
+if __name__ == '__main__':
+    with open(os.path.join(FIXTURES_DIR, "ptt_stock_index.html"), encoding="utf-8") as f:
+        html_pages = [("index", f.read())]
+    with open(os.path.join(FIXTURES_DIR, "ptt_stock_article.html"), encoding="utf-8") as f:
+        html_pages.append(("article", f.read()))
+    html_pages += [("index", render_index_page("Stock", number)) for number in range(7080, 7084)]
+    # short articles and a long thread
+    html_pages += [("article", render_article_page("Stock", f"M.{number}.A.001", comments_count=comments))
+                   for number, comments in enumerate([10, 30, 100, 1000])]
+
+    print(f"{BACKEND} backend, {len(html_pages)} pages x {ROUNDS} rounds, CPU ms per MiB of html")
+    for encoding in ("utf-8", "cp950"):
+        # characters missing from Big5 become character references, as a Big5 site would send them
+        pages = [(page_type, html.encode(encoding, errors="xmlcharrefreplace")) for page_type, html in html_pages]
+        for page_type, content in pages:
+            assert raw_bytes(page_type, content, encoding) == decoded_str(page_type, content, encoding)
+        sniffed = bench(sniffed_str, pages, encoding)
+        decoded = bench(decoded_str, pages, encoding)
+        fast = bench(raw_bytes, pages, encoding)
+        megabytes = sum(len(content) for _, content in pages) / 2 ** 20
+        print(f"{encoding} ({megabytes:.2f} MiB)")
+        print(f"  sniffed charset + str:  {sniffed:8.1f} ms/MiB")
+        print(f"  declared charset + str: {decoded:8.1f} ms/MiB")
+        print(f"  raw bytes to lxml:      {fast:8.1f} ms/MiB  saves {decoded - fast:.1f} ms/MiB "
+              f"({1 - fast / decoded:.0%}) vs str, {sniffed - fast:.1f} ms/MiB ({1 - fast / sniffed:.0%}) vs sniffing")
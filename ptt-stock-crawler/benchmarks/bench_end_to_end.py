@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/23 11:00
+# @Desc    : End to end benchmark of the sync and async crawlers replaying a recorded cassette: pages/s, p50/p99
+#            request latency and peak RSS, every crawler in its own process,
+#            run from ptt-stock-crawler: python -m benchmarks.bench_end_to_end [--cassette DIR] [--error-rate 0.02]
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import asyn_crawler
+from common import PostContentDetail
+from crawler_kit.replay import start_replay_server
+from mock_server import start_mock_server
+import syn_crawler
+
+# record a real one with: python asyn_crawler.py --record benchmarks/cassettes/ptt_stock
+CASSETTE_DIR = os.path.join("benchmarks", "cassettes", "ptt_stock")
+PAGES = 10  # index pages of the run, as many as the recording
+LATENCY = 0.05  # seconds the replay server sleeps per request
+JITTER = 0.05  # extra random seconds per request
+CRAWLERS = ["sync", "async"]
+
+
+def configure(module, base_host: str, pages: int):
+    """
+    Point a crawler module to the replay server and turn off everything touching the disk or the console
+    :param module: syn_crawler or asyn_crawler
+    :param base_host:
+    :param pages: index pages of the run
+    :return:
+    """
+    module.BASE_HOST = base_host
+    module.FIRST_N_PAGE = pages
+    module.HTTP_CACHE_DIR = None
+    module.CHECKPOINT_PATH = None
+    module.METRICS_PATH = None
+    module.INCREMENTAL = False
+    module.VERBOSE = False
+    if module is asyn_crawler:
+        # local server, no need to be polite
+        module.HOST_RATE_LIMIT = None
+
+
+def synthesize_cassette(dir_path: str, pages: int):
+    """
+    Record the synthetic pages of mock_server.py, used when no real recording is available
+    :param dir_path: cassette directory
+    :param pages: index pages to record
+    :return:
+    """
+    server, base_host = start_mock_server(latency=0)
+    configure(asyn_crawler, base_host, pages)
+    asyn_crawler.RECORD_DIR = dir_path
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(asyn_crawler.run_crawler([]))
+    asyn_crawler.RECORD_DIR = None
+    server.shutdown()
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    Nearest rank percentile
+    :param sorted_values: ascending values
+    :param q: 0 to 1
+    :return:
+    """
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))]
+
+
+def run_child(crawler: str, base_host: str, pages: int) -> Dict:
+    """
+    Run one crawler end to end in this process
+    :param crawler: sync or async
+    :param base_host: replay server
+    :param pages: index pages of the run
+    :return: result line of the benchmark
+    """
+    module = syn_crawler if crawler == "sync" else asyn_crawler
+    configure(module, base_host, pages)
+    # client side latency of every request, retries and politeness waits included
+    latencies: List[float] = []
+    record_response = module.record_response
+
+    def record_latency(endpoint: str, status_code: int, body_size: int, seconds: float, registry=None):
+        latencies.append(seconds)
+        record_response(endpoint, status_code, body_size, seconds, registry)
+
+    module.record_response = record_latency
+    save_posts: List[PostContentDetail] = []
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if crawler == "sync":
+            syn_crawler.run_crawler(save_posts)
+        else:
+            asyncio.run(asyn_crawler.run_crawler(save_posts))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "crawler": crawler,
+        "pages": len(latencies),
+        "posts": len(save_posts),
+        "empty_posts": sum(1 for post in save_posts if not post.content),
+        "seconds": elapsed,
+        "pages_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        # KiB on Linux
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="End to end crawler benchmark against a replayed cassette")
+    arg_parser.add_argument("--cassette", default=CASSETTE_DIR, help="cassette directory, synthesized if missing")
+    arg_parser.add_argument("--pages", type=int, default=PAGES, help="index pages of the run")
+    arg_parser.add_argument("--latency", type=float, default=LATENCY, help="seconds per request")
+    arg_parser.add_argument("--jitter", type=float, default=JITTER, help="extra random seconds per request")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="share of injected 503 answers")
+    arg_parser.add_argument("--reset-rate", type=float, default=0.0, help="share of injected connection resets")
+    arg_parser.add_argument("--seed", type=int, default=0, help="seed of the injected latency and errors")
+    arg_parser.add_argument("--crawlers", nargs="+", default=CRAWLERS, choices=CRAWLERS)
+    arg_parser.add_argument("--child", choices=CRAWLERS, help=argparse.SUPPRESS)
+    arg_parser.add_argument("--base-host", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.child:
+        # one fresh process per crawler, so the peak RSS is its own
+        print(json.dumps(run_child(args.child, args.base_host, args.pages)))
+        sys.exit(0)
+
+    if not os.path.exists(os.path.join(args.cassette, "index.jsonl")):
+        print(f"No recording in {args.cassette}, synthesizing {args.pages} pages with mock_server.py")
+        synthesize_cassette(args.cassette, args.pages)
+    server, base_host = start_replay_server(args.cassette, latency=args.latency, jitter=args.jitter,
+                                            error_rate=args.error_rate, reset_rate=args.reset_rate, seed=args.seed)
+    print(f"Replay {len(server.cassette)} responses of {args.cassette}, {args.latency * 1000:.0f}ms "
+          f"+ up to {args.jitter * 1000:.0f}ms latency, {args.error_rate:.1%} errors, {args.reset_rate:.1%} resets")
+    print(f"{'crawler':<8s} {'pages':>6s} {'posts':>6s} {'seconds':>8s} {'pages/s':>8s} {'p50 ms':>8s} "
+          f"{'p99 ms':>8s} {'peak RSS MiB':>13s}")
+    for crawler in args.crawlers:
+        child = subprocess.run([sys.executable, "-m", "benchmarks.bench_end_to_end", "--child", crawler,
+                                "--base-host", base_host, "--pages", str(args.pages)],
+                               capture_output=True, text=True, check=True)
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"{crawler:<8s} {result['pages']:6d} {result['posts']:6d} {result['seconds']:8.2f} "
+              f"{result['pages_per_second']:8.1f} {result['p50_ms']:8.1f} {result['p99_ms']:8.1f} "
+              f"{result['peak_rss_mib']:13.1f}")
+        if result["empty_posts"]:
+            print(f"  {result['empty_posts']} posts without content, failed or not recorded")
+    print("Replay server: ", server.stats())
+    server.shutdown()
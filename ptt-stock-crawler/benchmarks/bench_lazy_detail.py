@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/24 15:00
+# @Desc    : Triage pipeline over fetched article pages, eager PostContentDetail vs LazyPostContentDetail: CPU and
+#            memory held by the kept posts, and the peak RSS of counting the pushes of a hot thread with the comment
+#            list vs the streaming iterator, run from ptt-stock-crawler: python -m benchmarks.bench_lazy_detail
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from common import LazyPostContentDetail, PostContentDetail
+from mock_server import render_article_page
+from parser_backends import get_parser_backend
+
+ARTICLES_COUNT = 300  # fetched article pages of the triage run
+COMMENTS_COUNTS = [5, 20, 50, 200]  # pushes of the articles, in turn
+HOT_THREAD_COMMENTS = 20000  # pushes of the hot thread
+BACKEND = "lxml"
+COUNTERS = ["comment list", "iter_comments"]
+
+
+def eager_detail(content: bytes) -> PostContentDetail:
+    return get_parser_backend(BACKEND).parse_post_detail_bytes(content, "utf-8")
+
+
+def lazy_detail(content: bytes) -> PostContentDetail:
+    return LazyPostContentDetail(content, "utf-8", BACKEND)
+
+
+def lazy_uncompressed_detail(content: bytes) -> PostContentDetail:
+    return LazyPostContentDetail(content, "utf-8", BACKEND, compress=False)
+
+
+def measure(func: Callable) -> Tuple[float, int, int, object]:
+    """
+    CPU milliseconds, traced bytes still held and peak traced bytes of func()
+    :param func:
+    :return: (ms, held bytes, peak bytes, result)
+    """
+    tracemalloc.start()
+    start = time.process_time()
+    result = func()
+    elapsed = time.process_time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, current, peak, result
+
+
+def triage(make_detail: Callable, pages: List[bytes]) -> List[PostContentDetail]:
+    # a fresh copy of every page like a response body, keep every other post, the filter only looks at the list
+    # page fields
+    posts = [make_detail(bytes(bytearray(content))) for content in pages]
+    return [post for index, post in enumerate(posts) if index % 2 == 0]
+
+
+def count_pushes(counter: str) -> Dict:
+    """
+    Count the 推 of the hot thread in this process
+    :param counter: comment list or iter_comments
+    :return: result line of the benchmark
+    """
+    hot_thread = render_article_page("Stock", "M.0.A.HOT", comments_count=HOT_THREAD_COMMENTS).encode("utf-8")
+    post = lazy_detail(hot_thread)
+    # KiB on Linux
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.process_time()
+    comments = post.post_comments if counter == "comment list" else post.iter_comments()
+    pushes = sum(1 for comment in comments if comment.push_tag == "推")
+    return {
+        "html_mib": len(hot_thread) / 2 ** 20,
+        "pushes": pushes,
+        "cpu_ms": (time.process_time() - start) * 1000,
+        # the tree of libxml2 is not seen by tracemalloc, the peak RSS is
+        "peak_rss_growth_mib": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+    }
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Eager vs lazy post details")
+    arg_parser.add_argument("--child", choices=COUNTERS, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.child:
+        # one fresh process per counter, so the peak RSS is its own
+        print(json.dumps(count_pushes(args.child)))
+        sys.exit(0)
+
+    pages = [render_article_page("Stock", f"M.{number}.A.001",
+                                 comments_count=COMMENTS_COUNTS[number % len(COMMENTS_COUNTS)]).encode("utf-8")
+             for number in range(ARTICLES_COUNT)]
+    megabytes = sum(len(content) for content in pages) / 2 ** 20
+    print(f"Triage of {ARTICLES_COUNT} articles ({megabytes:.1f} MiB of html), {BACKEND} backend")
+    for label, make_detail in (("eager", eager_detail), ("lazy", lazy_detail),
+                               ("lazy uncompressed", lazy_uncompressed_detail)):
+        cpu_ms, held, _, kept = measure(lambda: triage(make_detail, pages))
+        print(f"  {label:<18s} {cpu_ms:8.1f} ms CPU  {held / 2 ** 20:7.2f} MiB held by {len(kept)} kept posts")
+        del kept
+
+    print(f"Pushes of a thread of {HOT_THREAD_COMMENTS} comments")
+    for counter in COUNTERS:
+        child = subprocess.run([sys.executable, "-m", "benchmarks.bench_lazy_detail", "--child", counter],
+                               capture_output=True, text=True, check=True)
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"  {counter:<18s} {result['cpu_ms']:8.1f} ms CPU  {result['peak_rss_growth_mib']:7.2f} MiB peak RSS "
+              f"growth  {result['pushes']} pushes of {result['html_mib']:.1f} MiB of html")
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/04 10:40
+# @Desc    : Per-page CPU cost of index page extraction, prettify-and-reparse vs single parse,
+#            run from ptt-stock-crawler: python -m benchmarks.bench_list_parse
+
+import os
+import time
+from typing import Callable, List
+
+from bs4 import BeautifulSoup
+
+from asyn_crawler import parse_post_use_bs
+from common import PostContent
+from extractor import parse_post_list
+from mock_server import render_index_page
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+ROUNDS = 200  # parse every page ROUNDS times
+
+
+def parse_post_list_prettify(html_content: str) -> List[PostContent]:
+    """
+    The previous extraction: parse the page, then serialize and reparse every row
+    :param html_content: html source code of the whole index page
+    :return:
+    """
+    soup = BeautifulSoup(html_content, "lxml")
+    return [parse_post_use_bs(post_element.prettify()) for post_element in soup.select("div.r-ent")]
+
+
+def bench(parse_func: Callable[[str], List[PostContent]], pages: List[str]) -> float:
+    """
+    Return the CPU milliseconds per page of parse_func
+    :param parse_func: index page extractor
+    :param pages: html source code of index pages
+    :return:
+    """
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        for page in pages:
+            parse_func(page)
+    return (time.process_time() - start) * 1000 / (ROUNDS * len(pages))
+
+
+if __name__ == '__main__':
+    with open(os.path.join(FIXTURES_DIR, "ptt_stock_index.html"), encoding="utf-8") as f:
+        index_pages = [f.read()] + [render_index_page("Stock", number) for number in range(7080, 7084)]
+    for index_page in index_pages:
+        assert parse_post_list(index_page) == parse_post_list_prettify(index_page)
+
+    before = bench(parse_post_list_prettify, index_pages)
+    after = bench(parse_post_list, index_pages)
+    print(f"{len(index_pages)} index pages x {ROUNDS} rounds")
+    print(f"prettify and reparse: {before:7.3f} ms/page")
+    print(f"single lxml parse:    {after:7.3f} ms/page  speedup x{before / after:.1f}")
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/10 10:00
+# @Desc    : Per-object memory of the post models, slotted dataclasses vs the same dataclasses with a __dict__,
+#            run from ptt-stock-crawler: python -m benchmarks.bench_model_memory
+
+import tracemalloc
+from dataclasses import MISSING, field, fields, make_dataclass
+
+from common import PostComment, PostContent, PostContentDetail
+
+OBJECTS_COUNT = 100_000
+
+
+def without_slots(cls):
+    """
+    Rebuild a dataclass with the same fields but a regular per-instance __dict__
+    :param cls: slotted dataclass
+    :return:
+    """
+    dataclass_fields = []
+    for f in fields(cls):
+        if f.default_factory is not MISSING:
+            dataclass_fields.append((f.name, f.type, field(default_factory=f.default_factory)))
+        else:
+            dataclass_fields.append((f.name, f.type, field(default=f.default)))
+    return make_dataclass(cls.__name__ + "WithDict", dataclass_fields)
+
+
+def bytes_per_object(cls) -> float:
+    """
+    Create OBJECTS_COUNT objects sharing the same field values and return the traced bytes per object
+    :param cls:
+    :return:
+    """
+    tracemalloc.start()
+    objects = [cls() for _ in range(OBJECTS_COUNT)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return current / OBJECTS_COUNT
+
+
+if __name__ == '__main__':
+    for model in (PostContent, PostComment, PostContentDetail):
+        before = bytes_per_object(without_slots(model))
+        after = bytes_per_object(model)
+        print(f"{model.__name__:<18s} __dict__: {before:6.1f} B  slots: {after:6.1f} B  saved {1 - after / before:.0%}")
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/15 15:00
+# @Desc    : Benchmark parsing long threads in the event loop vs in the parse pool: total time and the worst delay
+#            seen by the other coroutines, run from ptt-stock-crawler: python -m benchmarks.bench_parse_pool
+
+import asyncio
+import os
+import time
+from typing import Tuple
+
+from mock_server import render_article_page
+from parse_pool import ParsePool
+
+BACKEND = "lxml"
+PAGES = 100  # article pages parsed per run
+COMMENTS_PER_PAGE = 2000  # a long thread
+POOL_SIZES = sorted({0, 1, 2, os.cpu_count() or 1})
+
+
+async def run_once(parse_pool: ParsePool, content: bytes) -> Tuple[float, float]:
+    """
+    Parse PAGES pages with 10 coroutines while a ticker measures how late the event loop wakes it up
+    :param parse_pool:
+    :param content: article page
+    :return: elapsed seconds, max event loop delay in seconds
+    """
+    max_delay = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal max_delay
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            max_delay = max(max_delay, time.perf_counter() - start - 0.001)
+
+    async def parser(count: int):
+        for _ in range(count):
+            await parse_pool.parse_post_detail(content)
+
+    ticker_task = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*[parser(PAGES // 10) for _ in range(10)])
+    elapsed = time.perf_counter() - start
+    done = True
+    await ticker_task
+    return elapsed, max_delay
+
+
+if __name__ == '__main__':
+    content = render_article_page("Stock", "M.1711544298.A.9F8", COMMENTS_PER_PAGE).encode("utf-8")
+    print(f"{PAGES} pages of {len(content) / 1024:.0f} KiB, {COMMENTS_PER_PAGE} comments, {os.cpu_count()} cpus")
+    for workers in POOL_SIZES:
+        for executor in (["process"] if workers == 0 else ["process", "thread"]):
+            with ParsePool(BACKEND, workers=workers, executor=executor) as pool:
+                elapsed, max_delay = asyncio.run(run_once(pool, content))
+            label = "event loop" if workers == 0 else f"{executor} x{workers}"
+            print(f"{label:<12s} {elapsed:7.2f}s  {PAGES / elapsed:7.1f} pages/s  max loop delay {max_delay * 1000:7.1f}ms")
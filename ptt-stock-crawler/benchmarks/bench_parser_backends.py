@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/05 17:00
+# @Desc    : pytest-benchmark suite comparing the parser backends over the saved PTT pages,
+#            run from ptt-stock-crawler: python -m pytest benchmarks/bench_parser_backends.py
+
+import os
+
+import pytest
+
+from parser_backends import PARSER_BACKENDS, get_parser_backend
+
+pytest.importorskip("pytest_benchmark")
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+CORPUS = {
+    "index": [file_name for file_name in sorted(os.listdir(FIXTURES_DIR)) if "index" in file_name],
+    "article": [file_name for file_name in sorted(os.listdir(FIXTURES_DIR)) if "article" in file_name],
+}
+
+
+def load_corpus(page_type: str):
+    pages = []
+    for file_name in CORPUS[page_type]:
+        with open(os.path.join(FIXTURES_DIR, file_name), encoding="utf-8") as f:
+            pages.append(f.read())
+    return pages
+
+
+def available_backends():
+    names = []
+    for name in PARSER_BACKENDS:
+        try:
+            get_parser_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+@pytest.mark.parametrize("backend_name", available_backends())
+def test_parse_post_list(benchmark, backend_name):
+    pages = load_corpus("index")
+    backend = get_parser_backend(backend_name)
+    expected = [get_parser_backend("bs4").parse_post_list(page) for page in pages]
+    benchmark.group = "index page"
+    benchmark.extra_info["pages"] = len(pages)
+
+    result = benchmark(lambda: [backend.parse_post_list(page) for page in pages])
+    # a fast backend is only useful when it stays correct
+    assert result == expected
+
+
+@pytest.mark.parametrize("backend_name", available_backends())
+def test_parse_post_detail(benchmark, backend_name):
+    pages = load_corpus("article")
+    backend = get_parser_backend(backend_name)
+    expected = [get_parser_backend("bs4").parse_post_detail(page) for page in pages]
+    benchmark.group = "article page"
+    benchmark.extra_info["pages"] = len(pages)
+
+    result = benchmark(lambda: [backend.parse_post_detail(page) for page in pages])
+    assert result == expected
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/16 10:00
+# @Desc    : Benchmark push comment extraction of a hot thread, the first comment loop of the crawlers vs the
+#            parser backends and the one pass extractor, run from ptt-stock-crawler:
+#            python -m benchmarks.bench_push_comments
+
+import time
+from typing import List
+
+import lxml.html
+from bs4 import BeautifulSoup
+
+from common import PostComment
+from extractor import parse_push_comments
+from mock_server import render_article_page
+from parser_backends import PARSER_BACKENDS, LexborHTMLParser, get_parser_backend
+
+COMMENTS_COUNT = 5000  # pushes of the hot thread
+ROUNDS = 5
+
+
+def legacy_comments(soup: BeautifulSoup) -> List[PostComment]:
+    """
+    The comment loop of the first crawlers, up to five select("span") per push
+    :param soup:
+    :return:
+    """
+    post_comments: List[PostComment] = []
+    for comment_element in soup.select("#main-content > div.push"):
+        post_comment = PostComment()
+        if len(comment_element.select("span")) < 3:
+            continue
+        post_comment.comment_user_name = comment_element.select("span")[1].text.strip()
+        post_comment.comment_content = comment_element.select("span")[2].text.strip().replace(": ", "")
+        post_comment.comment_time = comment_element.select("span")[3].text.strip()
+        post_comments.append(post_comment)
+    return post_comments
+
+
+def best_of(func) -> float:
+    """
+    Best time of ROUNDS calls in milliseconds
+    :param func:
+    :return:
+    """
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+if __name__ == '__main__':
+    html = render_article_page("Stock", "M.1711544298.A.9F8", COMMENTS_COUNT)
+    soup = BeautifulSoup(html, "lxml")
+    main_content = lxml.html.fromstring(html).find(".//div[@id='main-content']")
+    assert len(parse_push_comments(main_content)) == COMMENTS_COUNT
+
+    print(f"Thread of {COMMENTS_COUNT} pushes, {len(html) / 1024:.0f} KiB, best of {ROUNDS}")
+    print("extraction only, page already parsed:")
+    print(f"  legacy bs4 loop        {best_of(lambda: legacy_comments(soup)):8.1f} ms")
+    print(f"  one pass lxml          {best_of(lambda: parse_push_comments(main_content)):8.1f} ms")
+    print("parse + extraction:")
+    print(f"  legacy bs4 loop        {best_of(lambda: legacy_comments(BeautifulSoup(html, 'lxml'))):8.1f} ms")
+    for name in PARSER_BACKENDS:
+        if name == "selectolax" and LexborHTMLParser is None:
+            continue
+        backend = get_parser_backend(name)
+        print(f"  {name + ' backend':<22s} {best_of(lambda: backend.parse_post_comments(html)):8.1f} ms")
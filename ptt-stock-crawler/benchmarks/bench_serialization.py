@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/09 10:00
+# @Desc    : Serialization cost of synthetic posts with comments, asdict-based dataclass_to_dict vs the fast paths,
+#            run from ptt-stock-crawler: python -m benchmarks.bench_serialization
+
+import json
+import time
+from dataclasses import asdict, is_dataclass
+from typing import Callable, List
+
+import common
+from common import PostComment, PostContentDetail, dataclass_to_dict
+
+POSTS_COUNT = 100_000
+COMMENTS_PER_POST = 10
+
+
+def dataclass_to_dict_asdict(obj):
+    """
+    The previous implementation, asdict() deep copies and the result is walked again
+    :param obj:
+    :return:
+    """
+    if is_dataclass(obj):
+        return {k: dataclass_to_dict_asdict(v) for k, v in asdict(obj).items()}
+    elif isinstance(obj, list):
+        return [dataclass_to_dict_asdict(item) for item in obj]
+    else:
+        return obj
+
+
+def make_posts() -> List[PostContentDetail]:
+    return [
+        PostContentDetail(
+            title=f"[新聞] 第{i}篇測試文章",
+            author=f"user{i}",
+            publish_date="Wed Mar 27 21:18:16 2024",
+            detail_link=f"https://www.ptt.cc/bbs/Stock/M.{1711500000 + i}.A.9F8.html",
+            content="測試用的內文。\n" * 20,
+            post_comments=[PostComment(comment_user_name=f"pusher{j}", comment_content=f"第{j}則推文",
+                                       comment_time="03/27 21:20") for j in range(COMMENTS_PER_POST)]
+        )
+        for i in range(POSTS_COUNT)
+    ]
+
+
+def bench(name: str, encode: Callable[[PostContentDetail], bytes], posts: List[PostContentDetail], baseline: float):
+    start = time.perf_counter()
+    for post in posts:
+        encode(post)
+    seconds = time.perf_counter() - start
+    print(f"{name:<36s} {seconds:7.2f}s  {len(posts) / seconds:10.0f} posts/s  speedup x{(baseline or seconds) / seconds:.1f}")
+    return seconds
+
+
+if __name__ == '__main__':
+    all_posts = make_posts()
+    print(f"{POSTS_COUNT} posts x {COMMENTS_PER_POST} comments")
+    baseline_seconds = bench("asdict dataclass_to_dict + json",
+                             lambda post: json.dumps(dataclass_to_dict_asdict(post), ensure_ascii=False).encode("utf-8"),
+                             all_posts, 0)
+    bench("single pass dataclass_to_dict + json",
+          lambda post: json.dumps(dataclass_to_dict(post), ensure_ascii=False).encode("utf-8"), all_posts,
+          baseline_seconds)
+    if common.orjson is not None:
+        bench("orjson", common.orjson.dumps, all_posts, baseline_seconds)
+    if common.msgspec is not None:
+        bench("msgspec", common.msgspec.json.encode, all_posts, baseline_seconds)
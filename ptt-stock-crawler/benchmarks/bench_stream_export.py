@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/06 14:00
+# @Desc    : Peak traced memory of the async crawler, in-memory list vs streaming JSONL sink, against the mock server,
+#            run from ptt-stock-crawler: python -m benchmarks.bench_stream_export
+
+import asyncio
+import contextlib
+import os
+import tempfile
+import tracemalloc
+
+import asyn_crawler
+from mock_server import start_mock_server
+from storage import JsonlPostSink
+
+PAGE_COUNTS = [5, 20, 40]
+
+
+def peak_memory(pages: int, stream: bool) -> float:
+    """
+    Crawl `pages` index pages and return the peak traced memory in MB
+    :param pages: number of index pages
+    :param stream: save the posts to a JsonlPostSink instead of a list
+    :return:
+    """
+    asyn_crawler.FIRST_N_PAGE = pages
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        save_posts = JsonlPostSink(os.path.join(tmp_dir, "posts.jsonl")) if stream else []
+        tracemalloc.start()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            asyncio.run(asyn_crawler.run_crawler(save_posts))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if stream:
+            save_posts.close()
+    return peak / 1024 / 1024
+
+
+if __name__ == '__main__':
+    server, base_host = start_mock_server(latency=0)
+    asyn_crawler.BASE_HOST = base_host
+    # local mock server, no need to be polite
+    asyn_crawler.HOST_RATE_LIMIT = None
+    for page_count in PAGE_COUNTS:
+        in_memory = peak_memory(page_count, stream=False)
+        streaming = peak_memory(page_count, stream=True)
+        print(f"{page_count:3d} pages  list: {in_memory:7.2f} MB  jsonl sink: {streaming:7.2f} MB")
+    server.shutdown()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/18 10:00
+# @Desc    : Crawl several PTT boards concurrently with one client: a global connection budget shared by the boards
+#            in round robin, one output file and one checkpoint per board
+
+import argparse
+import asyncio
+import contextlib
+from typing import Dict, List, Optional
+
+import httpx
+
+import asyn_crawler
+from asyn_crawler import crawl_board, open_checkpoint
+from checkpoint import CrawlCheckpoint
+from common import PostContentDetail
+from crawler_kit.http_cache import ResponseCache
+from crawler_kit.metrics import metrics
+from crawler_kit.throttle import FairSlots, Politeness
+from http_client import create_async_client
+from parse_pool import ParsePool
+from seen_index import SeenArticleIndex
+from storage import JsonlPostSink
+
+BOARDS = ["Stock", "Gossiping", "Foreign_Inv", "Option", "DigiCurrency"]  # Gossiping needs the over18 cookie
+GLOBAL_CONCURRENCY = 24  # requests in flight to ptt.cc over all boards
+BOARD_CONCURRENCY = 10  # detail pages of one board fetched at the same time, also its max share of the budget
+METRICS_PATH = "ptt_boards_crawler_metrics.prom"  # metrics snapshot of the run, .json for json, None to skip
+
+
+def board_of_request(request: httpx.Request) -> str:
+    """
+    Fair share key of a request: /bbs/Stock/index.html -> Stock
+    :param request:
+    :return:
+    """
+    parts = request.url.path.split("/")
+    if len(parts) > 2 and parts[1] == "bbs":
+        return parts[2]
+    return request.url.path
+
+
+async def crawl_boards(client: httpx.AsyncClient, save_posts_by_board: Dict[str, List[PostContentDetail]],
+                       concurrency: int = BOARD_CONCURRENCY, seen_index: Optional[SeenArticleIndex] = None,
+                       parse_pool: Optional[ParsePool] = None,
+                       checkpoints: Optional[Dict[str, CrawlCheckpoint]] = None) -> Dict[str, BaseException]:
+    """
+    Crawl every board with the same client, a failing board does not stop the others
+    :param client: shared http client, with a FairShareTransport for the fairness between the boards
+    :param save_posts_by_board: data container of every board, keyed by board name
+    :param concurrency: number of detail pages of one board fetched at the same time
+    :param seen_index: optional index of the incremental mode, shared by the boards
+    :param parse_pool: optional parse stage, shared by the boards
+    :param checkpoints: optional progress of every board, keyed by board name
+    :return: error of the failed boards
+    """
+    checkpoints = checkpoints or {}
+    boards = list(save_posts_by_board)
+    results = await asyncio.gather(*[
+        crawl_board(client, board, save_posts_by_board[board], concurrency, seen_index, parse_pool,
+                    checkpoints.get(board))
+        for board in boards], return_exceptions=True)
+    errors: Dict[str, BaseException] = {}
+    for board, result in zip(boards, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                # KeyboardInterrupt and cancellation stop the whole run
+                raise result
+            print(f"Board {board} failed: {result!r}")
+            errors[board] = result
+    return errors
+
+
+async def run_scheduler(save_posts_by_board: Dict[str, List[PostContentDetail]], resume: bool = False,
+                        global_concurrency: int = GLOBAL_CONCURRENCY, concurrency: int = BOARD_CONCURRENCY):
+    """
+    Multi-board crawler main function
+    :param save_posts_by_board: data container of every board, a list or a sink such as storage.JsonlPostSink
+    :param resume: continue the runs recorded in the checkpoints of the boards instead of starting over
+    :param global_concurrency: requests in flight over all boards
+    :param concurrency: number of detail pages of one board fetched at the same time
+    :return:
+    """
+    metrics.reset()
+    seen_index = SeenArticleIndex(asyn_crawler.SEEN_INDEX_PATH) if asyn_crawler.INCREMENTAL else None
+    cache = ResponseCache(asyn_crawler.HTTP_CACHE_DIR) if asyn_crawler.HTTP_CACHE_DIR else None
+    # every board crawls the same host, the rate limit and the retry budget are shared
+    politeness = Politeness(rate=asyn_crawler.HOST_RATE_LIMIT, initial_concurrency=global_concurrency,
+                            max_concurrency=global_concurrency)
+    fair_slots = FairSlots(global_concurrency, per_key=concurrency, key=board_of_request)
+    parse_pool = ParsePool(asyn_crawler.PARSER_BACKEND, asyn_crawler.PARSE_WORKERS,
+                           asyn_crawler.PARSE_EXECUTOR) if asyn_crawler.PARSE_WORKERS > 0 else None
+    checkpoints = {board: open_checkpoint(board, resume) for board in save_posts_by_board}
+    checkpoints = {board: checkpoint for board, checkpoint in checkpoints.items() if checkpoint is not None}
+    try:
+        async with create_async_client(max_connections=global_concurrency, cache=cache, politeness=politeness,
+                                       fair_slots=fair_slots) as client:
+            errors = await crawl_boards(client, save_posts_by_board, concurrency, seen_index, parse_pool,
+                                        checkpoints)
+    finally:
+        for checkpoint in checkpoints.values():
+            checkpoint.save()
+        if seen_index is not None:
+            seen_index.close()
+        if parse_pool is not None:
+            parse_pool.close()
+
+    for board, save_posts in save_posts_by_board.items():
+        print(f"Board {board} completed, total posts: ", len(save_posts))
+        metrics.inc("posts_total", len(save_posts), board=board)
+    print("Failed boards: ", sorted(errors))
+    print("Fair share: ", fair_slots.stats())
+    print("Politeness: ", politeness.stats())
+    if METRICS_PATH:
+        metrics.write_snapshot(METRICS_PATH)
+        print("Metrics snapshot: ", METRICS_PATH)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Crawl the first N pages of several PTT boards concurrently")
+    arg_parser.add_argument("boards", nargs="*", default=BOARDS, help=f"board names, default {' '.join(BOARDS)}")
+    arg_parser.add_argument("--resume", action="store_true", help="continue the interrupted runs of the boards")
+    args = arg_parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        # one file per board, a resumed run adds the missing posts to the file of the interrupted one, an incremental
+        # run the new and changed posts to the file of the earlier runs
+        append = args.resume or asyn_crawler.INCREMENTAL
+        posts_sinks = {board: stack.enter_context(JsonlPostSink(f"ptt_{board.lower()}_posts.jsonl", append=append))
+                       for board in args.boards}
+        asyncio.run(run_scheduler(posts_sinks, resume=args.resume))
+    print("Export data to", ", ".join(f"ptt_{board.lower()}_posts.jsonl" for board in args.boards))
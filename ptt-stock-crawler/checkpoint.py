@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/17 10:00
+# @Desc    : Checkpoint of a crawl run, lets a long backfill resume where it stopped
+
+import json
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+from common import PostContent, PostContentDetail, get_article_id, is_fetched
+
+CHECKPOINT_EVERY = 50  # write the checkpoint every N completed articles
+
+
+class CrawlCheckpoint:
+    """
+    Progress of a crawl run: the latest page number the run started from, the completed index pages and the
+    article ids saved on the pages not completed yet. An index page is completed once every post of it was saved,
+    so a resumed run skips the completed pages and only downloads the articles not saved yet. The file is replaced
+    atomically.
+    """
+
+    def __init__(self, file_path: str, save_every: int = CHECKPOINT_EVERY):
+        """
+        :param file_path: json checkpoint file
+        :param save_every: write the file every N completed articles
+        """
+        self.file_path = file_path
+        self.save_every = save_every
+        self.latest_number: Optional[int] = None
+        self.done_pages: Set[int] = set()
+        self.done_articles: Set[str] = set()
+        # (all article ids, article ids still missing) of the pages being fetched, keyed by index page number
+        self._pending: Dict[int, Tuple[Set[str], Set[str]]] = {}
+        self._unsaved = 0
+
+    @classmethod
+    def load(cls, file_path: str, save_every: int = CHECKPOINT_EVERY) -> "CrawlCheckpoint":
+        """
+        Load the checkpoint of a previous run, an empty checkpoint if the file does not exist
+        :param file_path:
+        :param save_every:
+        :return:
+        """
+        checkpoint = cls(file_path, save_every)
+        if os.path.exists(file_path):
+            with open(file_path, encoding="utf-8") as f:
+                state = json.load(f)
+            checkpoint.latest_number = state["latest_number"]
+            checkpoint.done_pages = set(state["done_pages"])
+            checkpoint.done_articles = set(state["done_articles"])
+        return checkpoint
+
+    def pending_pages(self, page_numbers: List[int]) -> List[int]:
+        """
+        Drop the completed index pages
+        :param page_numbers:
+        :return:
+        """
+        return [page_number for page_number in page_numbers if page_number not in self.done_pages]
+
+    def expect_page(self, page_number: int, page_posts: List[PostContent], fetched: bool = True) -> List[PostContent]:
+        """
+        Register the posts of an index page that are about to be fetched, the page is completed when they are saved,
+        at once when there is nothing to fetch (no posts, or all of them filtered out by the incremental mode)
+        :param page_number:
+        :param page_posts: posts of the page, posts without detail link are skipped
+        :param fetched: False when the index page request failed, the page stays pending so a resumed run fetches it
+                        again
+        :return: the posts not saved yet
+        """
+        if not fetched:
+            return []
+        page_ids = {get_article_id(post_content.detail_link) for post_content in page_posts
+                    if post_content.detail_link}
+        posts_to_fetch = [post_content for post_content in page_posts if post_content.detail_link
+                          and get_article_id(post_content.detail_link) not in self.done_articles]
+        if posts_to_fetch:
+            self._pending[page_number] = (page_ids, {get_article_id(post_content.detail_link)
+                                                     for post_content in posts_to_fetch})
+        else:
+            self._complete_page(page_number, page_ids)
+        return posts_to_fetch
+
+    def mark_article(self, post: PostContent):
+        """
+        Record a saved article, completes its index page when it was the last one
+        :param post: post or post detail, only detail_link is used
+        :return:
+        """
+        article_id = get_article_id(post.detail_link)
+        self.done_articles.add(article_id)
+        for page_number, (page_ids, missing_ids) in self._pending.items():
+            if article_id in missing_ids:
+                missing_ids.discard(article_id)
+                if not missing_ids:
+                    del self._pending[page_number]
+                    self._complete_page(page_number, page_ids)
+                break
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def _complete_page(self, page_number: int, page_ids: Set[str]):
+        # the page is skipped from now on, its article ids are not needed anymore
+        self.done_pages.add(page_number)
+        self.done_articles -= page_ids
+
+    def track(self, save_posts):
+        """
+        Wrap a data container so every saved post detail is marked as completed
+        :param save_posts: a list or a sink with append()
+        :return:
+        """
+        return CheckpointSink(save_posts, self)
+
+    def save(self):
+        """
+        Write the checkpoint to a temporary file and rename it, a crash leaves the previous checkpoint intact
+        :return:
+        """
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "latest_number": self.latest_number,
+                "done_pages": sorted(self.done_pages),
+                "done_articles": sorted(self.done_articles),
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+        self._unsaved = 0
+
+
+class CheckpointSink:
+    """
+    Data container wrapper, forwards the posts and marks the fetched ones in the checkpoint
+    """
+
+    def __init__(self, save_posts, checkpoint: CrawlCheckpoint):
+        self.save_posts = save_posts
+        self.checkpoint = checkpoint
+
+    def append(self, post: PostContentDetail):
+        self.save_posts.append(post)
+        # a failed detail fetch is not marked, a resumed run downloads it again
+        if is_fetched(post):
+            self.checkpoint.mark_article(post)
+
+    def extend(self, posts):
+        for post in posts:
+            self.append(post)
+
+    def __len__(self):
+        return len(self.save_posts)
@@ -3,12 +3,36 @@
 # @Time    : 2024/11/15 15:30
 # @Desc    : public data model code
 
-from typing import List
-from dataclasses import dataclass, field, is_dataclass, asdict
+import codecs
+import json
+import re
+import zlib
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field, fields, is_dataclass
 
 from bs4 import BeautifulSoup
 
-@dataclass
+# optional fast json encoders, pip install orjson or msgspec
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+DEFAULT_PAGE_ENCODING = "utf-8"  # ptt.cc serves utf-8, used when neither the header nor the page declares a charset
+# the Big5 of the old PTT pages includes the Microsoft extensions, decode it as cp950
+PAGE_ENCODING_ALIASES = {"big5": "cp950", "x-big5": "cp950"}
+_HEADER_CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+_META_CHARSET = re.compile(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+LAZY_HTML_COMPRESS_LEVEL = 1  # zlib level of the raw html kept by LazyPostContentDetail, the fastest one
+
+
+# slots=True (python 3.10+) drops the per-instance __dict__, hot threads create thousands of PostComment
+@dataclass(slots=True)
 class PostContent:
     """
     Basic post content container
@@ -17,6 +41,7 @@ class PostContent:
     author: str = ""  # post author
     publish_date: str = ""  # post publish date
     detail_link: str = ""  # post detail link
+    push_count: str = ""  # push count shown in the list page: "", 1-99, 爆, X1-XX
 
     def __str__(self):
         return f"""
@@ -27,7 +52,7 @@ class PostContent:
         """
 
 
-@dataclass
+@dataclass(slots=True)
 class PostComment:
     """
     Post comment container
@@ -35,6 +60,7 @@ class PostComment:
     comment_user_name: str = ""  # comment user name
     comment_content: str = ""  # comment content
     comment_time: str = ""  # comment time
+    push_tag: str = ""  # push type: 推, 噓 or →
 
     def __repr__(self):
         # using __repr__ instead of __str__ is to make PostContentDetail easier to call.
@@ -42,7 +68,7 @@ class PostComment:
                 f"comment_time='{self.comment_time}')")
 
 
-@dataclass
+@dataclass(slots=True)
 class PostContentDetail(PostContent):
     """
     Post content detail container
@@ -51,6 +77,7 @@ class PostContentDetail(PostContent):
     author: str = ""  # post author
     publish_date: str = ""  # post publish date
     detail_link: str = ""  # post detail link
+    push_count: str = ""  # push count shown in the list page: "", 1-99, 爆, X1-XX
     content: str = ""  # post content
     post_comments: List[PostComment] = field(default_factory=list)  # post comments
 
@@ -65,13 +92,130 @@ class PostContentDetail(PostContent):
         """
 
 
+def _lazy_field(name: str) -> property:
+    """
+    Property in front of a PostContentDetail slot, the page is parsed the first time the field is read or written
+    :param name: field name
+    :return:
+    """
+    slot = next(cls.__dict__[name] for cls in PostContentDetail.__mro__ if name in cls.__dict__)
+
+    def get_field(self):
+        if self._raw_html is not None:
+            self.materialize()
+        return slot.__get__(self)
+
+    def set_field(self, value):
+        if self._raw_html is not None:
+            self.materialize()
+        slot.__set__(self, value)
+
+    return property(get_field, set_field)
+
+
+class LazyPostContentDetail(PostContentDetail):
+    """
+    Post content detail keeping the raw article page instead of its parsed fields: publish_date, content and
+    post_comments are parsed on first access, and iter_comments() streams the comments without building the list.
+    A pipeline triaging posts on title, author or push count never pays for the parse.
+    """
+    __slots__ = ("_raw_html", "_compressed", "_encoding", "_parser_backend")
+
+    publish_date = _lazy_field("publish_date")
+    content = _lazy_field("content")
+    post_comments = _lazy_field("post_comments")
+
+    def __init__(self, raw_html: bytes, encoding: str, parser_backend: str = "lxml", compress: bool = True,
+                 **post_fields):
+        """
+        :param raw_html: raw body of the article page
+        :param encoding: page encoding, see page_encoding
+        :param parser_backend: name of the parser backend materializing the fields
+        :param compress: keep the page zlib compressed, about 4 times smaller for a little CPU
+        :param post_fields: title, author, detail_link, push_count of the list page
+        """
+        self._raw_html = None
+        super().__init__(**post_fields)
+        self._compressed = compress
+        self._raw_html = zlib.compress(raw_html, LAZY_HTML_COMPRESS_LEVEL) if compress else raw_html
+        self._encoding = encoding
+        self._parser_backend = parser_backend
+
+    @property
+    def raw_html(self) -> Optional[bytes]:
+        """
+        Raw body of the article page, None once the fields are parsed
+        """
+        if self._raw_html is None or not self._compressed:
+            return self._raw_html
+        return zlib.decompress(self._raw_html)
+
+    @property
+    def materialized(self) -> bool:
+        return self._raw_html is None
+
+    def materialize(self) -> "LazyPostContentDetail":
+        """
+        Parse publish date, content and comments in one pass and drop the raw page
+        :return: self
+        """
+        if self._raw_html is None:
+            return self
+        # parser_backends imports this module
+        from parser_backends import get_parser_backend
+        parsed_detail = get_parser_backend(self._parser_backend).parse_post_detail_bytes(self.raw_html, self._encoding)
+        self._raw_html = None
+        self.publish_date = parsed_detail.publish_date
+        self.content = parsed_detail.content
+        self.post_comments = parsed_detail.post_comments
+        return self
+
+    def __repr__(self):
+        if self._raw_html is None:
+            return PostContentDetail.__repr__(self)
+        # reprs show up in logs and asyncio task reprs, they must not trigger the parse
+        return (f"LazyPostContentDetail(title={self.title!r}, author={self.author!r}, "
+                f"detail_link={self.detail_link!r}, push_count={self.push_count!r}, raw_html={len(self._raw_html)} B)")
+
+    def iter_comments(self) -> Iterator[PostComment]:
+        """
+        Iterate the comments, streamed from the raw page while the fields are not parsed, so a thread of thousands
+        of comments is never held in memory as a whole
+        :return:
+        """
+        if self._raw_html is None:
+            return iter(self.post_comments)
+        from parser_backends import get_parser_backend
+        return get_parser_backend(self._parser_backend).iter_post_comments_bytes(self.raw_html, self._encoding)
+
+    def to_detail(self) -> PostContentDetail:
+        """
+        Plain PostContentDetail with the parsed fields
+        :return:
+        """
+        return PostContentDetail(**{name: getattr(self, name) for name in _field_names(PostContentDetail)})
+
+
+def is_fetched(post: PostContentDetail) -> bool:
+    """
+    Whether the detail page of a post was fetched, checked by the sinks before marking the post as done
+    :param post:
+    :return:
+    """
+    # a lazy detail is only built from a fetched page, reading its content would parse it
+    if isinstance(post, LazyPostContentDetail):
+        return True
+    # a failed fetch keeps the empty fields, a fetched page has at least its publish date even with an empty body
+    return bool(post.publish_date or post.content or post.post_comments)
+
+
 def parse_post_content(html_content: str) -> str:
     """
     Parse post content
     :param html_content: html source code content
     :return:
     """
-    res_content = ""
+    texts: List[str] = []
     bs = BeautifulSoup(html_content, "lxml")
     last_content_meta_ele = bs.select("#main-content > div:nth-child(4)")[0]
 
@@ -81,20 +225,81 @@ def parse_post_content(html_content: str) -> str:
         current_ele = current_ele.next_sibling
         if current_ele.name == "div":
             break
-        res_content += current_ele.getText()
+        texts.append(current_ele.getText())
 
-    return res_content
+    return "".join(texts)
+
+
+def page_encoding(content_type: Optional[str], content: bytes = b"") -> str:
+    """
+    Encoding of a page without sniffing its body: the charset of the Content-Type header, otherwise the
+    <meta charset> of the first KiB, otherwise DEFAULT_PAGE_ENCODING
+    :param content_type: Content-Type response header
+    :param content: raw response body
+    :return: python codec name, also known to lxml
+    """
+    match = _HEADER_CHARSET.search(content_type or "") or _META_CHARSET.search(content[:1024])
+    if match is None:
+        return DEFAULT_PAGE_ENCODING
+    encoding = match.group(1)
+    encoding = (encoding.decode("ascii") if isinstance(encoding, bytes) else encoding).lower()
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        return DEFAULT_PAGE_ENCODING
+    return PAGE_ENCODING_ALIASES.get(encoding, encoding)
+
+
+def get_article_id(detail_link: str) -> str:
+    """
+    Get the article id from a detail link
+    :param detail_link: /bbs/Stock/M.1711544298.A.9F8.html or https://www.ptt.cc/bbs/Stock/M.1711544298.A.9F8.html
+    :return: M.1711544298.A.9F8
+    """
+    return detail_link.rsplit("/", 1)[-1].replace(".html", "")
+
+
+def get_board_name(detail_link: str) -> str:
+    """
+    Get the board name from a detail link
+    :param detail_link: /bbs/Stock/M.1711544298.A.9F8.html or https://www.ptt.cc/bbs/Stock/M.1711544298.A.9F8.html
+    :return: Stock
+    """
+    parts = detail_link.split("/")
+    return parts[-2] if len(parts) >= 2 else ""
 
 
 def dataclass_to_dict(obj):
     """
-    Convert dataclass to dict
+    Convert dataclass to dict in a single pass, field values are read in place instead of deep copied by asdict()
     :param obj:
     :return:
     """
     if is_dataclass(obj):
-        return {k: dataclass_to_dict(v) for k, v in asdict(obj).items()}
+        return {name: dataclass_to_dict(getattr(obj, name)) for name in _field_names(type(obj))}
     elif isinstance(obj, list):
         return [dataclass_to_dict(item) for item in obj]
     else:
         return obj
+
+
+def encode_post(post: PostContentDetail) -> bytes:
+    """
+    Encode a post to one line of UTF-8 JSON, with orjson or msgspec when installed, they serialize dataclasses
+    natively without building a dict first
+    :param post:
+    :return:
+    """
+    if isinstance(post, LazyPostContentDetail):
+        # the native encoders may read the slots behind the lazy properties
+        post = post.to_detail()
+    if orjson is not None:
+        return orjson.dumps(post)
+    if msgspec is not None:
+        return msgspec.json.encode(post)
+    return json.dumps(dataclass_to_dict(post), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@lru_cache(maxsize=None)
+def _field_names(cls) -> Tuple[str, ...]:
+    return tuple(f.name for f in fields(cls))
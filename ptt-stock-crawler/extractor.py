@@ -3,10 +3,15 @@
 # @Time    : 2024/11/15 16:22
 # @Desc    : Code to extract data from html
 
+import io
+from typing import Iterator, List, Optional
+
+import lxml.etree
+import lxml.html
 from bs4 import BeautifulSoup
 from parsel import Selector
 
-from common import PostContent
+from common import PostComment, PostContent
 
 
 def parse_html_use_bs(html_content: str):
@@ -58,6 +63,93 @@ def parse_html_use_parse(html_content: str):
     print("parsel" + "*" * 30)
 
 
+def parse_post_list(html_content: str) -> List[PostContent]:
+    """
+    Extract every post row of an index page with one lxml parse, the rows are read straight from the parsed tree
+    :param html_content: html source code of the whole index page
+    :return:
+    """
+    return parse_post_list_tree(lxml.html.fromstring(html_content))
+
+
+def parse_post_list_tree(tree: lxml.html.HtmlElement) -> List[PostContent]:
+    """
+    Extract every post row of a parsed index page
+    :param tree: lxml tree of the whole index page
+    :return:
+    """
+    posts_list: List[PostContent] = []
+    for row in tree.iterfind(".//div[@class='r-ent']"):
+        post_content = PostContent()
+        # deleted posts have no link, their title and link stay empty
+        title_link = row.find("div[@class='title']/a")
+        if title_link is not None:
+            post_content.title = title_link.text_content().strip()
+            post_content.detail_link = title_link.get("href", "")
+        author = row.find("div[@class='meta']/div[@class='author']")
+        if author is not None:
+            post_content.author = author.text_content().strip()
+        publish_date = row.find("div[@class='meta']/div[@class='date']")
+        if publish_date is not None:
+            post_content.publish_date = publish_date.text_content().strip()
+        push_count = row.find("div[@class='nrec']")
+        if push_count is not None:
+            post_content.push_count = push_count.text_content().strip()
+        posts_list.append(post_content)
+    return posts_list
+
+
+def parse_push_comments(main_content: lxml.html.HtmlElement) -> List[PostComment]:
+    """
+    Extract the push comments of an article in one pass: every push row is visited once and its four spans
+    (push-tag, push-userid, push-content, push-ipdatetime) are read once, rows with less spans are skipped
+    :param main_content: the #main-content element of the article page
+    :return:
+    """
+    post_comments: List[PostComment] = []
+    for push_element in main_content.iterchildren("div"):
+        if "push" not in (push_element.get("class") or "").split():
+            continue
+        post_comment = _push_comment(push_element)
+        if post_comment is not None:
+            post_comments.append(post_comment)
+    return post_comments
+
+
+def iter_push_comments(content: bytes, encoding: str) -> Iterator[PostComment]:
+    """
+    Stream the push comments of an article from its raw bytes, the rows already read are dropped from the tree so
+    a thread of thousands of comments never holds its whole tree nor its whole comment list
+    :param content: raw body of the article page
+    :param encoding: page encoding, see common.page_encoding
+    :return:
+    """
+    for _, element in lxml.etree.iterparse(io.BytesIO(content), events=("end",), tag="div", html=True,
+                                           encoding=encoding):
+        parent = element.getparent()
+        if parent is None or parent.get("id") != "main-content":
+            continue
+        if "push" in (element.get("class") or "").split():
+            post_comment = _push_comment(element)
+            if post_comment is not None:
+                yield post_comment
+        # meta lines, body text and read rows are not needed anymore
+        element.clear(keep_tail=False)
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def _push_comment(push_element: lxml.etree.ElementBase) -> Optional[PostComment]:
+    # a span without children holds its whole text, links in the content need all the text nodes
+    texts = ["".join(span.itertext()) if len(span) else (span.text or "") for span in push_element.iterchildren("span")]
+    if len(texts) < 4:
+        return None
+    return PostComment(comment_user_name=texts[1].strip(),
+                       comment_content=texts[2].strip().replace(": ", ""),
+                       comment_time=texts[3].strip(),
+                       push_tag=texts[0].strip())
+
+
 if __name__ == '__main__':
     ori_html = """
     <div class="r-ent">
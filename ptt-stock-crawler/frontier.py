@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/22 10:00
+# @Desc    : Crawl frontier shared by many worker processes: index pages and articles to fetch, leased to a worker
+#            and acknowledged when done, deduplicated by key, moved to a dead letter state after too many failures
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import requests
+
+LEASE_SECONDS = 300.0  # a leased task not acknowledged within this time is handed to another worker
+MAX_ATTEMPTS = 5  # leases of a task before it goes to the dead letters
+RETRY_DELAY = 5.0  # seconds before a failed task is leased again, doubled on every attempt
+FRONTIER_PORT = 8765  # port of serve_frontier
+
+
+@dataclass(slots=True)
+class FrontierTask:
+    """
+    One unit of work: kind is index (key <board>/<page number>) or article (key <board>/<article id>)
+    """
+    kind: str = ""
+    key: str = ""
+    payload: Dict = field(default_factory=dict)
+    priority: int = 0  # smaller first
+    attempts: int = 0  # leases so far, this one included
+    lease_id: str = ""  # id of the lease, ack and nack of an expired lease are ignored
+
+
+class Frontier(ABC):
+    """
+    Work queue of a distributed crawl. Tasks are pushed once per key, leased by the workers for a limited time and
+    acknowledged when done. A task whose lease expires is leased again, a failing task is retried with backoff
+    until MAX_ATTEMPTS then kept as a dead letter. Delivery is at least once: a worker dying between saving a post
+    and acknowledging it makes another worker fetch it again.
+    """
+
+    @abstractmethod
+    def push(self, tasks: List[FrontierTask]) -> int:
+        """
+        Add tasks, the keys already known (pending, leased, done or dead) are ignored
+        :param tasks:
+        :return: number of new tasks
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def lease(self, worker_id: str, limit: int, lease_seconds: float = LEASE_SECONDS) -> List[FrontierTask]:
+        """
+        Lease up to `limit` ready tasks, smaller priority first
+        :param worker_id: name of the worker, kept for the stats
+        :param limit:
+        :param lease_seconds: time to ack the tasks before they are handed to another worker
+        :return: leased tasks, empty when nothing is ready
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def ack(self, task: FrontierTask):
+        raise NotImplementedError
+
+    @abstractmethod
+    def nack(self, task: FrontierTask, error: str):
+        """
+        Give a task back after a failure, it goes to the dead letters after MAX_ATTEMPTS
+        :param task:
+        :param error: reason kept with the dead letter
+        :return:
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """
+        Number of tasks by state: pending, leased, done, dead
+        :return:
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def requeue_dead(self) -> int:
+        """
+        Give the dead letters a new set of attempts
+        :return: number of requeued tasks
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SQLiteFrontier(Frontier):
+    """
+    Frontier in a SQLite file, safe for the worker processes of one machine: every lease runs in an immediate
+    transaction so two processes never lease the same task. serve_frontier() shares it with other machines.
+    """
+
+    def __init__(self, db_path: str, max_attempts: int = MAX_ATTEMPTS, retry_delay: float = RETRY_DELAY):
+        """
+        :param db_path: sqlite file path
+        :param max_attempts: leases of a task before it goes to the dead letters
+        :param retry_delay: seconds before a failed task is leased again, doubled on every attempt
+        """
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # the worker calls it from a thread pool and the server from its request threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        # readers do not block the writer, the commits of many small transactions stay cheap
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS frontier (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_id TEXT,
+                worker_id TEXT,
+                error TEXT,
+                PRIMARY KEY (kind, key)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS frontier_ready ON frontier (state, priority, available_at)")
+
+    def push(self, tasks: List[FrontierTask]) -> int:
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO frontier (kind, key, payload, priority, state, available_at) "
+                    "VALUES (?, ?, ?, ?, 'pending', ?)",
+                    [(task.kind, task.key, json.dumps(task.payload, ensure_ascii=False), task.priority, now)
+                     for task in tasks])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def lease(self, worker_id: str, limit: int, lease_seconds: float = LEASE_SECONDS) -> List[FrontierTask]:
+        now = time.time()
+        lease_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # an expired lease counts as a failed attempt of the worker that held it
+                self._conn.execute(
+                    "UPDATE frontier SET state = 'dead', error = 'lease expired' "
+                    "WHERE state = 'leased' AND available_at <= ? AND attempts >= ?", (now, self.max_attempts))
+                rows = self._conn.execute(
+                    "SELECT kind, key, payload, priority, attempts FROM frontier "
+                    "WHERE state IN ('pending', 'leased') AND available_at <= ? "
+                    "ORDER BY priority, available_at LIMIT ?", (now, limit)).fetchall()
+                self._conn.executemany(
+                    "UPDATE frontier SET state = 'leased', attempts = attempts + 1, available_at = ?, lease_id = ?, "
+                    "worker_id = ? WHERE kind = ? AND key = ?",
+                    [(now + lease_seconds, lease_id, worker_id, kind, key) for kind, key, _, _, _ in rows])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [FrontierTask(kind, key, json.loads(payload), priority, attempts + 1, lease_id)
+                for kind, key, payload, priority, attempts in rows]
+
+    def ack(self, task: FrontierTask):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE frontier SET state = 'done', error = NULL WHERE kind = ? AND key = ? AND lease_id = ?",
+                (task.kind, task.key, task.lease_id))
+
+    def nack(self, task: FrontierTask, error: str):
+        with self._lock:
+            if task.attempts >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE frontier SET state = 'dead', error = ? WHERE kind = ? AND key = ? AND lease_id = ?",
+                    (error, task.kind, task.key, task.lease_id))
+            else:
+                retry_at = time.time() + self.retry_delay * 2 ** (task.attempts - 1)
+                self._conn.execute(
+                    "UPDATE frontier SET state = 'pending', available_at = ?, error = ? "
+                    "WHERE kind = ? AND key = ? AND lease_id = ?",
+                    (retry_at, error, task.kind, task.key, task.lease_id))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall()
+        counts = {"pending": 0, "leased": 0, "done": 0, "dead": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, key, attempts, worker_id, error FROM frontier WHERE state = 'dead' LIMIT ?",
+                (limit,)).fetchall()
+        return [{"kind": kind, "key": key, "attempts": attempts, "worker_id": worker_id, "error": error}
+                for kind, key, attempts, worker_id, error in rows]
+
+    def requeue_dead(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE frontier SET state = 'pending', attempts = 0, available_at = ? WHERE state = 'dead'",
+                (time.time(),))
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FrontierHandler(BaseHTTPRequestHandler):
+    """
+    JSON over HTTP access to a frontier: POST /push, /lease, /ack, /nack, /requeue_dead, GET /stats, /dead_letters
+    """
+    frontier: Frontier = None
+
+    def _reply(self, result):
+        body = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(self.frontier.stats())
+        elif self.path == "/dead_letters":
+            self._reply(self.frontier.dead_letters())
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/push":
+            self._reply(self.frontier.push([FrontierTask(**task) for task in request["tasks"]]))
+        elif self.path == "/lease":
+            tasks = self.frontier.lease(request["worker_id"], request["limit"], request["lease_seconds"])
+            self._reply([task_to_dict(task) for task in tasks])
+        elif self.path == "/ack":
+            self._reply(self.frontier.ack(FrontierTask(**request["task"])))
+        elif self.path == "/nack":
+            self._reply(self.frontier.nack(FrontierTask(**request["task"]), request["error"]))
+        elif self.path == "/requeue_dead":
+            self._reply(self.frontier.requeue_dead())
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def task_to_dict(task: FrontierTask) -> Dict:
+    return {"kind": task.kind, "key": task.key, "payload": task.payload, "priority": task.priority,
+            "attempts": task.attempts, "lease_id": task.lease_id}
+
+
+def serve_frontier(frontier: Frontier, host: str = "0.0.0.0", port: int = FRONTIER_PORT) -> ThreadingHTTPServer:
+    """
+    Share a frontier with the workers of other machines, run server.serve_forever() to serve it
+    :param frontier: usually a SQLiteFrontier
+    :param host: listen address
+    :param port: 0 for a random port
+    :return:
+    """
+    handler = type("FrontierHandler", (FrontierHandler,), {"frontier": frontier})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+class RemoteFrontier(Frontier):
+    """
+    Client of a frontier shared by serve_frontier(), used by the workers of the other machines
+    """
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        """
+        :param base_url: e.g. http://crawler-1:8765
+        :param timeout: seconds of one frontier call
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def _post(self, path: str, request: Dict):
+        response = self._session.post(self.base_url + path, json=request, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _get(self, path: str):
+        response = self._session.get(self.base_url + path, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def push(self, tasks: List[FrontierTask]) -> int:
+        return self._post("/push", {"tasks": [task_to_dict(task) for task in tasks]})
+
+    def lease(self, worker_id: str, limit: int, lease_seconds: float = LEASE_SECONDS) -> List[FrontierTask]:
+        tasks = self._post("/lease", {"worker_id": worker_id, "limit": limit, "lease_seconds": lease_seconds})
+        return [FrontierTask(**task) for task in tasks]
+
+    def ack(self, task: FrontierTask):
+        self._post("/ack", {"task": task_to_dict(task)})
+
+    def nack(self, task: FrontierTask, error: str):
+        self._post("/nack", {"task": task_to_dict(task), "error": error})
+
+    def stats(self) -> Dict[str, int]:
+        return self._get("/stats")
+
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        return self._get("/dead_letters")[:limit]
+
+    def requeue_dead(self) -> int:
+        return self._post("/requeue_dead", {})
+
+    def close(self):
+        self._session.close()
+
+
+def open_frontier(location: str) -> Frontier:
+    """
+    Frontier from a command line location
+    :param location: http://host:port for a served frontier, otherwise a sqlite file path
+    :return:
+    """
+    if location.startswith(("http://", "https://")):
+        return RemoteFrontier(location)
+    return SQLiteFrontier(location)
+
+
+def index_task(board: str, page_number: int) -> FrontierTask:
+    # index pages after the articles, the frontier stays small and posts flow from the start
+    return FrontierTask("index", f"{board}/{page_number}", {"board": board, "page_number": page_number}, priority=1)
+
+
+def article_task(board: str, article_id: str, post: Dict) -> FrontierTask:
+    return FrontierTask("article", f"{board}/{article_id}", {"board": board, "post": post}, priority=0)
+
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/22 15:00
+# @Desc    : Worker of a distributed board backfill: seeds the frontier with the index pages of a board, then any
+#            number of worker processes, on one machine or several, lease index pages and articles from it
+
+import argparse
+import asyncio
+import os
+import socket
+from typing import List, Optional, Set
+
+import httpx
+
+import asyn_crawler
+from asyn_crawler import fetch_bbs_post_detail, fetch_bbs_posts_page, get_latest_page_number
+from common import PostContent, PostContentDetail, dataclass_to_dict, get_article_id, is_fetched
+from crawler_kit.metrics import metrics
+from crawler_kit.throttle import Politeness
+from frontier import FRONTIER_PORT, LEASE_SECONDS, Frontier, FrontierTask, article_task, index_task, open_frontier, \
+    serve_frontier
+from http_client import create_async_client
+from storage import JsonlPostSink
+
+FRONTIER_PATH = "ptt_frontier.db"  # sqlite frontier, or http://host:port of a served one
+WORKER_CONCURRENCY = 10  # tasks of one worker in flight
+IDLE_SLEEP = 1.0  # seconds between two lease attempts while the other workers still hold leases
+
+
+async def seed_board(client: httpx.AsyncClient, frontier: Frontier, board: str, pages: int) -> int:
+    """
+    Push the `pages` latest index pages of a board, the pages already in the frontier are ignored
+    :param client: shared http client
+    :param frontier:
+    :param board: board name
+    :param pages: index pages to crawl from the latest one
+    :return: number of new index pages
+    """
+    latest_number = await get_latest_page_number(client, board)
+    page_numbers = range(latest_number + 1, max(latest_number + 1 - pages, 0), -1)
+    return await asyncio.to_thread(frontier.push, [index_task(board, page_number) for page_number in page_numbers])
+
+
+async def process_task(client: httpx.AsyncClient, frontier: Frontier, task: FrontierTask,
+                       save_posts: List[PostContentDetail]):
+    """
+    Fetch one index page or article, ack it when done, nack it on failure
+    :param client: shared http client
+    :param frontier:
+    :param task: leased task
+    :param save_posts: data container of this worker
+    :return:
+    """
+    try:
+        board = task.payload["board"]
+        if task.kind == "index":
+            page_posts = await fetch_bbs_posts_page(client, task.payload["page_number"], board=board)
+            if not page_posts:
+                # a failed index page looks empty
+                raise Exception("empty index page")
+            # the articles already pushed by an earlier page or another backfill are ignored
+            await asyncio.to_thread(frontier.push, [
+                article_task(board, get_article_id(post_content.detail_link), dataclass_to_dict(post_content))
+                for post_content in page_posts if post_content.detail_link])
+        else:
+            post_content_detail = await fetch_bbs_post_detail(client, PostContent(**task.payload["post"]))
+            if not is_fetched(post_content_detail):
+                raise Exception("article not fetched")
+            save_posts.append(post_content_detail)
+        await asyncio.to_thread(frontier.ack, task)
+        metrics.inc("frontier_tasks_total", kind=task.kind, result="done")
+    except Exception as e:
+        print(f"Task {task.kind} {task.key} failed, attempt {task.attempts}, reason: {e!r}")
+        await asyncio.to_thread(frontier.nack, task, repr(e))
+        metrics.inc("frontier_tasks_total", kind=task.kind, result="failed")
+
+
+async def work(client: httpx.AsyncClient, frontier: Frontier, save_posts: List[PostContentDetail],
+               worker_id: str, concurrency: int = WORKER_CONCURRENCY, lease_seconds: float = LEASE_SECONDS,
+               exit_when_idle: bool = True):
+    """
+    Lease tasks and keep `concurrency` of them in flight until the frontier is drained
+    :param client: shared http client
+    :param frontier:
+    :param save_posts: data container of this worker
+    :param worker_id: name of the worker in the frontier
+    :param concurrency: tasks in flight
+    :param lease_seconds: time to finish a task before it is handed to another worker
+    :param exit_when_idle: stop once nothing is pending or leased, otherwise wait for new tasks forever
+    :return:
+    """
+    running: Set[asyncio.Task] = set()
+    try:
+        while True:
+            if len(running) < concurrency:
+                tasks = await asyncio.to_thread(frontier.lease, worker_id, concurrency - len(running), lease_seconds)
+                for task in tasks:
+                    running.add(asyncio.ensure_future(process_task(client, frontier, task, save_posts)))
+            if running:
+                _, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            stats = await asyncio.to_thread(frontier.stats)
+            if exit_when_idle and not stats["pending"] and not stats["leased"]:
+                return
+            # the other workers hold the remaining tasks, or the failed ones wait for their retry
+            await asyncio.sleep(IDLE_SLEEP)
+    finally:
+        for running_task in running:
+            running_task.cancel()
+
+
+async def run_worker(frontier: Frontier, save_posts: List[PostContentDetail], worker_id: str,
+                     concurrency: int = WORKER_CONCURRENCY, seed_boards: Optional[List[str]] = None,
+                     seed_pages: int = 0):
+    """
+    Worker main function
+    :param frontier:
+    :param save_posts: data container of this worker, e.g. a storage.JsonlPostSink of its own
+    :param worker_id: name of the worker in the frontier
+    :param concurrency: tasks in flight
+    :param seed_boards: boards to seed before working
+    :param seed_pages: index pages of every seeded board
+    :return:
+    """
+    metrics.reset()
+    politeness = Politeness(rate=asyn_crawler.HOST_RATE_LIMIT, initial_concurrency=concurrency,
+                            max_concurrency=concurrency)
+    async with create_async_client(max_connections=concurrency, politeness=politeness) as client:
+        for board in seed_boards or []:
+            print(f"Seeded {board}: {await seed_board(client, frontier, board, seed_pages)} new index pages")
+        await work(client, frontier, save_posts, worker_id, concurrency)
+    print(f"Worker {worker_id} completed, total posts: ", len(save_posts))
+    print("Frontier: ", frontier.stats())
+    print("Politeness: ", politeness.stats())
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Distributed PTT backfill over a shared frontier")
+    arg_parser.add_argument("command", choices=["work", "serve", "stats", "dead", "requeue"],
+                            help="work: fetch tasks, serve: share a sqlite frontier over http, stats / dead / requeue: "
+                                 "inspect the frontier and retry the dead letters")
+    arg_parser.add_argument("--frontier", default=FRONTIER_PATH, help="sqlite file or http://host:port")
+    arg_parser.add_argument("--seed", nargs="*", default=[], metavar="BOARD", help="boards to seed before working")
+    arg_parser.add_argument("--pages", type=int, default=asyn_crawler.FIRST_N_PAGE, help="index pages per seeded board")
+    arg_parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="tasks in flight")
+    arg_parser.add_argument("--port", type=int, default=FRONTIER_PORT, help="port of serve")
+    args = arg_parser.parse_args()
+
+    with open_frontier(args.frontier) as shared_frontier:
+        if args.command == "serve":
+            frontier_server = serve_frontier(shared_frontier, port=args.port)
+            print(f"Frontier {args.frontier} served on port {args.port}, press Ctrl+C to stop...")
+            try:
+                frontier_server.serve_forever()
+            except KeyboardInterrupt:
+                frontier_server.shutdown()
+        elif args.command == "stats":
+            print(shared_frontier.stats())
+        elif args.command == "dead":
+            for dead_letter in shared_frontier.dead_letters():
+                print(dead_letter)
+        elif args.command == "requeue":
+            print("Requeued: ", shared_frontier.requeue_dead())
+        else:
+            # one output file per worker, the posts are merged downstream
+            name = f"{socket.gethostname()}-{os.getpid()}"
+            asyn_crawler.VERBOSE = False
+            with JsonlPostSink(f"ptt_posts.{name}.jsonl") as posts_sink:
+                asyncio.run(run_worker(shared_frontier, posts_sink, name, args.concurrency, args.seed, args.pages))
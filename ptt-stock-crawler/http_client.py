@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/03 14:20
+# @Desc    : Long-lived pooled HTTP clients shared by all requests of one crawl run
+
+import importlib.util
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util.retry import Retry
+
+from crawler_kit.http_cache import CacheEntry, CachingTransport, ResponseCache, decoded_headers
+from crawler_kit.replay import Cassette, RecordingTransport
+from crawler_kit.throttle import MAX_RETRIES, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX, RETRY_STATUS_CODES, \
+    FairShareTransport, FairSlots, Politeness, PoliteTransport
+
+MAX_CONNECTIONS = 20  # max number of open connections
+MAX_KEEPALIVE_CONNECTIONS = 10  # max number of idle connections kept alive
+KEEPALIVE_EXPIRY = 30.0  # seconds an idle connection is kept alive
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+}
+# adult boards such as Gossiping redirect to the /ask/over18 page without it
+COOKIES = {"over18": "1"}
+
+
+def http2_available() -> bool:
+    """
+    httpx only speaks HTTP/2 when the optional h2 package is installed (pip install httpx[http2])
+    :return:
+    """
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_async_client(max_connections: int = MAX_CONNECTIONS,
+                        max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry: float = KEEPALIVE_EXPIRY,
+                        cache: Optional[ResponseCache] = None,
+                        politeness: Optional[Politeness] = None,
+                        fair_slots: Optional[FairSlots] = None,
+                        recorder: Optional[Cassette] = None) -> httpx.AsyncClient:
+    """
+    Create the async client used for a whole crawl run, use it as `async with create_async_client() as client`
+    :param max_connections: max number of open connections
+    :param max_keepalive_connections: max number of idle connections kept alive
+    :param keepalive_expiry: seconds an idle connection is kept alive
+    :param cache: optional on-disk response cache, closed with the client
+    :param politeness: optional rate limit / adaptive concurrency / retry state, cache hits do not go through it
+    :param fair_slots: optional global budget shared in round robin by the crawls using the client, e.g. one per board
+    :param recorder: optional cassette storing every response received from the network, see replay.py
+    :return:
+    """
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                          keepalive_expiry=keepalive_expiry)
+    transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport(limits=limits, http2=http2_available())
+    if recorder is not None:
+        transport = RecordingTransport(transport, recorder)
+    if politeness is not None:
+        transport = PoliteTransport(transport, politeness)
+    if fair_slots is not None:
+        transport = FairShareTransport(transport, fair_slots)
+    if cache is not None:
+        transport = CachingTransport(transport, cache)
+    return httpx.AsyncClient(headers=HEADERS, cookies=COOKIES, transport=transport)
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    requests adapter answering from a ResponseCache and revalidating stale entries with conditional requests
+    """
+
+    def __init__(self, cache: ResponseCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method not in self.cache.methods:
+            return super().send(request, **kwargs)
+
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else (request.body or b"")
+        cache_key = self.cache.make_key(request.method, request.url, body)
+        entry = self.cache.load(cache_key)
+        if entry is not None:
+            if self.cache.is_fresh(entry):
+                self.cache.hits += 1
+                self.cache.bytes_saved += len(entry.body)
+                self.cache.touch(cache_key)
+                return self._from_entry(entry, request)
+            request.headers.update(entry.conditional_headers())
+
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self.cache.revalidated += 1
+            self.cache.bytes_saved += len(entry.body)
+            self.cache.touch(cache_key, refreshed=True)
+            return self._from_entry(entry, request)
+
+        self.cache.misses += 1
+        # requests already decoded the body
+        headers = decoded_headers(response.headers.items())
+        if response.status_code == 200 and self.cache.is_storable(headers):
+            self.cache.store(cache_key, response.status_code, headers, response.content)
+        elif entry is not None:
+            self.cache.discard(cache_key)
+        return response
+
+    def close(self):
+        super().close()
+        self.cache.close()
+
+    @staticmethod
+    def _from_entry(entry: CacheEntry, request: requests.PreparedRequest) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry.status_code
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response._content = entry.body
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        return response
+
+
+def create_sync_session(max_connections: int = MAX_CONNECTIONS,
+                        cache: Optional[ResponseCache] = None) -> requests.Session:
+    """
+    Create the requests session used for a whole crawl run, use it as `with create_sync_session() as session`
+    :param max_connections: max number of connections kept in the pool
+    :param cache: optional on-disk response cache, closed with the session
+    :return:
+    """
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.cookies.update(COOKIES)
+    # the sequential crawler only needs the retries of the politeness layer: jittered backoff and Retry-After
+    retries = Retry(total=MAX_RETRIES, status_forcelist=RETRY_STATUS_CODES, backoff_factor=RETRY_BACKOFF_BASE,
+                    backoff_max=RETRY_BACKOFF_MAX, backoff_jitter=RETRY_BACKOFF_BASE, raise_on_status=False)
+    if cache is not None:
+        adapter = CachingAdapter(cache, pool_connections=1, pool_maxsize=max_connections, max_retries=retries)
+    else:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
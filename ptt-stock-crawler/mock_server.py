@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/02 10:30
+# @Desc    : Local mock PTT server, used to benchmark the crawlers without hitting https://www.ptt.cc
+
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+LATEST_PAGE = 7084  # page number the "上頁" link of index.html points to
+POSTS_PER_PAGE = 20  # r-ent rows per index page
+COMMENTS_PER_POST = 30  # push rows per article page
+
+
+def render_index_page(board: str, page_number: int, posts_per_page: int = POSTS_PER_PAGE) -> str:
+    """
+    Render an index page with the same markup as https://www.ptt.cc/bbs/<board>/index<N>.html
+    :param board: board name
+    :param page_number: page number
+    :param posts_per_page: number of r-ent rows
+    :return:
+    """
+    rows = []
+    for i in range(posts_per_page):
+        article_id = f"M.{1711500000 + page_number * 100 + i}.A.{i:03X}"
+        rows.append(f"""
+        <div class="r-ent">
+            <div class="nrec"><span class="hl f3">{i % 50}</span></div>
+            <div class="title">
+                <a href="/bbs/{board}/{article_id}.html">[新聞] 第{page_number}頁 第{i}篇 測試文章標題</a>
+            </div>
+            <div class="meta">
+                <div class="author">user{i:04d}</div>
+                <div class="article-menu"><div class="trigger">⋯</div></div>
+                <div class="date"> 3/27</div>
+                <div class="mark"></div>
+            </div>
+        </div>""")
+    return f"""<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>看板 {board} 文章列表 - 批踢踢實業坊</title></head>
+<body>
+<div id="action-bar-container">
+    <div class="action-bar">
+        <div class="btn-group btn-group-dir">
+            <a class="btn selected" href="/bbs/{board}/index.html">看板</a>
+        </div>
+        <div class="btn-group btn-group-paging">
+            <a class="btn wide" href="/bbs/{board}/index1.html">最舊</a>
+            <a class="btn wide" href="/bbs/{board}/index{page_number - 1}.html">&lsaquo; 上頁</a>
+            <a class="btn wide" href="/bbs/{board}/index{page_number + 1}.html">下頁 &rsaquo;</a>
+            <a class="btn wide" href="/bbs/{board}/index.html">最新</a>
+        </div>
+    </div>
+</div>
+<div id="main-container">
+    <div class="r-list-container action-bar-margin bbs-screen">{"".join(rows)}
+    </div>
+</div>
+</body>
+</html>"""
+
+
+def render_article_page(board: str, article_id: str, comments_count: int = COMMENTS_PER_POST) -> str:
+    """
+    Render an article page with the same markup as https://www.ptt.cc/bbs/<board>/<article_id>.html
+    :param board: board name
+    :param article_id: article id, e.g. M.1711544298.A.9F8
+    :param comments_count: number of push rows
+    :return:
+    """
+    push_tags = ["推 ", "噓 ", "→ "]
+    pushes = []
+    for i in range(comments_count):
+        pushes.append(
+            f'<div class="push"><span class="hl push-tag">{push_tags[i % 3]}</span>'
+            f'<span class="f3 hl push-userid">pusher{i:04d}</span>'
+            f'<span class="f3 push-content">: 第{i}則推文內容</span>'
+            f'<span class="push-ipdatetime"> 03/27 21:{i % 60:02d}\n</span></div>'
+        )
+    body = "\n".join(f"文章 {article_id} 的第{i}行內文，這是一段測試用的文字。" for i in range(20))
+    return f"""<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>測試文章 - 看板 {board} - 批踢踢實業坊</title></head>
+<body>
+<div id="main-container">
+<div id="main-content" class="bbs-screen bbs-content"><div class="article-metaline"><span class="article-meta-tag">作者</span><span class="article-meta-value">author (nick)</span></div><div class="article-metaline-right"><span class="article-meta-tag">看板</span><span class="article-meta-value">{board}</span></div><div class="article-metaline"><span class="article-meta-tag">標題</span><span class="article-meta-value">[新聞] 測試文章標題</span></div><div class="article-metaline"><span class="article-meta-tag">時間</span><span class="article-meta-value">Wed Mar 27 21:18:16 2024</span></div>
+{body}
+
+--
+<span class="f2">※ 發信站: 批踢踢實業坊(ptt.cc), 來自: 127.0.0.1 (臺灣)
+</span><span class="f2">※ 文章網址: <a href="https://www.ptt.cc/bbs/{board}/{article_id}.html" target="_blank" rel="noopener noreferrer nofollow">https://www.ptt.cc/bbs/{board}/{article_id}.html</a>
+</span>{"".join(pushes)}</div>
+</div>
+</body>
+</html>"""
+
+
+class MockPttServer(ThreadingHTTPServer):
+    """
+    Threading server with a listen backlog large enough for the concurrent crawlers
+    """
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class MockPttHandler(BaseHTTPRequestHandler):
+    """
+    Serve index and article pages of any board, sleeping `latency` seconds per request
+    """
+    latency: float = 0.0
+    latest_page: int = LATEST_PAGE
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        # path: /bbs/<board>/index.html, /bbs/<board>/index<N>.html or /bbs/<board>/<article_id>.html
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "bbs" or not parts[2].endswith(".html"):
+            self.send_error(404)
+            return
+        board, page_name = parts[1], parts[2][:-len(".html")]
+        if page_name == "index":
+            html = render_index_page(board, self.latest_page + 1)
+        elif page_name.startswith("index") and page_name[len("index"):].isdigit():
+            html = render_index_page(board, int(page_name[len("index"):]))
+        elif page_name.startswith("M."):
+            html = render_article_page(board, page_name)
+        else:
+            self.send_error(404)
+            return
+
+        body = html.encode("utf-8")
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # keep the benchmark output clean
+        pass
+
+
+def start_mock_server(latency: float = 0.05, latest_page: int = LATEST_PAGE) -> Tuple[MockPttServer, str]:
+    """
+    Start the mock server on a random local port in a daemon thread
+    :param latency: seconds to sleep before answering each request
+    :param latest_page: page number the "上頁" link of index.html points to
+    :return: (server, base host), call server.shutdown() to stop it
+    """
+    handler = type("MockPttHandler", (MockPttHandler,), {"latency": latency, "latest_page": latest_page})
+    server = MockPttServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    mock_server, base_host = start_mock_server()
+    print(f"Mock PTT server is running on {base_host}, press Ctrl+C to stop...")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock_server.shutdown()
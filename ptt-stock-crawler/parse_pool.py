@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/15 10:00
+# @Desc    : Parse stage of the async crawler, runs the parser backend in a process or thread pool so long pages
+#            do not block the event loop
+
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+from common import PostContent, PostContentDetail
+from crawler_kit.metrics import metrics
+from parser_backends import get_parser_backend
+
+
+def _parse_post_list(backend_name: str, content: bytes, encoding: str) -> List[PostContent]:
+    return get_parser_backend(backend_name).parse_post_list_bytes(content, encoding)
+
+
+def _parse_post_detail(backend_name: str, content: bytes, encoding: str) -> PostContentDetail:
+    return get_parser_backend(backend_name).parse_post_detail_bytes(content, encoding)
+
+
+def _timed_parse(parse_func, backend_name: str, content: bytes, encoding: str):
+    # timed in the worker, the metrics of a child process are not seen by the crawler
+    start = time.perf_counter()
+    result = parse_func(backend_name, content, encoding)
+    return result, time.perf_counter() - start
+
+
+class ParsePool:
+    """
+    Decodes and parses the downloaded pages, inline when workers is 0, otherwise in a pool of `workers`
+    processes (or threads for a parser releasing the GIL). At most `max_pending` pages wait for the pool,
+    the fetch coroutines handing over more pages wait for a free place. The parse time is observed as
+    parse_seconds and the time a page waited for a place and a free worker as parse_queue_seconds.
+    """
+
+    def __init__(self, backend_name: str, workers: int = 0, executor: str = "process",
+                 max_pending: Optional[int] = None):
+        """
+        :param backend_name: parser backend, see parser_backends.PARSER_BACKENDS
+        :param workers: number of processes or threads, 0 parses in the event loop
+        :param executor: "process" or "thread"
+        :param max_pending: max number of pages handed over and not parsed yet, defaults to 2 per worker
+        """
+        get_parser_backend(backend_name)
+        if executor not in ("process", "thread"):
+            raise ValueError(f"Unknown parse executor: {executor}, choose from process, thread")
+        self.backend_name = backend_name
+        self.workers = workers
+        self.executor: Optional[Executor] = None
+        if workers > 0:
+            pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+            self.executor = pool_class(max_workers=workers)
+        self._pending = asyncio.Semaphore(max_pending or max(1, workers) * 2)
+
+    async def parse_post_list(self, content: bytes, encoding: str = "utf-8") -> List[PostContent]:
+        """
+        Parse an index page
+        :param content: raw response body
+        :param encoding: page encoding, see common.page_encoding
+        :return:
+        """
+        return await self._run(_parse_post_list, content, encoding, "index")
+
+    async def parse_post_detail(self, content: bytes, encoding: str = "utf-8") -> PostContentDetail:
+        """
+        Parse an article page
+        :param content: raw response body
+        :param encoding: page encoding, see common.page_encoding
+        :return:
+        """
+        return await self._run(_parse_post_detail, content, encoding, "article")
+
+    async def _run(self, parse_func, content: bytes, encoding: str, page_type: str):
+        if self.executor is None:
+            with metrics.timer("parse_seconds", page_type=page_type):
+                return parse_func(self.backend_name, content, encoding)
+        handed_at = time.perf_counter()
+        async with self._pending:
+            result, parse_seconds = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _timed_parse, parse_func, self.backend_name, content, encoding)
+        metrics.observe("parse_seconds", parse_seconds, page_type=page_type)
+        metrics.observe("parse_queue_seconds", time.perf_counter() - handed_at - parse_seconds, page_type=page_type)
+        return result
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
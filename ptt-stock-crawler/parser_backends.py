@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/05 14:00
+# @Desc    : Pluggable html parser backends, the crawlers pick one by name with get_parser_backend()
+
+import threading
+from typing import Dict, Iterator, List, Optional, Type
+
+import lxml.html
+from bs4 import BeautifulSoup
+from parsel import Selector
+
+from common import PostComment, PostContent, PostContentDetail
+from extractor import iter_push_comments, parse_post_list, parse_post_list_tree, parse_push_comments
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # selectolax is optional, pip install selectolax
+    LexborHTMLParser = None
+
+# lxml parsers of the bytes fast path by encoding, one set per thread as a parser must not be shared between threads
+_thread_parsers = threading.local()
+
+
+class ParserBackend:
+    """
+    Base class of the parser backends, every backend extracts the same fields from the same pages
+    """
+    name: str = ""
+
+    def parse_post_list(self, html_content: str) -> List[PostContent]:
+        """
+        Extract every post row of an index page
+        :param html_content: html source code of the index page
+        :return:
+        """
+        raise NotImplementedError
+
+    def parse_post_content(self, html_content: str) -> str:
+        """
+        Extract the article body, the text between the last meta line and the first push
+        :param html_content: html source code of the article page
+        :return:
+        """
+        raise NotImplementedError
+
+    def parse_post_comments(self, html_content: str) -> List[PostComment]:
+        """
+        Extract the push comments of an article
+        :param html_content: html source code of the article page
+        :return:
+        """
+        raise NotImplementedError
+
+    def parse_post_detail(self, html_content: str) -> PostContentDetail:
+        """
+        Extract publish date, body and comments of an article, backends override it to parse the page only once
+        :param html_content: html source code of the article page
+        :return:
+        """
+        post_content_detail = PostContentDetail()
+        post_content_detail.content = self.parse_post_content(html_content)
+        post_content_detail.post_comments = self.parse_post_comments(html_content)
+        return post_content_detail
+
+    def parse_post_list_bytes(self, content: bytes, encoding: str) -> List[PostContent]:
+        """
+        Extract every post row of an index page from the raw response body, the encoding is not sniffed
+        :param content: raw body of the index page
+        :param encoding: page encoding, see common.page_encoding
+        :return:
+        """
+        return self.parse_post_list(content.decode(encoding, errors="replace"))
+
+    def parse_post_detail_bytes(self, content: bytes, encoding: str) -> PostContentDetail:
+        """
+        Extract publish date, body and comments of an article from the raw response body, backends override it to
+        decode while parsing instead of building the whole page as a python str first
+        :param content: raw body of the article page
+        :param encoding: page encoding, see common.page_encoding
+        :return:
+        """
+        return self.parse_post_detail(content.decode(encoding, errors="replace"))
+
+    def iter_post_comments_bytes(self, content: bytes, encoding: str) -> Iterator[PostComment]:
+        """
+        Iterate the push comments of an article from the raw response body, backends override it to stream the rows
+        instead of building the whole comment list first
+        :param content: raw body of the article page
+        :param encoding: page encoding, see common.page_encoding
+        :return:
+        """
+        return iter(self.parse_post_comments(content.decode(encoding, errors="replace")))
+
+
+class Bs4Backend(ParserBackend):
+    """
+    BeautifulSoup on top of lxml, css selectors
+    """
+    name = "bs4"
+
+    def parse_post_list(self, html_content: str) -> List[PostContent]:
+        posts_list: List[PostContent] = []
+        soup = BeautifulSoup(html_content, "lxml")
+        for post_element in soup.select("div.r-ent"):
+            post_content = PostContent()
+            title_link = post_element.select_one("div.title a")
+            if title_link is not None:
+                post_content.title = title_link.text.strip()
+                post_content.detail_link = title_link.get("href", "")
+            author = post_element.select_one("div.meta div.author")
+            if author is not None:
+                post_content.author = author.text.strip()
+            publish_date = post_element.select_one("div.meta div.date")
+            if publish_date is not None:
+                post_content.publish_date = publish_date.text.strip()
+            push_count = post_element.select_one("div.nrec")
+            if push_count is not None:
+                post_content.push_count = push_count.text.strip()
+            posts_list.append(post_content)
+        return posts_list
+
+    def parse_post_content(self, html_content: str) -> str:
+        return self._content_from_soup(BeautifulSoup(html_content, "lxml"))
+
+    def parse_post_comments(self, html_content: str) -> List[PostComment]:
+        return self._comments_from_soup(BeautifulSoup(html_content, "lxml"))
+
+    def parse_post_detail(self, html_content: str) -> PostContentDetail:
+        soup = BeautifulSoup(html_content, "lxml")
+        post_content_detail = PostContentDetail()
+        publish_date = soup.select_one("#main-content > div:nth-child(4) > span.article-meta-value")
+        if publish_date is not None:
+            post_content_detail.publish_date = publish_date.text
+        post_content_detail.content = self._content_from_soup(soup)
+        post_content_detail.post_comments = self._comments_from_soup(soup)
+        return post_content_detail
+
+    @staticmethod
+    def _content_from_soup(soup: BeautifulSoup) -> str:
+        current_ele = soup.select_one("#main-content > div:nth-child(4)")
+        if current_ele is None:
+            return ""
+        texts: List[str] = []
+        while current_ele.next_sibling:
+            current_ele = current_ele.next_sibling
+            if current_ele.name == "div":
+                break
+            texts.append(current_ele.get_text())
+        return "".join(texts)
+
+    @staticmethod
+    def _comments_from_soup(soup: BeautifulSoup) -> List[PostComment]:
+        post_comments: List[PostComment] = []
+        for comment_element in soup.select("#main-content > div.push"):
+            spans = comment_element.find_all("span", recursive=False)
+            if len(spans) < 4:
+                continue
+            post_comments.append(PostComment(comment_user_name=spans[1].text.strip(),
+                                             comment_content=spans[2].text.strip().replace(": ", ""),
+                                             comment_time=spans[3].text.strip(),
+                                             push_tag=spans[0].text.strip()))
+        return post_comments
+
+
+class ParselBackend(ParserBackend):
+    """
+    parsel, XPath over lxml
+    """
+    name = "parsel"
+
+    def parse_post_list(self, html_content: str) -> List[PostContent]:
+        posts_list: List[PostContent] = []
+        for row in Selector(text=html_content).xpath("//div[@class='r-ent']"):
+            post_content = PostContent()
+            title_link = row.xpath("./div[@class='title']/a")
+            if title_link:
+                post_content.title = "".join(title_link[0].xpath(".//text()").getall()).strip()
+                post_content.detail_link = title_link[0].attrib.get("href", "")
+            post_content.author = "".join(
+                row.xpath("./div[@class='meta']/div[@class='author']//text()").getall()).strip()
+            post_content.publish_date = "".join(
+                row.xpath("./div[@class='meta']/div[@class='date']//text()").getall()).strip()
+            post_content.push_count = "".join(row.xpath("./div[@class='nrec']//text()").getall()).strip()
+            posts_list.append(post_content)
+        return posts_list
+
+    def parse_post_content(self, html_content: str) -> str:
+        return self._content_from_selector(Selector(text=html_content))
+
+    def parse_post_comments(self, html_content: str) -> List[PostComment]:
+        return self._comments_from_selector(Selector(text=html_content))
+
+    def parse_post_detail(self, html_content: str) -> PostContentDetail:
+        selector = Selector(text=html_content)
+        post_content_detail = PostContentDetail()
+        post_content_detail.publish_date = "".join(selector.xpath(
+            "//div[@id='main-content']/*[4][self::div]/span[@class='article-meta-value']//text()").getall())
+        post_content_detail.content = self._content_from_selector(selector)
+        post_content_detail.post_comments = self._comments_from_selector(selector)
+        return post_content_detail
+
+    @staticmethod
+    def _content_from_selector(selector: Selector) -> str:
+        # text nodes after the 4th child, up to the first div sibling
+        last_meta = selector.xpath("//div[@id='main-content']/*[4][self::div]")
+        if not last_meta:
+            return ""
+        texts: List[str] = []
+        for sibling in last_meta[0].xpath("./following-sibling::node()"):
+            # text node selectors wrap the plain string
+            if isinstance(sibling.root, str):
+                texts.append(sibling.root)
+                continue
+            if sibling.xpath("self::div"):
+                break
+            texts.append("".join(sibling.xpath(".//text()").getall()))
+        return "".join(texts)
+
+    @staticmethod
+    def _comments_from_selector(selector: Selector) -> List[PostComment]:
+        post_comments: List[PostComment] = []
+        for comment_element in selector.xpath("//div[@id='main-content']/div[contains(concat(' ', normalize-space(@class), ' '), ' push ')]"):
+            spans = [("".join(span.xpath(".//text()").getall())) for span in comment_element.xpath("./span")]
+            if len(spans) < 4:
+                continue
+            post_comments.append(PostComment(comment_user_name=spans[1].strip(),
+                                             comment_content=spans[2].strip().replace(": ", ""),
+                                             comment_time=spans[3].strip(),
+                                             push_tag=spans[0].strip()))
+        return post_comments
+
+
+class LxmlBackend(ParserBackend):
+    """
+    Raw lxml.html, ElementPath lookups on the parsed tree
+    """
+    name = "lxml"
+
+    def parse_post_list(self, html_content: str) -> List[PostContent]:
+        return parse_post_list(html_content)
+
+    def parse_post_content(self, html_content: str) -> str:
+        return self._content_from_tree(lxml.html.fromstring(html_content))
+
+    def parse_post_comments(self, html_content: str) -> List[PostComment]:
+        return self._comments_from_tree(lxml.html.fromstring(html_content))
+
+    def parse_post_detail(self, html_content: str) -> PostContentDetail:
+        return self._detail_from_tree(lxml.html.fromstring(html_content))
+
+    def parse_post_list_bytes(self, content: bytes, encoding: str) -> List[PostContent]:
+        tree = self._tree_from_bytes(content, encoding)
+        if tree is None:
+            return super().parse_post_list_bytes(content, encoding)
+        return parse_post_list_tree(tree)
+
+    def parse_post_detail_bytes(self, content: bytes, encoding: str) -> PostContentDetail:
+        tree = self._tree_from_bytes(content, encoding)
+        if tree is None:
+            return super().parse_post_detail_bytes(content, encoding)
+        return self._detail_from_tree(tree)
+
+    def iter_post_comments_bytes(self, content: bytes, encoding: str) -> Iterator[PostComment]:
+        if self._parser_for(encoding) is None:
+            return super().iter_post_comments_bytes(content, encoding)
+        return iter_push_comments(content, encoding)
+
+    def _tree_from_bytes(self, content: bytes, encoding: str) -> Optional[lxml.html.HtmlElement]:
+        # libxml2 decodes while parsing, invalid bytes become U+FFFD like errors="replace"
+        parser = self._parser_for(encoding)
+        if parser is None:
+            return None
+        return lxml.html.fromstring(content, parser=parser)
+
+    @staticmethod
+    def _parser_for(encoding: str) -> Optional[lxml.html.HTMLParser]:
+        parsers = getattr(_thread_parsers, "parsers", None)
+        if parsers is None:
+            parsers = _thread_parsers.parsers = {}
+        parser = parsers.get(encoding)
+        if parser is None:
+            try:
+                parser = parsers[encoding] = lxml.html.HTMLParser(encoding=encoding)
+            except LookupError:
+                # a codec python knows and libxml2 does not
+                return None
+        return parser
+
+    def _detail_from_tree(self, tree: lxml.html.HtmlElement) -> PostContentDetail:
+        post_content_detail = PostContentDetail()
+        last_meta = self._last_meta_element(tree)
+        if last_meta is not None:
+            publish_date = last_meta.find("span[@class='article-meta-value']")
+            if publish_date is not None:
+                post_content_detail.publish_date = publish_date.text_content()
+        post_content_detail.content = self._content_from_tree(tree)
+        post_content_detail.post_comments = self._comments_from_tree(tree)
+        return post_content_detail
+
+    @staticmethod
+    def _last_meta_element(tree: lxml.html.HtmlElement) -> Optional[lxml.html.HtmlElement]:
+        main_content = tree.find(".//div[@id='main-content']")
+        if main_content is None:
+            return None
+        # same as css "#main-content > div:nth-child(4)", comments are not counted
+        children = [child for child in main_content if isinstance(child.tag, str)]
+        if len(children) < 4 or children[3].tag != "div":
+            return None
+        return children[3]
+
+    def _content_from_tree(self, tree: lxml.html.HtmlElement) -> str:
+        current_ele = self._last_meta_element(tree)
+        if current_ele is None:
+            return ""
+        # lxml keeps the text following an element in its tail
+        texts: List[str] = [current_ele.tail or ""]
+        current_ele = current_ele.getnext()
+        while current_ele is not None and current_ele.tag != "div":
+            if isinstance(current_ele.tag, str):
+                texts.append(current_ele.text_content())
+            texts.append(current_ele.tail or "")
+            current_ele = current_ele.getnext()
+        return "".join(texts)
+
+    @staticmethod
+    def _comments_from_tree(tree: lxml.html.HtmlElement) -> List[PostComment]:
+        main_content = tree.find(".//div[@id='main-content']")
+        if main_content is None:
+            return []
+        return parse_push_comments(main_content)
+
+
+class SelectolaxBackend(ParserBackend):
+    """
+    selectolax with the lexbor engine, a C html parser without python tree objects
+    """
+    name = "selectolax"
+
+    def __init__(self):
+        if LexborHTMLParser is None:
+            raise ImportError("selectolax is not installed, run `pip install selectolax`")
+
+    def parse_post_list(self, html_content: str) -> List[PostContent]:
+        posts_list: List[PostContent] = []
+        for row in LexborHTMLParser(html_content).css("div.r-ent"):
+            post_content = PostContent()
+            title_link = row.css_first("div.title > a")
+            if title_link is not None:
+                post_content.title = title_link.text().strip()
+                post_content.detail_link = title_link.attributes.get("href") or ""
+            author = row.css_first("div.meta > div.author")
+            if author is not None:
+                post_content.author = author.text().strip()
+            publish_date = row.css_first("div.meta > div.date")
+            if publish_date is not None:
+                post_content.publish_date = publish_date.text().strip()
+            push_count = row.css_first("div.nrec")
+            if push_count is not None:
+                post_content.push_count = push_count.text().strip()
+            posts_list.append(post_content)
+        return posts_list
+
+    def parse_post_content(self, html_content: str) -> str:
+        return self._content_from_tree(LexborHTMLParser(html_content))
+
+    def parse_post_comments(self, html_content: str) -> List[PostComment]:
+        return self._comments_from_tree(LexborHTMLParser(html_content))
+
+    def parse_post_detail(self, html_content: str) -> PostContentDetail:
+        tree = LexborHTMLParser(html_content)
+        post_content_detail = PostContentDetail()
+        publish_date = tree.css_first("#main-content > div:nth-child(4) > span.article-meta-value")
+        if publish_date is not None:
+            post_content_detail.publish_date = publish_date.text()
+        post_content_detail.content = self._content_from_tree(tree)
+        post_content_detail.post_comments = self._comments_from_tree(tree)
+        return post_content_detail
+
+    @staticmethod
+    def _content_from_tree(tree) -> str:
+        current_ele = tree.css_first("#main-content > div:nth-child(4)")
+        if current_ele is None:
+            return ""
+        texts: List[str] = []
+        current_ele = current_ele.next
+        # text nodes show up as "-text" siblings
+        while current_ele is not None and current_ele.tag != "div":
+            texts.append(current_ele.text(deep=True))
+            current_ele = current_ele.next
+        return "".join(texts)
+
+    @staticmethod
+    def _comments_from_tree(tree) -> List[PostComment]:
+        post_comments: List[PostComment] = []
+        for comment_element in tree.css("#main-content > div.push"):
+            spans = comment_element.css("div.push > span")
+            if len(spans) < 4:
+                continue
+            post_comments.append(PostComment(comment_user_name=spans[1].text().strip(),
+                                             comment_content=spans[2].text().strip().replace(": ", ""),
+                                             comment_time=spans[3].text().strip(),
+                                             push_tag=spans[0].text().strip()))
+        return post_comments
+
+
+PARSER_BACKENDS: Dict[str, Type[ParserBackend]] = {
+    Bs4Backend.name: Bs4Backend,
+    ParselBackend.name: ParselBackend,
+    LxmlBackend.name: LxmlBackend,
+    SelectolaxBackend.name: SelectolaxBackend,
+}
+
+
+def get_parser_backend(name: str) -> ParserBackend:
+    """
+    Get a parser backend by name
+    :param name: one of PARSER_BACKENDS: bs4, parsel, lxml, selectolax
+    :return:
+    """
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend: {name}, choose from {list(PARSER_BACKENDS.keys())}")
+    return PARSER_BACKENDS[name]()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/11 10:00
+# @Desc    : On-disk index of the articles already crawled, used by the incremental crawl mode
+
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from common import PostContent, PostContentDetail, get_article_id, is_fetched
+
+COMMIT_EVERY = 100  # commit the index every N marked articles
+SATURATED_PUSH_COUNTS = ("爆", "XX")  # push counts that stop changing, only refreshed by age
+
+
+class SeenArticleIndex:
+    """
+    SQLite index keyed by article id (M.1711544298.A.9F8), storing the push count of the last fetch.
+    A detail page is fetched again only when the push count of the list page changed.
+    """
+
+    def __init__(self, db_path: str, refresh_after: Optional[float] = None):
+        """
+        :param db_path: sqlite file path
+        :param refresh_after: seconds after which an article with a saturated push count (爆, XX) is fetched again,
+                              None means never
+        """
+        self.refresh_after = refresh_after
+        self._uncommitted = 0
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen_articles (
+                article_id TEXT PRIMARY KEY,
+                push_count TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def lookup(self, article_ids: List[str]) -> Dict[str, tuple]:
+        """
+        Get (push_count, fetched_at) of the known articles
+        :param article_ids:
+        :return: article id -> (push_count, fetched_at)
+        """
+        seen: Dict[str, tuple] = {}
+        # stay below the sqlite host parameter limit
+        for start in range(0, len(article_ids), 500):
+            chunk = article_ids[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT article_id, push_count, fetched_at FROM seen_articles "
+                f"WHERE article_id IN ({','.join('?' * len(chunk))})", chunk)
+            for article_id, push_count, fetched_at in rows:
+                seen[article_id] = (push_count, fetched_at)
+        return seen
+
+    def filter_changed(self, post_list: List[PostContent], verbose: bool = False) -> List[PostContent]:
+        """
+        Keep the posts never fetched or whose push count changed since the last fetch
+        :param post_list: posts of the list pages
+        :param verbose: print how many posts are kept
+        :return:
+        """
+        post_list = [post_content for post_content in post_list if post_content.detail_link]
+        seen = self.lookup([get_article_id(post_content.detail_link) for post_content in post_list])
+        now = time.time()
+        changed_posts: List[PostContent] = []
+        for post_content in post_list:
+            last_seen = seen.get(get_article_id(post_content.detail_link))
+            if last_seen is None or last_seen[0] != post_content.push_count:
+                changed_posts.append(post_content)
+            elif (self.refresh_after is not None and post_content.push_count in SATURATED_PUSH_COUNTS
+                  and now - last_seen[1] > self.refresh_after):
+                changed_posts.append(post_content)
+        if verbose:
+            print(f"Incremental crawl: {len(changed_posts)} of {len(post_list)} posts are new or changed")
+        return changed_posts
+
+    def mark_fetched(self, post: PostContent):
+        """
+        Record the push count of a fetched post
+        :param post: post or post detail, only detail_link and push_count are used
+        :return:
+        """
+        self._conn.execute(
+            "INSERT INTO seen_articles (article_id, push_count, fetched_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(article_id) DO UPDATE SET push_count = excluded.push_count, fetched_at = excluded.fetched_at",
+            (get_article_id(post.detail_link), post.push_count, time.time()))
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_EVERY:
+            self.commit()
+
+    def track(self, save_posts):
+        """
+        Wrap a data container so every saved post detail is marked as fetched
+        :param save_posts: a list or a sink with append()
+        :return:
+        """
+        return SeenIndexSink(save_posts, self)
+
+    def commit(self):
+        self._conn.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SeenIndexSink:
+    """
+    Data container wrapper, forwards the posts and marks the fetched ones in the index
+    """
+
+    def __init__(self, save_posts, seen_index: SeenArticleIndex):
+        self.save_posts = save_posts
+        self.seen_index = seen_index
+
+    def append(self, post: PostContentDetail):
+        self.save_posts.append(post)
+        # keep a failed detail fetch out of the index so the next run retries it
+        if is_fetched(post):
+            self.seen_index.mark_fetched(post)
+
+    def extend(self, posts):
+        for post in posts:
+            self.append(post)
+
+    def __len__(self):
+        return len(self.save_posts)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/06 11:00
+# @Desc    : Sinks that store crawled posts while the crawler is running
+
+import json
+import os
+import sys
+import time
+from typing import Dict, Optional
+
+from common import PostComment, PostContentDetail, encode_post, get_article_id, get_board_name
+
+# optional columnar export, pip install pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+FSYNC_EVERY = 100  # fsync the file every N posts
+PARQUET_BATCH_SIZE = 1000  # posts buffered before a record batch is written
+PARQUET_FILE_POSTS = 100000  # posts of one part file, the part is closed and readable after that
+PARQUET_COMPRESSION = "zstd"
+
+# columns of the two tables of a parquet dataset, the comments are joined to their post on article_id
+POST_COLUMNS = ("article_id", "board", "title", "author", "publish_date", "detail_link", "push_count",
+                "push_count_value", "content", "comments_count")
+COMMENT_COLUMNS = ("article_id", "comment_index", "push_tag", "comment_user_name", "comment_content", "comment_time")
+
+
+class JsonlPostSink:
+    """
+    Append every post to a JSON Lines file as soon as it is fetched, so memory stays flat and a crash
+    only loses the posts after the last fsync. It can be passed to run_crawler instead of a list.
+    """
+
+    def __init__(self, file_path: str, fsync_every: int = FSYNC_EVERY, append: bool = False):
+        """
+        :param file_path: output .jsonl file
+        :param fsync_every: fsync the file every N posts
+        :param append: add the posts to an existing file, for resumed runs, otherwise the file is overwritten
+        """
+        self.file_path = file_path
+        self.fsync_every = fsync_every
+        self.count = 0  # posts written by this sink
+        self._file = open(file_path, "ab" if append else "wb")
+
+    def append(self, post: PostContentDetail):
+        """
+        Serialize one post and append it as one line
+        :param post:
+        :return:
+        """
+        self._file.write(encode_post(post) + b"\n")
+        # hand the line to the OS right away, fsync only every N posts
+        self._file.flush()
+        self.count += 1
+        if self.count % self.fsync_every == 0:
+            os.fsync(self._file.fileno())
+
+    def extend(self, posts):
+        for post in posts:
+            self.append(post)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def push_count_value(push_count: str) -> Optional[int]:
+    """
+    Numeric value of the push count shown in the list page
+    :param push_count: "", 1-99, 爆, X1-X9, XX
+    :return: 爆 is 100, X1 is -10, XX is -100, None for an empty or unknown value
+    """
+    if push_count == "爆":
+        return 100
+    if push_count == "XX":
+        return -100
+    if push_count.startswith("X") and push_count[1:].isdigit():
+        return -10 * int(push_count[1:])
+    if push_count.isdigit():
+        return int(push_count)
+    return None
+
+
+def post_columns_schema():
+    return pa.schema([
+        ("article_id", pa.string()),
+        ("board", pa.string()),
+        ("title", pa.string()),
+        ("author", pa.string()),
+        ("publish_date", pa.string()),
+        ("detail_link", pa.string()),
+        ("push_count", pa.string()),
+        ("push_count_value", pa.int16()),
+        ("content", pa.large_string()),
+        ("comments_count", pa.int32()),
+    ])
+
+
+def comment_columns_schema():
+    return pa.schema([
+        ("article_id", pa.string()),
+        ("comment_index", pa.int32()),
+        ("push_tag", pa.string()),
+        ("comment_user_name", pa.string()),
+        ("comment_content", pa.string()),
+        ("comment_time", pa.string()),
+    ])
+
+
+class ParquetPostSink:
+    """
+    Write the posts to a Parquet dataset directory with two tables: posts/ with one row per post and comments/ with
+    one row per push comment keyed by article_id. The rows are buffered by column and written as record batches,
+    every run adds its own part files, so the months of data can be scanned with pyarrow.dataset without loading
+    them in memory. A part file is readable once closed: a crash loses the open part, keep STREAM_EXPORT for
+    resumable runs and convert the .jsonl file with jsonl_to_parquet().
+    """
+
+    def __init__(self, dir_path: str, batch_size: int = PARQUET_BATCH_SIZE, file_posts: int = PARQUET_FILE_POSTS,
+                 compression: str = PARQUET_COMPRESSION):
+        """
+        :param dir_path: dataset directory, created if missing
+        :param batch_size: posts buffered before a record batch is written
+        :param file_posts: posts of one part file
+        :param compression: parquet codec
+        """
+        if pa is None:
+            raise ImportError("ParquetPostSink needs pyarrow, pip install pyarrow")
+        self.dir_path = dir_path
+        self.batch_size = batch_size
+        self.file_posts = file_posts
+        self.compression = compression
+        self.count = 0  # posts written by this sink
+        self.comments_count = 0
+        self._posts_schema = post_columns_schema()
+        self._comments_schema = comment_columns_schema()
+        self._posts: Dict[str, list] = {name: [] for name in POST_COLUMNS}
+        self._comments: Dict[str, list] = {name: [] for name in COMMENT_COLUMNS}
+        self._buffered = 0
+        self._part = 0
+        self._part_posts = 0
+        self._writers: Optional[tuple] = None
+        # part files of this run, never overwrite the ones of another run
+        self._run_id = time.strftime("%Y%m%d%H%M%S") + f"-{os.getpid()}"
+        os.makedirs(os.path.join(dir_path, "posts"), exist_ok=True)
+        os.makedirs(os.path.join(dir_path, "comments"), exist_ok=True)
+
+    def append(self, post: PostContentDetail):
+        """
+        Add one post and its comments to the column buffers
+        :param post:
+        :return:
+        """
+        article_id = get_article_id(post.detail_link)
+        posts = self._posts
+        posts["article_id"].append(article_id)
+        posts["board"].append(get_board_name(post.detail_link))
+        posts["title"].append(post.title)
+        posts["author"].append(post.author)
+        posts["publish_date"].append(post.publish_date)
+        posts["detail_link"].append(post.detail_link)
+        posts["push_count"].append(post.push_count)
+        posts["push_count_value"].append(push_count_value(post.push_count))
+        posts["content"].append(post.content)
+        posts["comments_count"].append(len(post.post_comments))
+        comments = self._comments
+        for comment_index, post_comment in enumerate(post.post_comments):
+            comments["article_id"].append(article_id)
+            comments["comment_index"].append(comment_index)
+            comments["push_tag"].append(post_comment.push_tag)
+            comments["comment_user_name"].append(post_comment.comment_user_name)
+            comments["comment_content"].append(post_comment.comment_content)
+            comments["comment_time"].append(post_comment.comment_time)
+        self.count += 1
+        self.comments_count += len(post.post_comments)
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def extend(self, posts):
+        for post in posts:
+            self.append(post)
+
+    def _open_part(self):
+        name = f"part-{self._run_id}-{self._part:05d}.parquet"
+        self._writers = (
+            pq.ParquetWriter(os.path.join(self.dir_path, "posts", name), self._posts_schema,
+                             compression=self.compression),
+            pq.ParquetWriter(os.path.join(self.dir_path, "comments", name), self._comments_schema,
+                             compression=self.compression),
+        )
+        self._part += 1
+        self._part_posts = 0
+
+    def _close_part(self):
+        if self._writers is not None:
+            for writer in self._writers:
+                writer.close()
+            self._writers = None
+
+    def flush(self):
+        """
+        Write the buffered posts and comments as one record batch of each table
+        :return:
+        """
+        if not self._buffered:
+            return
+        if self._writers is None:
+            self._open_part()
+        posts_writer, comments_writer = self._writers
+        posts_writer.write_batch(pa.RecordBatch.from_pydict(self._posts, schema=self._posts_schema))
+        comments_writer.write_batch(pa.RecordBatch.from_pydict(self._comments, schema=self._comments_schema))
+        self._part_posts += self._buffered
+        self._buffered = 0
+        for column in self._posts.values():
+            column.clear()
+        for column in self._comments.values():
+            column.clear()
+        if self._part_posts >= self.file_posts:
+            self._close_part()
+
+    def close(self):
+        self.flush()
+        self._close_part()
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def decode_post(line: bytes) -> PostContentDetail:
+    """
+    Decode one line written by JsonlPostSink
+    :param line:
+    :return:
+    """
+    post_dict = json.loads(line)
+    post_dict["post_comments"] = [PostComment(**comment) for comment in post_dict.get("post_comments", [])]
+    return PostContentDetail(**post_dict)
+
+
+def jsonl_to_parquet(jsonl_path: str, dir_path: str, batch_size: int = PARQUET_BATCH_SIZE) -> int:
+    """
+    Convert a .jsonl file of JsonlPostSink to a parquet dataset, line by line so memory stays flat
+    :param jsonl_path:
+    :param dir_path: dataset directory
+    :param batch_size: posts of one record batch
+    :return: number of posts converted
+    """
+    with open(jsonl_path, "rb") as f, ParquetPostSink(dir_path, batch_size=batch_size) as sink:
+        for line in f:
+            if line.strip():
+                sink.append(decode_post(line))
+    return len(sink)
+
+
+if __name__ == '__main__':
+    # python storage.py ptt_stock_posts.jsonl ptt_stock_posts_parquet
+    if len(sys.argv) != 3:
+        print("usage: python storage.py <posts.jsonl> <dataset directory>")
+        sys.exit(1)
+    print("Converted posts: ", jsonl_to_parquet(sys.argv[1], sys.argv[2]))
@@ -4,18 +4,35 @@
 # @Desc    : Code of synchronised crawler, target: https://www.ptt.cc/bbs/Stock/index.html,
 #            extract posts and comments of first N pages
 
-from typing import List
+import argparse
+import re
+import time
+from typing import List, Optional
 
 import requests
 from bs4 import BeautifulSoup
 
-from common import PostContent, PostComment, PostContentDetail, parse_post_content, dataclass_to_dict
+from checkpoint import CrawlCheckpoint
+from common import LazyPostContentDetail, PostContent, PostContentDetail, dataclass_to_dict, page_encoding
+from crawler_kit.http_cache import ResponseCache
+from crawler_kit.metrics import metrics, record_response
+from http_client import create_sync_session
+from parser_backends import get_parser_backend
+from seen_index import SeenArticleIndex
+from storage import JsonlPostSink
 
+BOARD = "Stock"  # board name, as in https://www.ptt.cc/bbs/<board>/index.html
 FIRST_N_PAGE = 2  # extract first N page
+PARSER_BACKEND = "lxml"  # html parser backend: bs4, parsel, lxml, selectolax
+LAZY_DETAIL = False  # parse article content / comments on first access, the jsonl / parquet exports read them all
 BASE_HOST = "https://www.ptt.cc"
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-}
+STREAM_EXPORT = True  # append every post to a .jsonl file while crawling, otherwise dump one json array at the end
+INCREMENTAL = False  # only fetch detail pages of new posts and posts whose push count changed since the last run
+SEEN_INDEX_PATH = "ptt_seen_articles.db"  # sqlite index of the fetched articles used by the incremental mode
+HTTP_CACHE_DIR = ".http_cache"  # on-disk response cache revalidated with ETag / Last-Modified, None to disable
+VERBOSE = True  # print every page and post, turn it off on large runs
+CHECKPOINT_PATH = "ptt_crawl_checkpoint_{board}.json"  # progress of the run, continued with --resume, None to disable
+METRICS_PATH = "ptt_crawler_metrics.prom"  # metrics snapshot written at the end of the run, .json for json, None to skip
 
 
 def parse_post_use_bs(html_content: str) -> PostContent:
@@ -40,127 +57,234 @@ def parse_post_use_bs(html_content: str) -> PostContent:
     # extract post link
     post_content.detail_link = soup.select("div.r-ent div.title a")[0]["href"] if len(
         soup.select("div.r-ent div.title a")) > 0 else ""
+    # extract push count
+    post_content.push_count = soup.select("div.r-ent div.nrec")[0].text.strip() if len(
+        soup.select("div.r-ent div.nrec")) > 0 else ""
     return post_content
 
 
-def get_latest_page_number() -> int:
+def send_get(session: requests.Session, url: str, endpoint: str) -> requests.Response:
+    """
+    GET a page and record its latency, status, size and the retries of the session adapter
+    :param session: shared http session
+    :param url:
+    :param endpoint: metrics label: latest_index, index or article
+    :return:
+    """
+    start = time.perf_counter()
+    response = session.get(url=url)
+    record_response(endpoint, response.status_code, len(response.content), time.perf_counter() - start)
+    # urllib3 keeps the retried attempts in the history of the retry object, cached responses have no raw
+    retries = getattr(response.raw, "retries", None)
+    if retries is not None and retries.history:
+        metrics.inc("http_retries_total", len(retries.history), host=response.url.split("/")[2])
+    return response
+
+
+def get_latest_page_number(session: requests.Session, board: str = BOARD) -> int:
     """
     Get the latest page number
+    :param session: shared http session
+    :param board: board name
     :return:
     """
-    uri = "/bbs/Stock/index.html"
-    response = requests.get(url=BASE_HOST + uri, headers=HEADERS)
+    uri = f"/bbs/{board}/index.html"
+    response = send_get(session, BASE_HOST + uri, "latest_index")
     if response.status_code != 200:
         raise Exception("send request got error status code, reason：", response.text)
-    soup = BeautifulSoup(response.text, "lxml")
+    soup = BeautifulSoup(response.content, "lxml",
+                         from_encoding=page_encoding(response.headers.get("Content-Type"), response.content))
 
     css_selector = "#action-bar-container > div > div.btn-group.btn-group-paging > a:nth-child(2)"
     pagination_link = soup.select(css_selector)[0]["href"].strip()
 
     # pagination_link: /bbs/Stock/index7084.html -> 7084
-    latest_page_number = int(pagination_link.replace("/bbs/Stock/index", "").replace(".html", ""))
+    latest_page_number = int(re.search(r"index(\d+)\.html", pagination_link).group(1))
     return latest_page_number
 
 
-def fetch_bbs_posts_list(latest_number: int) -> List[PostContent]:
+def fetch_bbs_posts_page(session: requests.Session, page_number: int, board: str = BOARD) -> List[PostContent]:
     """
-    Fetch the note list from the latest page number to the latest page number - FIRST_N_PAGE
+    Fetch the note list of one index page
+    :param session: shared http session
+    :param page_number: index page number
+    :param board: board name
     :return:
     """
-    posts_list: List[PostContent] = []
+    if VERBOSE:
+        print(f"Start getting the list of posts on page {page_number}...")
+
+    # assemble the uri
+    uri = f"/bbs/{board}/index{page_number}.html"
+    response = send_get(session, BASE_HOST + uri, "index")
+    if response.status_code != 200:
+        print(f"Page {page_number} post fetch exception, cause: {response.text}")
+        return []
 
+    # parse the raw bytes once with the declared encoding, response.text would sniff the charset without a header
+    encoding = page_encoding(response.headers.get("Content-Type"), response.content)
+    with metrics.timer("parse_seconds", page_type="index"):
+        page_posts: List[PostContent] = get_parser_backend(PARSER_BACKEND).parse_post_list_bytes(response.content,
+                                                                                                 encoding)
+    if VERBOSE:
+        print(f"End Get the list of posts on page {page_number}, this time getting :{len(page_posts)} posts...")
+    return page_posts
+
+
+def get_page_numbers(latest_number: int) -> List[int]:
+    """
+    Index page numbers from the latest page number to the latest page number - FIRST_N_PAGE
+    :param latest_number: latest page number
+    :return:
+    """
     # true start page number = latest page number + 1
     start_page_number = latest_number + 1
     end_page_number = start_page_number - FIRST_N_PAGE
-    for page_number in range(start_page_number, end_page_number, -1):
-        print(f"Start getting the list of posts on page {page_number}...")
+    return list(range(start_page_number, end_page_number, -1))
+
 
-        # assemble the uri
-        uri = f"/bbs/Stock/index{page_number}.html"
-        response = requests.get(url=BASE_HOST + uri, headers=HEADERS)
-        if response.status_code != 200:
-            print(f"Page {page_number} post fetch exception, cause: {response.text}")
-            continue
-
-        soup = BeautifulSoup(response.text, "lxml")
-        all_post_elements = soup.select("div.r-ent")
-        for post_element in all_post_elements:
-            # using .prettify() to fetch the html content of the element
-            post_content: PostContent = parse_post_use_bs(post_element.prettify())
-            posts_list.append(post_content)
-        print(f"End Get the list of posts on page {page_number}, this time getting :{len(all_post_elements)} posts...")
+def fetch_bbs_posts_list(session: requests.Session, latest_number: int, board: str = BOARD) -> List[PostContent]:
+    """
+    Fetch the note list from the latest page number to the latest page number - FIRST_N_PAGE
+    :param session: shared http session
+    :param latest_number: latest page number
+    :param board: board name
+    :return:
+    """
+    posts_list: List[PostContent] = []
+    for page_number in get_page_numbers(latest_number):
+        posts_list.extend(fetch_bbs_posts_page(session, page_number, board))
     return posts_list
 
 
-def fetch_bbs_post_detail(post_content: PostContent) -> PostContentDetail:
+def fetch_bbs_post_detail(session: requests.Session, post_content: PostContent) -> PostContentDetail:
     """
     Fetch the post detail page
+    :param session: shared http session
     :param post_content:
     :return:
     """
-    print(f"Start getting posts {post_content.detail_link} detail page ....")
+    if VERBOSE:
+        print(f"Start getting posts {post_content.detail_link} detail page ....")
     post_content_detail = PostContentDetail()
 
     # reuse the post_content object
     post_content_detail.title = post_content.title
     post_content_detail.author = post_content.author
     post_content_detail.detail_link = BASE_HOST + post_content.detail_link
+    post_content_detail.push_count = post_content.push_count
 
-    response = requests.get(url=BASE_HOST + post_content.detail_link, headers=HEADERS)
+    response = send_get(session, BASE_HOST + post_content.detail_link, "article")
     if response.status_code != 200:
         print(f"Post: {post_content.title} Get Exception, Reason: {response.text}")
         return post_content_detail
 
-    soup = BeautifulSoup(response.text, "lxml")
-    post_content_detail.publish_datetime = soup.select("#main-content > div:nth-child(4) > span.article-meta-value")[
-        0].text
-    post_content_detail.content = parse_post_content(response.text)
-
-    # extract all comments
-    post_content_detail.post_comments = []
-    all_comment_elements = soup.select("#main-content > div.push")
-    for comment_element in all_comment_elements:
-        post_comment = PostComment()
-        if len(comment_element.select("span")) < 3:
-            continue
-
-        post_comment.comment_user_name = comment_element.select("span")[1].text.strip()
-        post_comment.comment_content = comment_element.select("span")[2].text.strip().replace(": ", "")
-        post_comment.comment_time = comment_element.select("span")[3].text.strip()
-        post_content_detail.post_comments.append(post_comment)
-
-    print(post_content_detail)
+    # extract publish date, content and comments with the configured parser backend, straight from the raw bytes
+    encoding = page_encoding(response.headers.get("Content-Type"), response.content)
+    if LAZY_DETAIL:
+        # nothing is parsed until a consumer reads publish_date, content or post_comments, so no comments_total
+        return LazyPostContentDetail(response.content, encoding, PARSER_BACKEND, title=post_content_detail.title,
+                                     author=post_content_detail.author, detail_link=post_content_detail.detail_link,
+                                     push_count=post_content_detail.push_count)
+    with metrics.timer("parse_seconds", page_type="article"):
+        parsed_detail: PostContentDetail = get_parser_backend(PARSER_BACKEND).parse_post_detail_bytes(
+            response.content, encoding)
+    post_content_detail.publish_date = parsed_detail.publish_date
+    post_content_detail.content = parsed_detail.content
+    post_content_detail.post_comments = parsed_detail.post_comments
+
+    metrics.inc("comments_total", len(post_content_detail.post_comments))
+    if VERBOSE:
+        print(post_content_detail)
     return post_content_detail
 
 
-def run_crawler(save_posts: List[PostContentDetail]):
+def run_crawler(save_posts: List[PostContentDetail], resume: bool = False, board: str = BOARD):
     """
     Crawler main function
-    :param save_posts: data container
+    :param save_posts: data container, a list or a sink with append() such as storage.JsonlPostSink
+    :param resume: continue the run recorded in CHECKPOINT_PATH instead of starting over
+    :param board: board name
     :return:
     """
-    # step1: get the latest page number
-    latest_number: int = get_latest_page_number()
+    metrics.reset()
+    seen_index = SeenArticleIndex(SEEN_INDEX_PATH) if INCREMENTAL else None
+    cache = ResponseCache(HTTP_CACHE_DIR) if HTTP_CACHE_DIR else None
+    checkpoint: Optional[CrawlCheckpoint] = None
+    if CHECKPOINT_PATH:
+        checkpoint_path = CHECKPOINT_PATH.format(board=board)
+        checkpoint = CrawlCheckpoint.load(checkpoint_path) if resume else CrawlCheckpoint(checkpoint_path)
+    try:
+        # one pooled keep-alive session for the whole run
+        with create_sync_session(cache=cache) as session:
+            # step1: get the latest page number, a resumed run keeps the page window of the first run
+            if checkpoint is not None and checkpoint.latest_number is not None:
+                latest_number: int = checkpoint.latest_number
+                print(f"Resume {board} from page {latest_number + 1}, {len(checkpoint.done_pages)} pages and "
+                      f"{len(checkpoint.done_articles)} articles already done")
+            else:
+                latest_number: int = get_latest_page_number(session, board)
+            if checkpoint is not None:
+                checkpoint.latest_number = latest_number
+                save_posts = checkpoint.track(save_posts)
 
-    # step2: get the post list from the latest page number to the (latest page number - FIRST_N_PAGE)
-    post_list: List[PostContent] = fetch_bbs_posts_list(latest_number)
+            if seen_index is not None:
+                save_posts = seen_index.track(save_posts)
 
-    # step3: get the post detail
-    for post_content in post_list:
-        if not post_content.detail_link:
-            continue
-        post_content_detail = fetch_bbs_post_detail(post_content)
-        save_posts.append(post_content_detail)
+            page_numbers = get_page_numbers(latest_number)
+            if checkpoint is not None:
+                page_numbers = checkpoint.pending_pages(page_numbers)
+            for page_number in page_numbers:
+                # step2: get the post list of the page
+                page_posts: List[PostContent] = fetch_bbs_posts_page(session, page_number, board)
+                # a failed index page comes back empty
+                fetched = bool(page_posts)
+                page_posts = [post_content for post_content in page_posts if post_content.detail_link]
+                if seen_index is not None:
+                    # skip the posts whose push count did not change since they were fetched
+                    page_posts = seen_index.filter_changed(page_posts, verbose=VERBOSE)
+                if checkpoint is not None:
+                    page_posts = checkpoint.expect_page(page_number, page_posts, fetched)
+
+                # step3: get the post detail
+                for post_content in page_posts:
+                    post_content_detail = fetch_bbs_post_detail(session, post_content)
+                    save_posts.append(post_content_detail)
+    finally:
+        if checkpoint is not None:
+            checkpoint.save()
+        if seen_index is not None:
+            seen_index.close()
 
     print("Task completed, total posts: ", len(save_posts))
+    if cache is not None:
+        print("HTTP cache: ", cache.stats())
+    metrics.inc("posts_total", len(save_posts))
+    if METRICS_PATH:
+        metrics.write_snapshot(METRICS_PATH)
+        print("Metrics snapshot: ", METRICS_PATH)
 
 
 if __name__ == '__main__':
-    all_posts_content_detail: List[PostContentDetail] = []
-    run_crawler(all_posts_content_detail)
-
-    # export the data to json
-    import json
-    with open("ptt_stock_posts.json", "w", encoding="utf-8") as f:
-        f.write(json.dumps([dataclass_to_dict(post) for post in all_posts_content_detail], ensure_ascii=False, indent=4))
-    print("Export data to ptt_stock_posts.json successfully!")
+    arg_parser = argparse.ArgumentParser(description="Crawl the posts and comments of the first N pages of a PTT board")
+    arg_parser.add_argument("--board", default=BOARD, help=f"board name, default {BOARD}")
+    arg_parser.add_argument("--resume", action="store_true",
+                            help=f"continue the interrupted run recorded in {CHECKPOINT_PATH}")
+    args = arg_parser.parse_args()
+
+    if STREAM_EXPORT:
+        # a resumed run adds the missing posts to the file of the interrupted one, an incremental run the new and
+        # changed posts to the file of the earlier runs, whose posts it does not fetch again
+        with JsonlPostSink(f"ptt_{args.board.lower()}_posts.jsonl", append=args.resume or INCREMENTAL) as posts_sink:
+            run_crawler(posts_sink, resume=args.resume, board=args.board)
+        print(f"Export data to ptt_{args.board.lower()}_posts.jsonl successfully!")
+    else:
+        all_posts_content_detail: List[PostContentDetail] = []
+        run_crawler(all_posts_content_detail, resume=args.resume, board=args.board)
+
+        # export the data to json
+        import json
+        with open(f"ptt_{args.board.lower()}_posts.json", "w", encoding="utf-8") as f:
+            f.write(json.dumps([dataclass_to_dict(post) for post in all_posts_content_detail], ensure_ascii=False,
+                               indent=4))
+        print(f"Export data to ptt_{args.board.lower()}_posts.json successfully!")
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/13 15:00
+# @Desc    : async crawler pipeline test code
+
+import asyncio
+import contextlib
+import io
+import random
+import unittest
+from typing import List
+
+import httpx
+
+import asyn_crawler
+from common import LazyPostContentDetail, PostContentDetail
+from crawler_kit.metrics import metrics
+from mock_server import render_article_page, render_index_page
+from parse_pool import ParsePool
+
+LATEST_PAGE = 100
+
+
+async def mock_ptt(request: httpx.Request) -> httpx.Response:
+    # random latency so the pages and details finish out of order
+    await asyncio.sleep(random.uniform(0, 0.01))
+    page_name = request.url.path.split("/")[-1][:-len(".html")]
+    if page_name == "index":
+        html = render_index_page("Stock", LATEST_PAGE + 1)
+    elif page_name.startswith("index"):
+        html = render_index_page("Stock", int(page_name[len("index"):]), posts_per_page=5)
+    else:
+        html = render_article_page("Stock", page_name, comments_count=2)
+    return httpx.Response(200, text=html)
+
+
+class TestFetchBbsPostsPipeline(unittest.TestCase):
+    def setUp(self):
+        self.first_n_page = asyn_crawler.FIRST_N_PAGE
+        asyn_crawler.FIRST_N_PAGE = 6
+
+    def tearDown(self):
+        asyn_crawler.FIRST_N_PAGE = self.first_n_page
+
+    def crawl(self, pipeline: bool, parse_pool: ParsePool = None) -> List[PostContentDetail]:
+        async def run() -> List[PostContentDetail]:
+            save_posts: List[PostContentDetail] = []
+            async with httpx.AsyncClient(transport=httpx.MockTransport(mock_ptt)) as client:
+                if pipeline:
+                    await asyn_crawler.fetch_bbs_posts_pipeline(client, LATEST_PAGE, save_posts, concurrency=4,
+                                                                parse_pool=parse_pool)
+                else:
+                    for post_content in await asyn_crawler.fetch_bbs_posts_list(client, LATEST_PAGE, concurrency=1):
+                        save_posts.append(await asyn_crawler.fetch_bbs_post_detail(client, post_content))
+            return save_posts
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            return asyncio.run(run())
+
+    def test_pipeline_keeps_page_order(self):
+        sequential = self.crawl(pipeline=False)
+        pipelined = self.crawl(pipeline=True)
+        self.assertEqual(len(sequential), 6 * 5)
+        self.assertEqual([post.detail_link for post in pipelined], [post.detail_link for post in sequential])
+        self.assertTrue(all(post.content for post in pipelined))
+
+    def test_pipeline_with_parse_pool(self):
+        sequential = self.crawl(pipeline=False)
+        for executor in ("process", "thread"):
+            with self.subTest(executor=executor), ParsePool("lxml", workers=2, executor=executor) as parse_pool:
+                pipelined = self.crawl(pipeline=True, parse_pool=parse_pool)
+                self.assertEqual([(post.detail_link, post.content, post.post_comments) for post in pipelined],
+                                 [(post.detail_link, post.content, post.post_comments) for post in sequential])
+
+    def test_lazy_detail(self):
+        sequential = self.crawl(pipeline=False)
+        asyn_crawler.LAZY_DETAIL = True
+        try:
+            lazy = self.crawl(pipeline=True)
+        finally:
+            asyn_crawler.LAZY_DETAIL = False
+        self.assertTrue(all(isinstance(post, LazyPostContentDetail) and not post.materialized for post in lazy))
+        self.assertEqual([(post.title, post.push_count) for post in lazy],
+                         [(post.title, post.push_count) for post in sequential])
+        self.assertEqual([(post.publish_date, post.content, post.post_comments) for post in lazy],
+                         [(post.publish_date, post.content, post.post_comments) for post in sequential])
+
+    def test_parse_time_without_queue_wait(self):
+        page = render_article_page("Stock", "M.1.A.1", comments_count=2000).encode("utf-8")
+
+        async def parse_all(parse_pool: ParsePool):
+            # one worker, the pages queue behind each other
+            await asyncio.gather(*[parse_pool.parse_post_detail(page) for _ in range(4)])
+
+        metrics.reset()
+        with ParsePool("lxml", workers=1, executor="thread") as parse_pool:
+            asyncio.run(parse_all(parse_pool))
+        parse = metrics.histograms["parse_seconds"][(("page_type", "article"),)]
+        queue = metrics.histograms["parse_queue_seconds"][(("page_type", "article"),)]
+        self.assertEqual((parse.count, queue.count), (4, 4))
+        # the last page waited for the three before it, none of it counted as parse time
+        self.assertGreater(queue.sum, parse.sum)
+
+    def test_unknown_parse_executor(self):
+        with self.assertRaises(ValueError):
+            ParsePool("lxml", workers=2, executor="gpu")
+
+    def test_posts_list_merged_in_page_order(self):
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(mock_ptt)) as client:
+                concurrent = await asyn_crawler.fetch_bbs_posts_list(client, LATEST_PAGE, concurrency=6)
+                sequential = await asyn_crawler.fetch_bbs_posts_list(client, LATEST_PAGE, concurrency=1)
+            return concurrent, sequential
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            concurrent, sequential = asyncio.run(run())
+        self.assertEqual([post.detail_link for post in concurrent], [post.detail_link for post in sequential])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/18 15:00
+# @Desc    : multi-board scheduler test code
+
+import asyncio
+import contextlib
+import io
+import unittest
+from typing import Dict, List
+
+import httpx
+
+import asyn_crawler
+from board_scheduler import board_of_request, crawl_boards
+from common import PostContentDetail
+from crawler_kit.throttle import FairShareTransport, FairSlots
+from http_client import COOKIES
+from mock_server import render_article_page, render_index_page
+
+LATEST_PAGES = {"Stock": 100, "Gossiping": 300}
+
+
+async def mock_ptt(request: httpx.Request) -> httpx.Response:
+    board = board_of_request(request)
+    if board not in LATEST_PAGES:
+        return httpx.Response(404, text="404 - Not Found.")
+    if board == "Gossiping" and "over18=1" not in request.headers.get("Cookie", ""):
+        return httpx.Response(302, headers={"Location": f"/ask/over18?from={request.url.path}"})
+    page_name = request.url.path.split("/")[-1][:-len(".html")]
+    if page_name == "index":
+        html = render_index_page(board, LATEST_PAGES[board] + 1)
+    elif page_name.startswith("index"):
+        html = render_index_page(board, int(page_name[len("index"):]), posts_per_page=3)
+    else:
+        html = render_article_page(board, page_name, comments_count=1)
+    return httpx.Response(200, text=html)
+
+
+class TestBoardScheduler(unittest.TestCase):
+    def setUp(self):
+        self.first_n_page = asyn_crawler.FIRST_N_PAGE
+        asyn_crawler.FIRST_N_PAGE = 2
+
+    def tearDown(self):
+        asyn_crawler.FIRST_N_PAGE = self.first_n_page
+
+    def crawl(self, save_posts_by_board: Dict[str, List[PostContentDetail]], fair_slots: FairSlots):
+        async def run():
+            transport = FairShareTransport(httpx.MockTransport(mock_ptt), fair_slots)
+            async with httpx.AsyncClient(base_url=asyn_crawler.BASE_HOST, cookies=COOKIES,
+                                         transport=transport) as client:
+                return await crawl_boards(client, save_posts_by_board, concurrency=3)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            return asyncio.run(run())
+
+    def test_board_of_request(self):
+        self.assertEqual(board_of_request(httpx.Request("GET", "https://www.ptt.cc/bbs/Stock/index7084.html")),
+                         "Stock")
+        self.assertEqual(board_of_request(httpx.Request("GET", "https://www.ptt.cc/ask/over18")), "/ask/over18")
+
+    def test_latest_page_number_of_board(self):
+        async def run():
+            async with httpx.AsyncClient(base_url=asyn_crawler.BASE_HOST, cookies=COOKIES,
+                                         transport=httpx.MockTransport(mock_ptt)) as client:
+                return await asyn_crawler.get_latest_page_number(client, "Gossiping")
+
+        self.assertEqual(asyncio.run(run()), LATEST_PAGES["Gossiping"])
+
+    def test_posts_saved_per_board(self):
+        save_posts_by_board: Dict[str, List[PostContentDetail]] = {"Stock": [], "Gossiping": [], "NoSuchBoard": []}
+        fair_slots = FairSlots(4, per_key=3, key=board_of_request)
+        errors = self.crawl(save_posts_by_board, fair_slots)
+
+        # the missing board fails alone
+        self.assertEqual(list(errors), ["NoSuchBoard"])
+        for board in ("Stock", "Gossiping"):
+            self.assertEqual(len(save_posts_by_board[board]), 2 * 3)
+            for post in save_posts_by_board[board]:
+                self.assertIn(f"/bbs/{board}/", post.detail_link)
+                self.assertTrue(post.content)
+        self.assertEqual(fair_slots.in_flight, 0)
+        self.assertGreater(fair_slots.granted["Gossiping"], 2 * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
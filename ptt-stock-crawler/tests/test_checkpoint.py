@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/17 15:00
+# @Desc    : crawl checkpoint test code
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from typing import List
+
+import httpx
+
+import asyn_crawler
+from checkpoint import CheckpointSink, CrawlCheckpoint
+from common import LazyPostContentDetail, PostContent, PostContentDetail, get_article_id
+from mock_server import render_article_page, render_index_page
+
+LATEST_PAGE = 100
+
+
+def make_post(article_id: str) -> PostContent:
+    return PostContent(title=article_id, detail_link=f"/bbs/Stock/{article_id}.html", push_count="1")
+
+
+class CrashingSink(list):
+    """
+    List failing after `limit` posts, like a crawler killed in the middle of a run
+    """
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+
+    def append(self, post: PostContentDetail):
+        if len(self) >= self.limit:
+            raise KeyboardInterrupt
+        super().append(post)
+
+
+class TestCrawlCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "checkpoint.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_page_completed_when_all_articles_saved(self):
+        checkpoint = CrawlCheckpoint(self.file_path)
+        posts = [make_post("M.1.A.1"), make_post("M.2.A.2"), PostContent(title="(本文已被刪除)")]
+        self.assertEqual(checkpoint.expect_page(7085, posts), posts[:2])
+        checkpoint.mark_article(posts[0])
+        self.assertEqual(checkpoint.pending_pages([7085, 7084]), [7085, 7084])
+        checkpoint.mark_article(posts[1])
+        self.assertEqual(checkpoint.pending_pages([7085, 7084]), [7084])
+        # the article ids of a completed page are dropped from the file
+        self.assertEqual(checkpoint.done_articles, set())
+
+    def test_saved_articles_skipped_after_load(self):
+        checkpoint = CrawlCheckpoint(self.file_path)
+        checkpoint.latest_number = 7084
+        posts = [make_post("M.1.A.1"), make_post("M.2.A.2")]
+        checkpoint.expect_page(7085, posts)
+        checkpoint.mark_article(posts[0])
+        checkpoint.save()
+
+        resumed = CrawlCheckpoint.load(self.file_path)
+        self.assertEqual(resumed.latest_number, 7084)
+        self.assertEqual(resumed.expect_page(7085, posts), posts[1:])
+
+    def test_failed_page_stays_pending(self):
+        checkpoint = CrawlCheckpoint(self.file_path)
+        self.assertEqual(checkpoint.expect_page(7085, [], fetched=False), [])
+        self.assertEqual(checkpoint.pending_pages([7085]), [7085])
+
+    def test_page_without_posts_to_fetch_completed(self):
+        checkpoint = CrawlCheckpoint(self.file_path)
+        # every post filtered out by the seen index, and a page of deleted posts only
+        self.assertEqual(checkpoint.expect_page(7085, []), [])
+        self.assertEqual(checkpoint.expect_page(7084, [PostContent(title="(本文已被刪除)")]), [])
+        checkpoint.save()
+        self.assertEqual(CrawlCheckpoint.load(self.file_path).pending_pages([7085, 7084, 7083]), [7083])
+
+    def test_saved_every_n_articles(self):
+        checkpoint = CrawlCheckpoint(self.file_path, save_every=2)
+        posts = [make_post(f"M.{i}.A.1") for i in range(3)]
+        checkpoint.expect_page(7085, posts)
+        checkpoint.mark_article(posts[0])
+        self.assertFalse(os.path.exists(self.file_path))
+        checkpoint.mark_article(posts[1])
+        with open(self.file_path, encoding="utf-8") as f:
+            self.assertEqual(len(json.load(f)["done_articles"]), 2)
+        self.assertFalse(os.path.exists(self.file_path + ".tmp"))
+
+    def test_sink_keeps_lazy_posts_unparsed(self):
+        checkpoint = CrawlCheckpoint(self.file_path)
+        posts = [make_post("M.1.A.1"), make_post("M.2.A.2")]
+        checkpoint.expect_page(7085, posts)
+        save_posts: List[PostContentDetail] = []
+        sink = CheckpointSink(save_posts, checkpoint)
+        lazy_post = LazyPostContentDetail(render_article_page("Stock", "M.1.A.1").encode("utf-8"), "utf-8",
+                                          detail_link=posts[0].detail_link)
+        sink.append(lazy_post)
+        # a failed fetch is not marked
+        sink.append(PostContentDetail(detail_link=posts[1].detail_link))
+        self.assertFalse(lazy_post.materialized)
+        self.assertEqual(checkpoint.done_articles, {"M.1.A.1"})
+        self.assertEqual(len(sink), 2)
+
+    def test_load_missing_file(self):
+        checkpoint = CrawlCheckpoint.load(self.file_path)
+        self.assertIsNone(checkpoint.latest_number)
+        self.assertEqual(checkpoint.done_pages, set())
+
+
+class TestResumePipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "checkpoint.json")
+        self.first_n_page = asyn_crawler.FIRST_N_PAGE
+        asyn_crawler.FIRST_N_PAGE = 4
+        self.article_requests: List[str] = []
+
+    def tearDown(self):
+        asyn_crawler.FIRST_N_PAGE = self.first_n_page
+        self.tmp_dir.cleanup()
+
+    async def mock_ptt(self, request: httpx.Request) -> httpx.Response:
+        page_name = request.url.path.split("/")[-1][:-len(".html")]
+        if page_name.startswith("index"):
+            return httpx.Response(200, text=render_index_page("Stock", int(page_name[len("index"):]),
+                                                              posts_per_page=5))
+        self.article_requests.append(page_name)
+        return httpx.Response(200, text=render_article_page("Stock", page_name, comments_count=1))
+
+    def crawl(self, checkpoint: CrawlCheckpoint, save_posts):
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(self.mock_ptt)) as client:
+                await asyn_crawler.fetch_bbs_posts_pipeline(client, LATEST_PAGE, checkpoint.track(save_posts),
+                                                            concurrency=3, checkpoint=checkpoint)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                asyncio.run(run())
+            finally:
+                checkpoint.save()
+
+    def test_resume_without_duplicates(self):
+        first_run = CrashingSink(limit=7)
+        with self.assertRaises(KeyboardInterrupt):
+            self.crawl(CrawlCheckpoint(self.file_path), first_run)
+        first_requests = list(self.article_requests)
+        self.article_requests.clear()
+
+        second_run: List[PostContentDetail] = []
+        self.crawl(CrawlCheckpoint.load(self.file_path), second_run)
+
+        saved_ids = [get_article_id(post.detail_link) for post in first_run + second_run]
+        self.assertEqual(len(saved_ids), 4 * 5)
+        self.assertEqual(len(set(saved_ids)), len(saved_ids))
+        # none of the saved articles is downloaded again
+        self.assertFalse(set(self.article_requests) & {get_article_id(post.detail_link) for post in first_run})
+        self.assertGreaterEqual(len(first_requests), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
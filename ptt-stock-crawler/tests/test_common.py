@@ -3,8 +3,14 @@
 # @Time    : 2024/11/15 15:50
 # @Desc    : public data model test code
 
+import json
+import os
 import unittest
-from common import PostContent, PostComment, PostContentDetail  # 假设你的数据类定义在一个名为 your_module.py 的文件中
+from dataclasses import asdict
+
+from common import (LazyPostContentDetail, PostContent, PostComment, PostContentDetail, dataclass_to_dict, encode_post,
+                    page_encoding)  # 假设你的数据类定义在一个名为 your_module.py 的文件中
+from parser_backends import get_parser_backend
 
 
 class TestPostContent(unittest.TestCase):
@@ -111,5 +117,78 @@ class TestPostContentDetail(unittest.TestCase):
         self.assertEqual(str(post).strip(), expected_str)
 
 
+class TestSerialization(unittest.TestCase):
+    def setUp(self):
+        self.post = PostContentDetail(
+            title="標題",
+            author="John Doe",
+            publish_date="Wed Mar 27 21:18:16 2024",
+            detail_link="https://example.com/post",
+            content="內文\n",
+            post_comments=[PostComment(comment_user_name="Jane Doe", comment_content="推", comment_time="03/27 21:20")]
+        )
+
+    def test_dataclass_to_dict_same_as_asdict(self):
+        self.assertEqual(dataclass_to_dict(self.post), asdict(self.post))
+        self.assertEqual(dataclass_to_dict([self.post]), [asdict(self.post)])
+
+    def test_encode_post(self):
+        line = encode_post(self.post)
+        self.assertNotIn(b"\n", line)
+        self.assertEqual(json.loads(line), asdict(self.post))
+
+
+
+class TestLazyPostContentDetail(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "ptt_stock_article.html"),
+                  "rb") as f:
+            self.article_page = f.read()
+        self.eager = get_parser_backend("lxml").parse_post_detail_bytes(self.article_page, "utf-8")
+
+    def test_fields_parsed_on_first_access(self):
+        for compress in (True, False):
+            with self.subTest(compress=compress):
+                post = LazyPostContentDetail(self.article_page, "utf-8", compress=compress, title="標題", push_count="爆")
+                self.assertEqual((post.title, post.push_count), ("標題", "爆"))
+                self.assertFalse(post.materialized)
+                self.assertEqual(post.raw_html, self.article_page)
+                self.assertEqual(post.content, self.eager.content)
+                self.assertTrue(post.materialized)
+                self.assertIsNone(post.raw_html)
+                self.assertEqual(post.publish_date, self.eager.publish_date)
+                self.assertEqual(post.post_comments, self.eager.post_comments)
+
+    def test_iter_comments_does_not_materialize(self):
+        post = LazyPostContentDetail(self.article_page, "utf-8")
+        self.assertEqual(list(post.iter_comments()), self.eager.post_comments)
+        self.assertFalse(post.materialized)
+        post.materialize()
+        self.assertEqual(list(post.iter_comments()), self.eager.post_comments)
+
+    def test_assignment_and_encoding(self):
+        post = LazyPostContentDetail(self.article_page, "utf-8", title="標題")
+        post.content = "內文"
+        self.assertEqual((post.content, post.post_comments), ("內文", self.eager.post_comments))
+        expected = asdict(post.to_detail())
+        self.assertEqual(expected["content"], "內文")
+        self.assertEqual(dataclass_to_dict(post), expected)
+        self.assertEqual(json.loads(encode_post(post)), expected)
+
+
+class TestPageEncoding(unittest.TestCase):
+    def test_header_charset_first(self):
+        self.assertEqual(page_encoding("text/html; charset=UTF-8", b'<meta charset="big5">'), "utf-8")
+
+    def test_meta_charset_without_header(self):
+        self.assertEqual(page_encoding("text/html", b'<html><head><meta charset="Big5">'), "cp950")
+        self.assertEqual(page_encoding(None, b'<meta http-equiv="Content-Type" content="text/html; charset=big5">'),
+                         "cp950")
+
+    def test_default_encoding(self):
+        self.assertEqual(page_encoding(None, b"<html></html>"), "utf-8")
+        self.assertEqual(page_encoding("text/html; charset=no-such-codec"), "utf-8")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/04 10:10
+# @Desc    : html extraction test code, based on the saved pages in tests/fixtures
+
+import os
+import unittest
+
+import lxml.html
+from bs4 import BeautifulSoup
+
+from asyn_crawler import parse_post_use_bs
+from extractor import parse_post_list, parse_push_comments
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(file_name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, file_name), encoding="utf-8") as f:
+        return f.read()
+
+
+class TestParsePostList(unittest.TestCase):
+    def setUp(self):
+        self.html = read_fixture("ptt_stock_index.html")
+
+    def test_parse_all_rows(self):
+        posts = parse_post_list(self.html)
+        self.assertEqual(len(posts), 20)
+        self.assertEqual(posts[0].title, "[新聞] 童子賢：用稅收補貼電費非長久之計 應共")
+        self.assertEqual(posts[0].author, "addy7533967")
+        self.assertEqual(posts[0].publish_date, "3/27")
+        self.assertEqual(posts[0].detail_link, "/bbs/Stock/M.1711544298.A.9F8.html")
+
+    def test_parse_deleted_row(self):
+        deleted_post = parse_post_list(self.html)[2]
+        self.assertEqual(deleted_post.title, "")
+        self.assertEqual(deleted_post.detail_link, "")
+        self.assertEqual(deleted_post.author, "-")
+
+    def test_same_result_as_prettify_and_reparse(self):
+        soup = BeautifulSoup(self.html, "lxml")
+        expected = [parse_post_use_bs(element.prettify()) for element in soup.select("div.r-ent")]
+        self.assertEqual(parse_post_list(self.html), expected)
+
+
+class TestParsePushComments(unittest.TestCase):
+    def setUp(self):
+        tree = lxml.html.fromstring(read_fixture("ptt_stock_article.html"))
+        self.main_content = tree.find(".//div[@id='main-content']")
+
+    def test_parse_all_pushes(self):
+        comments = parse_push_comments(self.main_content)
+        # the warning box at the end of the thread is not a comment
+        self.assertEqual(len(comments), 12)
+        self.assertEqual(comments[0].comment_user_name, "greenbean")
+        self.assertEqual(comments[0].comment_content, "用稅收補貼電費本來就不合理")
+        self.assertEqual(comments[0].comment_time, "03/27 21:20")
+
+    def test_push_tags(self):
+        push_tags = [comment.push_tag for comment in parse_push_comments(self.main_content)]
+        self.assertEqual(push_tags[:3], ["推", "→", "噓"])
+        self.assertEqual({tag: push_tags.count(tag) for tag in set(push_tags)}, {"推": 5, "→": 5, "噓": 2})
+
+    def test_short_push_row_skipped(self):
+        main_content = lxml.html.fromstring(
+            '<div id="main-content"><div class="push"><span class="hl push-tag">推 </span>'
+            '<span class="f3 hl push-userid">greenbean</span></div></div>')
+        self.assertEqual(parse_push_comments(main_content), [])
+
+    def test_content_with_link(self):
+        main_content = lxml.html.fromstring(
+            '<div id="main-content"><div class="push"><span class="hl push-tag">→ </span>'
+            '<span class="f3 hl push-userid">greenbean</span><span class="f3 push-content">: '
+            '<a href="https://www.ptt.cc/" rel="nofollow">https://www.ptt.cc/</a></span>'
+            '<span class="push-ipdatetime"> 03/27 21:20\n</span></div></div>')
+        self.assertEqual(parse_push_comments(main_content)[0].comment_content, "https://www.ptt.cc/")
+
+
+if __name__ == '__main__':
+    unittest.main()
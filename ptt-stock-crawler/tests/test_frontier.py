@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/22 15:00
+# @Desc    : crawl frontier and frontier worker test code
+
+import asyncio
+import contextlib
+import io
+import os
+import re
+import tempfile
+import threading
+import unittest
+from typing import List
+
+import httpx
+
+import asyn_crawler
+from common import PostContent, PostContentDetail, dataclass_to_dict
+from frontier import Frontier, RemoteFrontier, SQLiteFrontier, article_task, index_task, serve_frontier
+from frontier_worker import seed_board, work
+from mock_server import render_article_page, render_index_page
+
+LATEST_PAGE = 100
+
+# articles whose first fetch already failed
+failed_articles = set()
+
+
+class TestSQLiteFrontier(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "frontier.db")
+        self.frontier = SQLiteFrontier(self.db_path, max_attempts=2, retry_delay=0)
+
+    def tearDown(self):
+        self.frontier.close()
+        self.tmp_dir.cleanup()
+
+    def test_incomplete_backend_fails_when_created(self):
+        class PushOnlyFrontier(Frontier):
+            def push(self, tasks):
+                return len(tasks)
+
+        with self.assertRaises(TypeError):
+            PushOnlyFrontier()
+
+    def test_push_deduplicates(self):
+        self.assertEqual(self.frontier.push([index_task("Stock", 1), index_task("Stock", 2)]), 2)
+        self.assertEqual(self.frontier.push([index_task("Stock", 2), index_task("Stock", 3)]), 1)
+        # a done task is not pushed again
+        for task in self.frontier.lease("w1", 10):
+            self.frontier.ack(task)
+        self.assertEqual(self.frontier.push([index_task("Stock", 1)]), 0)
+        self.assertEqual(self.frontier.stats(), {"pending": 0, "leased": 0, "done": 3, "dead": 0})
+
+    def test_lease_priority_and_ack(self):
+        self.frontier.push([index_task("Stock", 1), article_task("Stock", "M.1.A.1", {"title": "t"})])
+        tasks = self.frontier.lease("w1", 1)
+        # articles first
+        self.assertEqual([task.kind for task in tasks], ["article"])
+        self.assertEqual(tasks[0].payload["post"], {"title": "t"})
+        self.assertEqual(self.frontier.stats()["leased"], 1)
+        self.frontier.ack(tasks[0])
+        self.assertEqual([task.kind for task in self.frontier.lease("w1", 10)], ["index"])
+        self.assertEqual(self.frontier.lease("w1", 10), [])
+
+    def test_expired_lease_is_leased_again(self):
+        self.frontier.push([index_task("Stock", 1)])
+        first = self.frontier.lease("w1", 1, lease_seconds=0)
+        second = self.frontier.lease("w2", 1, lease_seconds=0)
+        self.assertEqual(second[0].key, first[0].key)
+        self.assertEqual(second[0].attempts, 2)
+        # the ack of the expired lease is ignored
+        self.frontier.ack(first[0])
+        self.assertEqual(self.frontier.stats()["leased"], 1)
+        # out of attempts, the next expired lease is a dead letter
+        self.assertEqual(self.frontier.lease("w3", 1), [])
+        self.assertEqual(self.frontier.dead_letters()[0]["error"], "lease expired")
+
+    def test_nack_to_dead_letters_and_requeue(self):
+        self.frontier.push([index_task("Stock", 1)])
+        self.frontier.nack(self.frontier.lease("w1", 1)[0], "timeout")
+        self.assertEqual(self.frontier.stats()["pending"], 1)
+        self.frontier.nack(self.frontier.lease("w1", 1)[0], "timeout again")
+        self.assertEqual(self.frontier.stats()["dead"], 1)
+        self.assertEqual(self.frontier.dead_letters(), [
+            {"kind": "index", "key": "Stock/1", "attempts": 2, "worker_id": "w1", "error": "timeout again"}])
+        self.assertEqual(self.frontier.requeue_dead(), 1)
+        self.assertEqual(self.frontier.lease("w1", 1)[0].attempts, 1)
+
+    def test_two_connections_lease_disjoint_tasks(self):
+        self.frontier.push([index_task("Stock", page_number) for page_number in range(10)])
+        with SQLiteFrontier(self.db_path) as other:
+            first = self.frontier.lease("w1", 6)
+            second = other.lease("w2", 6)
+        self.assertEqual(len(first) + len(second), 10)
+        self.assertFalse({task.key for task in first} & {task.key for task in second})
+
+    def test_remote_frontier(self):
+        server = serve_frontier(self.frontier, host="127.0.0.1", port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            with RemoteFrontier(f"http://127.0.0.1:{server.server_address[1]}") as remote:
+                self.assertEqual(remote.push([index_task("Stock", 1), index_task("Stock", 1)]), 1)
+                tasks = remote.lease("remote", 5)
+                self.assertEqual([task.payload for task in tasks], [{"board": "Stock", "page_number": 1}])
+                remote.ack(tasks[0])
+                self.assertEqual(remote.stats()["done"], 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+async def mock_ptt(request: httpx.Request) -> httpx.Response:
+    page_name = request.url.path.split("/")[-1][:-len(".html")]
+    if page_name == "index":
+        return httpx.Response(200, text=render_index_page("Stock", LATEST_PAGE + 1))
+    if page_name.startswith("index"):
+        return httpx.Response(200, text=render_index_page("Stock", int(page_name[len("index"):]), posts_per_page=3))
+    # every first fetch of an article fails once
+    if page_name not in failed_articles:
+        failed_articles.add(page_name)
+        return httpx.Response(500, text="")
+    return httpx.Response(200, text=render_article_page("Stock", page_name, comments_count=1))
+
+
+class TestFrontierWorker(unittest.TestCase):
+    def setUp(self):
+        failed_articles.clear()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.frontier = SQLiteFrontier(os.path.join(self.tmp_dir.name, "frontier.db"), retry_delay=0)
+
+    def tearDown(self):
+        self.frontier.close()
+        self.tmp_dir.cleanup()
+
+    def test_seed_and_work(self):
+        save_posts: List[PostContentDetail] = []
+
+        async def run():
+            async with httpx.AsyncClient(base_url=asyn_crawler.BASE_HOST,
+                                         transport=httpx.MockTransport(mock_ptt)) as client:
+                self.assertEqual(await seed_board(client, self.frontier, "Stock", 3), 3)
+                # seeding twice adds nothing
+                self.assertEqual(await seed_board(client, self.frontier, "Stock", 3), 0)
+                # two workers share the frontier
+                await asyncio.gather(work(client, self.frontier, save_posts, "w1", concurrency=2),
+                                     work(client, self.frontier, save_posts, "w2", concurrency=2))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(run())
+
+        self.assertEqual(len(save_posts), 3 * 3)
+        self.assertEqual(len({post.detail_link for post in save_posts}), 3 * 3)
+        self.assertTrue(all(post.content for post in save_posts))
+        self.assertEqual(self.frontier.stats(), {"pending": 0, "leased": 0, "done": 3 + 3 * 3, "dead": 0})
+
+    def test_article_with_empty_body_is_done(self):
+        def mock_empty_article(request: httpx.Request) -> httpx.Response:
+            # only the header lines and the pushes
+            page = re.sub(r"(2024</span></div>)\n.*?(<div class=\"push\">)", r"\1\2",
+                          render_article_page("Stock", "M.1.A.1", comments_count=2), flags=re.S)
+            return httpx.Response(200, text=page)
+
+        save_posts: List[PostContentDetail] = []
+        post_content = PostContent(title="empty", detail_link="/bbs/Stock/M.1.A.1.html", push_count="2")
+        self.frontier.push([article_task("Stock", "M.1.A.1", dataclass_to_dict(post_content))])
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(mock_empty_article)) as client:
+                await work(client, self.frontier, save_posts, "w1")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(run())
+
+        self.assertEqual(self.frontier.stats()["done"], 1)
+        self.assertEqual((save_posts[0].content, len(save_posts[0].post_comments)), ("", 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/12 15:00
+# @Desc    : http response cache test code
+
+import asyncio
+import gzip
+import tempfile
+import unittest
+
+import httpx
+
+from crawler_kit.http_cache import CachingTransport, ResponseCache
+from http_client import create_sync_session
+
+PAGE = "<html><body>看板 Stock</body></html>".encode("utf-8")
+
+
+class TestCachingTransport(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.requests = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304, headers={"ETag": '"v1"'})
+        return httpx.Response(200, headers={"ETag": '"v1"', "Content-Type": "text/html; charset=utf-8"}, content=PAGE)
+
+    def fetch_twice(self, cache: ResponseCache, handler=None):
+        async def fetch():
+            transport = CachingTransport(httpx.MockTransport(handler or self.handler), cache)
+            async with httpx.AsyncClient(transport=transport) as client:
+                first = await client.get("https://www.ptt.cc/bbs/Stock/index.html")
+                second = await client.get("https://www.ptt.cc/bbs/Stock/index.html")
+            return first, second
+
+        return asyncio.run(fetch())
+
+    def test_revalidate_with_etag(self):
+        cache = ResponseCache(self.tmp_dir.name)
+        first, second = self.fetch_twice(cache)
+        self.assertEqual(first.text, second.text)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(self.requests[1].headers["If-None-Match"], '"v1"')
+        self.assertEqual(cache.stats()["revalidated"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["bytes_saved"], len(PAGE))
+
+    def test_fresh_entry_served_without_request(self):
+        cache = ResponseCache(self.tmp_dir.name, max_age=60)
+        first, second = self.fetch_twice(cache)
+        self.assertEqual(second.content, PAGE)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_repeated_headers_kept(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            headers = [("ETag", '"v1"'), ("Set-Cookie", "over18=1"), ("Set-Cookie", "theme=dark")]
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304, headers=headers[:1])
+            return httpx.Response(200, headers=headers, content=PAGE)
+
+        cache = ResponseCache(self.tmp_dir.name)
+        first, second = self.fetch_twice(cache, handler)
+        self.assertEqual(cache.stats()["revalidated"], 1)
+        self.assertEqual(second.headers.get_list("Set-Cookie"), ["over18=1", "theme=dark"])
+
+    def test_not_stored_without_validator_or_with_no_store(self):
+        for headers in ({"Content-Type": "text/html"}, {"ETag": '"v1"', "Cache-Control": "private, no-store"}):
+            def handler(request: httpx.Request) -> httpx.Response:
+                self.requests.append(request)
+                return httpx.Response(200, headers=headers, content=PAGE)
+
+            cache = ResponseCache(self.tmp_dir.name)
+            first, second = self.fetch_twice(cache, handler)
+            self.assertEqual(second.content, PAGE)
+            self.assertNotIn("If-None-Match", self.requests[-1].headers)
+            self.assertEqual(cache.stats()["misses"], 2)
+            self.assertEqual(cache.stats()["cached_bytes"], 0)
+            cache.close()
+
+    def test_stored_without_validator_when_served_fresh(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            return httpx.Response(200, headers={"Content-Type": "application/json"}, content=PAGE)
+
+        cache = ResponseCache(self.tmp_dir.name, max_age=60)
+        self.fetch_twice(cache, handler)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_gzip_page_cached_by_async_client_read_by_sync_session(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            headers = {"ETag": '"v1"', "Content-Encoding": "gzip", "Content-Type": "text/html; charset=utf-8"}
+            return httpx.Response(200, headers=headers, content=gzip.compress(PAGE))
+
+        cache = ResponseCache(self.tmp_dir.name, max_age=60)
+        first, second = self.fetch_twice(cache, handler)
+        self.assertEqual((first.content, second.content), (PAGE, PAGE))
+        with create_sync_session(cache=ResponseCache(self.tmp_dir.name, max_age=60)) as session:
+            response = session.get("https://www.ptt.cc/bbs/Stock/index.html")
+        self.assertEqual(response.content, PAGE)
+        self.assertEqual(response.text, PAGE.decode("utf-8"))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_encoded_entry_of_older_cache_dropped(self):
+        cache = ResponseCache(self.tmp_dir.name)
+        cache.store("a", 200, [("ETag", '"v1"'), ("Content-Encoding", "gzip")], gzip.compress(PAGE))
+        self.assertIsNone(cache.load("a"))
+        self.assertEqual(cache.stats()["cached_bytes"], 0)
+
+    def test_evict_above_max_bytes(self):
+        cache = ResponseCache(self.tmp_dir.name, max_bytes=len(PAGE) + 1)
+        cache.store("a", 200, [], PAGE)
+        cache.store("b", 200, [], PAGE)
+        self.assertIsNone(cache.load("a"))
+        self.assertIsNotNone(cache.load("b"))
+        self.assertEqual(cache.stats()["cached_bytes"], len(PAGE))
+
+    def test_expired_entry_dropped(self):
+        cache = ResponseCache(self.tmp_dir.name, ttl=-1)
+        cache.store("a", 200, [], PAGE)
+        self.assertIsNone(cache.load("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
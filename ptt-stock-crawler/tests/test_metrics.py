@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/16 17:00
+# @Desc    : crawl metrics test code
+
+import json
+import os
+import tempfile
+import unittest
+
+from crawler_kit.metrics import Histogram, Metrics, record_response
+
+
+class TestHistogram(unittest.TestCase):
+    def test_cumulative_buckets(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 3])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 4.05)
+        self.assertEqual(histogram.quantile(0.5), 1.0)
+        self.assertEqual(histogram.quantile(0.99), float("inf"))
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        record_response("article", 200, 1024, 0.02, registry=self.metrics)
+        record_response("article", 200, 2048, 0.3, registry=self.metrics)
+        record_response("index", 503, 10, 0.01, registry=self.metrics)
+        self.metrics.gauge_max("post_queue_depth_max", 3)
+        self.metrics.gauge_max("post_queue_depth_max", 1)
+
+    def test_counters_and_gauges(self):
+        self.assertEqual(self.metrics.counters["http_response_bytes_total"][(("endpoint", "article"),)], 3072)
+        self.assertEqual(
+            self.metrics.counters["http_responses_total"][(("endpoint", "index"), ("status", "503"))], 1)
+        self.assertEqual(self.metrics.gauges["post_queue_depth_max"][()], 3)
+
+    def test_prometheus_text(self):
+        text = self.metrics.to_prometheus()
+        self.assertIn("# TYPE http_request_seconds histogram", text)
+        self.assertIn('http_request_seconds_bucket{endpoint="article",le="0.025"} 1', text)
+        self.assertIn('http_request_seconds_bucket{endpoint="article",le="+Inf"} 2', text)
+        self.assertIn('http_request_seconds_count{endpoint="article"} 2', text)
+        self.assertIn("post_queue_depth_max 3", text)
+
+    def test_json_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "metrics.json")
+            self.metrics.write_snapshot(file_path)
+            with open(file_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        article_latency = [series for series in snapshot["http_request_seconds"]
+                           if series["labels"] == {"endpoint": "article"}][0]
+        self.assertEqual(article_latency["count"], 2)
+        self.assertEqual(article_latency["p50"], 0.025)
+
+    def test_timer(self):
+        with self.metrics.timer("parse_seconds", page_type="article"):
+            pass
+        self.assertEqual(self.metrics.histograms["parse_seconds"][(("page_type", "article"),)].count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
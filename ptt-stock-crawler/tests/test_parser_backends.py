@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/05 16:30
+# @Desc    : parser backends test code, every backend must extract the same data from the saved pages
+
+import os
+import unittest
+
+from common import parse_post_content
+from parser_backends import PARSER_BACKENDS, LexborHTMLParser, get_parser_backend
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(file_name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, file_name), encoding="utf-8") as f:
+        return f.read()
+
+
+class TestParserBackends(unittest.TestCase):
+    def setUp(self):
+        self.index_html = read_fixture("ptt_stock_index.html")
+        self.article_html = read_fixture("ptt_stock_article.html")
+        self.backend_names = [name for name in PARSER_BACKENDS if name != "selectolax" or LexborHTMLParser]
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_parser_backend("regex")
+
+    def test_bs4_backend_matches_parse_post_content(self):
+        self.assertEqual(get_parser_backend("bs4").parse_post_content(self.article_html),
+                         parse_post_content(self.article_html))
+
+    def test_post_detail(self):
+        post_detail = get_parser_backend("bs4").parse_post_detail(self.article_html)
+        self.assertEqual(post_detail.publish_date, "Wed Mar 27 21:18:16 2024")
+        self.assertTrue(post_detail.content.startswith("\n原文標題：\n"))
+        self.assertIn("<能源轉型>需要時間 & 溝通", post_detail.content)
+        # the warning box at the end of the thread is not a comment
+        self.assertEqual(len(post_detail.post_comments), 12)
+        self.assertEqual(post_detail.post_comments[0].comment_user_name, "greenbean")
+        self.assertEqual(post_detail.post_comments[0].comment_time, "03/27 21:20")
+        self.assertEqual([comment.push_tag for comment in post_detail.post_comments[:3]], ["推", "→", "噓"])
+
+    def test_backends_agree(self):
+        reference = get_parser_backend("bs4")
+        for name in self.backend_names:
+            with self.subTest(backend=name):
+                backend = get_parser_backend(name)
+                self.assertEqual(backend.parse_post_list(self.index_html), reference.parse_post_list(self.index_html))
+                self.assertEqual(backend.parse_post_content(self.article_html),
+                                 reference.parse_post_content(self.article_html))
+                self.assertEqual(backend.parse_post_comments(self.article_html),
+                                 reference.parse_post_comments(self.article_html))
+                self.assertEqual(backend.parse_post_detail(self.article_html),
+                                 reference.parse_post_detail(self.article_html))
+
+    def test_bytes_path_matches_str_path(self):
+        for name in self.backend_names:
+            backend = get_parser_backend(name)
+            # the meta charset of the page says utf-8, the given encoding wins
+            for encoding in ("utf-8", "cp950"):
+                with self.subTest(backend=name, encoding=encoding):
+                    self.assertEqual(backend.parse_post_list_bytes(self.index_html.encode(encoding), encoding),
+                                     backend.parse_post_list(self.index_html))
+                    self.assertEqual(backend.parse_post_detail_bytes(self.article_html.encode(encoding), encoding),
+                                     backend.parse_post_detail(self.article_html))
+
+    def test_bytes_path_replaces_invalid_bytes(self):
+        content = self.article_html.encode("utf-8").replace("能源轉型".encode("utf-8"), b"\xff\xfe", 1)
+        for name in self.backend_names:
+            with self.subTest(backend=name):
+                post_detail = get_parser_backend(name).parse_post_detail_bytes(content, "utf-8")
+                self.assertIn("\ufffd", post_detail.content)
+
+    def test_comment_iterator_matches_comment_list(self):
+        for name in self.backend_names:
+            backend = get_parser_backend(name)
+            for encoding in ("utf-8", "cp950"):
+                with self.subTest(backend=name, encoding=encoding):
+                    self.assertEqual(list(backend.iter_post_comments_bytes(self.article_html.encode(encoding), encoding)),
+                                     backend.parse_post_comments(self.article_html))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/23 11:30
+# @Desc    : record / replay test code, based on the saved pages in tests/fixtures
+
+import asyncio
+import contextlib
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+import httpx
+
+import asyn_crawler
+from crawler_kit.replay import Cassette, RecordingTransport, start_replay_server
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(file_name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, file_name), "rb") as f:
+        return f.read()
+
+
+async def saved_ptt(request: httpx.Request) -> httpx.Response:
+    # the saved pages, gzipped like the real host does
+    file_name = "ptt_stock_index.html" if "/index" in request.url.path else "ptt_stock_article.html"
+    return httpx.Response(200, content=gzip.compress(read_fixture(file_name)),
+                          headers={"Content-Type": "text/html; charset=utf-8", "Content-Encoding": "gzip"})
+
+
+async def fetch_page_and_first_article(client: httpx.AsyncClient):
+    page_posts = await asyn_crawler.fetch_bbs_posts_page(client, 7084)
+    first_post = [post for post in page_posts if post.detail_link][0]
+    return page_posts, await asyn_crawler.fetch_bbs_post_detail(client, first_post)
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cassette_dir = os.path.join(self.tmp_dir.name, "cassette")
+        self.base_host = asyn_crawler.BASE_HOST
+
+    def tearDown(self):
+        asyn_crawler.BASE_HOST = self.base_host
+        self.tmp_dir.cleanup()
+
+    def test_cassette_matches_path_and_body(self):
+        cassette = Cassette(self.cassette_dir)
+        cassette.record("GET", "https://www.ptt.cc/bbs/Stock/index.html?x=1", b"", 200, {"ETag": '"1"'}, b"first")
+        cassette.record("GET", "https://www.ptt.cc/bbs/Stock/index.html", b"", 200, {"ETag": '"2"'}, b"second")
+        cassette.record("POST", "https://host/v1/finance/screener?crumb=a", b'{"offset": 0}', 200, {}, b"page 0")
+        cassette.record("POST", "https://host/v1/finance/screener?crumb=a", b'{"offset": 100}', 200, {}, b"page 1")
+
+        # reloaded from the directory, the last recording of a request wins
+        cassette = Cassette(self.cassette_dir)
+        self.assertEqual(len(cassette), 3)
+        entry, body = cassette.lookup("GET", "/bbs/Stock/index.html")
+        self.assertEqual((entry.headers, body), ({"ETag": '"2"'}, b"second"))
+        self.assertEqual(cassette.lookup("POST", "/v1/finance/screener", b'{"offset": 100}')[1], b"page 1")
+        self.assertIsNone(cassette.lookup("GET", "/bbs/Stock/index1.html"))
+
+    def test_record_then_replay_the_crawl(self):
+        async def record():
+            transport = RecordingTransport(httpx.MockTransport(saved_ptt), Cassette(self.cassette_dir))
+            async with httpx.AsyncClient(base_url=asyn_crawler.BASE_HOST, transport=transport) as client:
+                return await fetch_page_and_first_article(client)
+
+        async def replay(base_host: str):
+            async with httpx.AsyncClient(base_url=base_host) as client:
+                return await fetch_page_and_first_article(client)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            recorded_posts, recorded_detail = asyncio.run(record())
+            server, base_host = start_replay_server(self.cassette_dir)
+            try:
+                asyn_crawler.BASE_HOST = base_host
+                replayed_posts, replayed_detail = asyncio.run(replay(base_host))
+            finally:
+                server.shutdown()
+
+        self.assertTrue(recorded_detail.content)
+        self.assertEqual(replayed_posts, recorded_posts)
+        # the detail link carries the host it was fetched from, compare the rest
+        self.assertEqual(replayed_detail.content, recorded_detail.content)
+        self.assertEqual(replayed_detail.post_comments, recorded_detail.post_comments)
+        self.assertEqual(server.stats(), {"served": 2, "missed": 0, "errors": 0, "resets": 0})
+
+    def test_error_injection(self):
+        Cassette(self.cassette_dir).record("GET", "https://www.ptt.cc/bbs/Stock/index.html", b"", 200, {}, b"ok")
+        server, base_host = start_replay_server(self.cassette_dir, error_rate=1.0)
+        try:
+            with httpx.Client(base_url=base_host) as client:
+                self.assertEqual(client.get("/bbs/Stock/index.html").status_code, 503)
+                server.error_rate, server.reset_rate = 0.0, 1.0
+                with self.assertRaises(httpx.NetworkError):
+                    client.get("/bbs/Stock/index.html")
+                server.reset_rate = 0.0
+                self.assertEqual(client.get("/bbs/Stock/index.html").text, "ok")
+                self.assertEqual(client.get("/bbs/Stock/index1.html").status_code, 404)
+        finally:
+            server.shutdown()
+        self.assertEqual(server.stats(), {"served": 1, "missed": 1, "errors": 1, "resets": 1})
+
+    def test_seeded_draws_repeat(self):
+        draws = []
+        for _ in range(2):
+            server, _ = start_replay_server(self.cassette_dir, latency=0.01, jitter=0.05, seed=7)
+            draws.append([server.draw() for _ in range(5)])
+            server.shutdown()
+        self.assertEqual(draws[0], draws[1])
+        self.assertTrue(all(0.01 <= delay <= 0.06 for delay, _ in draws[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/11 14:00
+# @Desc    : seen article index test code
+
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from common import PostContent, PostContentDetail, get_article_id
+from seen_index import SeenArticleIndex
+
+
+class TestSeenArticleIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "seen.db")
+        self.posts = [
+            PostContent(title="a", detail_link="/bbs/Stock/M.1711544298.A.9F8.html", push_count="6"),
+            PostContent(title="b", detail_link="/bbs/Stock/M.1711544412.A.2C1.html", push_count="爆"),
+            PostContent(title="deleted", detail_link="", push_count=""),
+        ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def fetched(self, post: PostContent) -> PostContentDetail:
+        return PostContentDetail(title=post.title, detail_link="https://www.ptt.cc" + post.detail_link,
+                                 push_count=post.push_count, content="內文")
+
+    def test_get_article_id(self):
+        self.assertEqual(get_article_id("/bbs/Stock/M.1711544298.A.9F8.html"), "M.1711544298.A.9F8")
+        self.assertEqual(get_article_id("https://www.ptt.cc/bbs/Stock/M.1711544298.A.9F8.html"), "M.1711544298.A.9F8")
+
+    def test_unchanged_posts_are_skipped_after_reopen(self):
+        with SeenArticleIndex(self.db_path) as seen_index:
+            self.assertEqual(seen_index.filter_changed(self.posts), self.posts[:2])
+            saved = []
+            tracked = seen_index.track(saved)
+            tracked.extend([self.fetched(post) for post in self.posts[:2]])
+            self.assertEqual(len(tracked), 2)
+
+        self.posts[0].push_count = "7"
+        with SeenArticleIndex(self.db_path) as seen_index:
+            self.assertEqual(seen_index.filter_changed(self.posts), [self.posts[0]])
+
+    def test_failed_fetch_is_not_marked(self):
+        with SeenArticleIndex(self.db_path) as seen_index:
+            seen_index.track([]).append(PostContentDetail(detail_link=self.posts[0].detail_link, push_count="6"))
+            self.assertEqual(seen_index.filter_changed(self.posts[:1]), self.posts[:1])
+
+    def test_fetched_post_with_empty_body_is_marked(self):
+        with SeenArticleIndex(self.db_path) as seen_index:
+            seen_index.track([]).append(PostContentDetail(detail_link=self.posts[0].detail_link, push_count="6",
+                                                          publish_date="Wed Mar 27 21:11:36 2024"))
+            self.assertEqual(seen_index.filter_changed(self.posts[:1]), [])
+
+    def test_quiet_unless_verbose(self):
+        with SeenArticleIndex(self.db_path) as seen_index:
+            with redirect_stdout(io.StringIO()) as output:
+                seen_index.filter_changed(self.posts)
+            self.assertEqual(output.getvalue(), "")
+            with redirect_stdout(io.StringIO()) as output:
+                seen_index.filter_changed(self.posts, verbose=True)
+            self.assertIn("2 of 2 posts", output.getvalue())
+
+    def test_saturated_push_count_refreshed_by_age(self):
+        with SeenArticleIndex(self.db_path, refresh_after=-1) as seen_index:
+            seen_index.mark_fetched(self.posts[0])
+            seen_index.mark_fetched(self.posts[1])
+            self.assertEqual(seen_index.filter_changed(self.posts), [self.posts[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/06 15:00
+# @Desc    : post sinks test code
+
+import json
+import os
+import tempfile
+import unittest
+
+from common import PostComment, PostContentDetail
+from storage import JsonlPostSink, decode_post, jsonl_to_parquet, pa, push_count_value
+
+
+class TestJsonlPostSink(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "posts.jsonl")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_append_one_line_per_post(self):
+        post = PostContentDetail(title="標題", author="John Doe", content="內文",
+                                 post_comments=[PostComment(comment_user_name="Jane Doe", comment_content="推")])
+        with JsonlPostSink(self.file_path, fsync_every=1) as sink:
+            sink.append(post)
+            sink.extend([PostContentDetail(title="second")])
+            self.assertEqual(len(sink), 2)
+
+        with open(self.file_path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        first = json.loads(lines[0])
+        self.assertEqual(first["title"], "標題")
+        self.assertEqual(first["post_comments"][0]["comment_user_name"], "Jane Doe")
+        self.assertEqual(json.loads(lines[1])["title"], "second")
+
+    def test_written_before_close(self):
+        sink = JsonlPostSink(self.file_path)
+        sink.append(PostContentDetail(title="flushed"))
+        with open(self.file_path, encoding="utf-8") as f:
+            self.assertEqual(json.loads(f.readline())["title"], "flushed")
+        sink.close()
+
+    def test_overwrite_unless_appending(self):
+        for titles, append in ((["first run"], False), (["second run"], False), (["resumed"], True)):
+            with JsonlPostSink(self.file_path, append=append) as sink:
+                sink.extend([PostContentDetail(title=title) for title in titles])
+        with open(self.file_path, encoding="utf-8") as f:
+            self.assertEqual([json.loads(line)["title"] for line in f], ["second run", "resumed"])
+
+
+class TestParquetExport(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.jsonl_path = os.path.join(self.tmp_dir.name, "posts.jsonl")
+        self.posts = [
+            PostContentDetail(title="標題", detail_link="/bbs/Stock/M.1.A.1.html", push_count="爆", content="內文",
+                              post_comments=[PostComment("Jane Doe", "推", "03/27 22:20", "推"),
+                                             PostComment("John Doe", "噓", "03/27 22:21", "噓")]),
+            PostContentDetail(title="second", detail_link="/bbs/Gossiping/M.2.A.2.html", push_count="X3"),
+        ]
+        with JsonlPostSink(self.jsonl_path) as sink:
+            sink.extend(self.posts)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_push_count_value(self):
+        self.assertEqual([push_count_value(value) for value in ("", "7", "爆", "X3", "XX", "??")],
+                         [None, 7, 100, -30, -100, None])
+
+    def test_decode_post(self):
+        with open(self.jsonl_path, "rb") as f:
+            self.assertEqual([decode_post(line) for line in f], self.posts)
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_jsonl_to_parquet(self):
+        import pyarrow.dataset
+
+        dir_path = os.path.join(self.tmp_dir.name, "dataset")
+        self.assertEqual(jsonl_to_parquet(self.jsonl_path, dir_path, batch_size=1), 2)
+        posts = pyarrow.dataset.dataset(os.path.join(dir_path, "posts")).to_table().to_pylist()
+        self.assertEqual([(post["article_id"], post["board"], post["push_count_value"], post["comments_count"])
+                          for post in posts], [("M.1.A.1", "Stock", 100, 2), ("M.2.A.2", "Gossiping", -30, 0)])
+        comments = pyarrow.dataset.dataset(os.path.join(dir_path, "comments")).to_table().to_pylist()
+        self.assertEqual([(comment["article_id"], comment["comment_index"], comment["push_tag"])
+                          for comment in comments], [("M.1.A.1", 0, "推"), ("M.1.A.1", 1, "噓")])
+
+
+if __name__ == '__main__':
+    unittest.main()
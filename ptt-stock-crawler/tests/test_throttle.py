@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/14 11:00
+# @Desc    : politeness layer test code
+
+import asyncio
+import time
+import unittest
+from typing import List
+
+import httpx
+
+from crawler_kit.throttle import AdaptiveConcurrencyLimiter, FairSlots, Politeness, PoliteTransport, RetryBudget, \
+    TokenBucket, parse_retry_after
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate_limit(self):
+        async def acquire_all():
+            bucket = TokenBucket(rate=50, burst=1)
+            start = time.perf_counter()
+            await asyncio.gather(*[bucket.acquire() for _ in range(6)])
+            return time.perf_counter() - start
+
+        # the first token is in the bucket, the next 5 come at 50 per second
+        self.assertGreaterEqual(asyncio.run(acquire_all()), 0.09)
+
+
+class TestAdaptiveConcurrencyLimiter(unittest.TestCase):
+    def test_additive_increase_multiplicative_decrease(self):
+        async def run():
+            limiter = AdaptiveConcurrencyLimiter(initial=4, max_limit=5, decrease_interval=0)
+            limits = []
+            for overloaded in [False] * 4 + [True, True] + [False] * 3:
+                await limiter.acquire()
+                await limiter.release(overloaded=overloaded)
+                limits.append(limiter.limit)
+            return limits
+
+        self.assertEqual(asyncio.run(run()), [4, 4, 4, 5, 2, 1, 2, 2, 3])
+
+
+class TestPoliteTransport(unittest.TestCase):
+    def setUp(self):
+        self.statuses: List[int] = []
+
+    def crawl(self, politeness: Politeness, statuses: List[int]) -> httpx.Response:
+        async def handler(request: httpx.Request) -> httpx.Response:
+            status = statuses.pop(0) if statuses else 200
+            self.statuses.append(status)
+            if status == 0:
+                raise httpx.ConnectTimeout("timeout", request=request)
+            if status == -1:
+                raise httpx.RemoteProtocolError("Server disconnected without sending a response.", request=request)
+            return httpx.Response(status, text="ok" if status == 200 else "busy")
+
+        async def fetch():
+            transport = PoliteTransport(httpx.MockTransport(handler), politeness)
+            async with httpx.AsyncClient(transport=transport) as client:
+                return await client.get("https://www.ptt.cc/bbs/Stock/index.html")
+
+        return asyncio.run(fetch())
+
+    def test_retries_overloaded_responses(self):
+        politeness = Politeness(rate=None, backoff_base=0.001)
+        response = self.crawl(politeness, [503, 0, 429])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses, [503, 0, 429, 200])
+        self.assertEqual(politeness.stats()["retries"], 3)
+        self.assertEqual(politeness.stats()["gave_up"], 0)
+
+    def test_protocol_errors_retried_and_release_the_slot(self):
+        politeness = Politeness(rate=None, initial_concurrency=2, backoff_base=0.001)
+        self.assertEqual(self.crawl(politeness, [-1, 200]).status_code, 200)
+        self.assertEqual(politeness.overloaded, 1)
+        # more failures than slots, none of them may keep its slot
+        politeness = Politeness(rate=None, initial_concurrency=2, max_retries=0)
+        for _ in range(3):
+            with self.assertRaises(httpx.RemoteProtocolError):
+                self.crawl(politeness, [-1])
+        self.assertEqual(politeness.limiter("www.ptt.cc").in_flight, 0)
+        self.assertEqual(self.crawl(politeness, [200]).status_code, 200)
+
+    def test_gives_up_after_max_retries(self):
+        politeness = Politeness(rate=None, max_retries=2, backoff_base=0.001)
+        response = self.crawl(politeness, [500] * 5)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(self.statuses), 3)
+        self.assertEqual(politeness.gave_up, 1)
+
+    def test_retry_budget(self):
+        politeness = Politeness(rate=None, backoff_base=0.001, retry_budget=RetryBudget(ratio=0, min_retries=1))
+        response = self.crawl(politeness, [503] * 5)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.statuses), 2)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+
+class TestFairSlots(unittest.TestCase):
+    def test_round_robin_between_keys(self):
+        async def run():
+            slots = FairSlots(total=1)
+            order: List[str] = []
+
+            async def request(key: str):
+                await slots.acquire(key)
+                order.append(key)
+                await asyncio.sleep(0)
+                slots.release(key)
+
+            # Stock queues its whole backlog before the other boards ask for a slot
+            await slots.acquire("Stock")
+            tasks = [asyncio.ensure_future(request("Stock")) for _ in range(4)]
+            tasks += [asyncio.ensure_future(request(board)) for board in ("Gossiping", "Option", "Gossiping")]
+            await asyncio.sleep(0)
+            slots.release("Stock")
+            await asyncio.gather(*tasks)
+            return order, slots
+
+        order, slots = asyncio.run(run())
+        self.assertEqual(order, ["Stock", "Gossiping", "Option", "Stock", "Gossiping", "Stock", "Stock"])
+        self.assertEqual(slots.in_flight, 0)
+        self.assertEqual(slots.granted, {"Stock": 5, "Gossiping": 2, "Option": 1})
+
+    def test_per_key_limit(self):
+        async def run():
+            slots = FairSlots(total=4, per_key=2)
+            max_in_flight = {"Stock": 0, "Option": 0}
+
+            async def request(key: str):
+                await slots.acquire(key)
+                max_in_flight[key] = max(max_in_flight[key], slots.key_in_flight[key])
+                await asyncio.sleep(0.001)
+                slots.release(key)
+
+            await asyncio.gather(*[request("Stock") for _ in range(6)], *[request("Option") for _ in range(2)])
+            return max_in_flight
+
+        self.assertEqual(asyncio.run(run()), {"Stock": 2, "Option": 2})
+
+    def test_cancelled_waiter_skipped(self):
+        async def run():
+            slots = FairSlots(total=1)
+            await slots.acquire("Stock")
+            cancelled = asyncio.ensure_future(slots.acquire("Option"))
+            waiting = asyncio.ensure_future(slots.acquire("Option"))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await asyncio.sleep(0)
+            slots.release("Stock")
+            await waiting
+            return slots.key_in_flight
+
+        self.assertEqual(asyncio.run(run()), {"Stock": 0, "Option": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
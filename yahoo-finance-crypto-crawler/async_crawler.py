@@ -4,19 +4,29 @@
 # @Desc    : Asynchronous Yahoo Finance Crypto API Crawler
 
 import asyncio
-import csv
-import random
 import time
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-import aiofiles
 import httpx
 
-from common import SymbolContent, request_params_and_headers_factory
+from common import SymbolContent, create_async_client, request_params_and_headers_factory
+from crawler_kit.http_cache import ResponseCache
+from crawler_kit.metrics import metrics, record_response
+from crawler_kit.replay import Cassette
+from crawler_kit.throttle import Politeness, TokenBucket
+from storage import SymbolCsvWriter, save_data_to_parquet
 
 HOST = "https://query1.finance.yahoo.com"
 SYMBOL_QUERY_API_URI = "/v1/finance/screener"
 PAGE_SIZE = 100  # alternatives: 25, 50, 100
+HTTP_CACHE_DIR = ".http_cache"  # on-disk response cache revalidated with ETag / Last-Modified, None to disable
+CONCURRENT_FETCH = True  # request all the pages at once under RATE_LIMIT, otherwise walk the offsets one by one
+FETCH_CONCURRENCY = 8  # max number of page requests in flight
+RATE_LIMIT = 5.0  # max page requests per second
+VERBOSE = True  # print every request and symbol, turn it off on large runs
+EXPORT_FORMAT = "csv"  # csv, or parquet with numeric columns (needs pyarrow)
+METRICS_PATH = "yahoo_crawler_metrics.prom"  # metrics snapshot written at the end of the run, .json for json, None to skip
+RECORD_DIR = None  # cassette directory recording every response for replay.py, None to disable
 
 
 def parse_symbol_content(quote_item: Dict) -> SymbolContent:
@@ -32,68 +42,153 @@ def parse_symbol_content(quote_item: Dict) -> SymbolContent:
     symbol_content.change_price = quote_item["regularMarketChange"]["fmt"]
     symbol_content.change_percent = quote_item["regularMarketChangePercent"]["fmt"]
     symbol_content.market_price = quote_item["marketCap"]["fmt"]
+    # the raw numbers, so the analysis does not parse the display strings again
+    symbol_content.price_raw = quote_item["regularMarketPrice"].get("raw")
+    symbol_content.change_price_raw = quote_item["regularMarketChange"].get("raw")
+    symbol_content.change_percent_raw = quote_item["regularMarketChangePercent"].get("raw")
+    symbol_content.market_price_raw = quote_item["marketCap"].get("raw")
     return symbol_content
 
 
-async def fetch_currency_data_list(max_total_count: int) -> List[SymbolContent]:
+async def fetch_currency_data_list(client: httpx.AsyncClient, max_total_count: int) -> List[SymbolContent]:
     """
     Fetch currency data list.
+    :param client: Shared http client
     :param max_total_count:
     :return:
     """
     symbol_data_list: List[SymbolContent] = []
     page_start = 0
     while page_start <= max_total_count:
-        response_dict: Dict = await send_request(page_start=page_start, page_size=PAGE_SIZE)
-        for quote in response_dict["finance"]["result"][0]["quotes"]:
-            parsed_content: SymbolContent = parse_symbol_content(quote)
-            print(parsed_content)
-            symbol_data_list.append(parsed_content)
+        response_dict: Dict = await send_request(client, page_start=page_start, page_size=PAGE_SIZE)
+        with metrics.timer("parse_seconds", page_type="screener"):
+            for quote in response_dict["finance"]["result"][0]["quotes"]:
+                parsed_content: SymbolContent = parse_symbol_content(quote)
+                if VERBOSE:
+                    print(parsed_content)
+                symbol_data_list.append(parsed_content)
         page_start += PAGE_SIZE
-        await asyncio.sleep(random.random())
     return symbol_data_list
 
 
-async def send_request(page_start: int, page_size: int) -> Dict[str, Any]:
+async def fetch_currency_data_list_concurrent(client: httpx.AsyncClient, max_total_count: int,
+                                              first_page: Optional[Dict] = None,
+                                              concurrency: int = FETCH_CONCURRENCY,
+                                              rate_limiter: Optional[TokenBucket] = None) -> List[SymbolContent]:
+    """
+    Fetch currency data list, every offset is known from the total count so all the pages are requested at once,
+    at most `concurrency` at a time. The quotes are returned in offset order.
+    :param client: Shared http client
+    :param max_total_count:
+    :param first_page: Response of offset 0 if already fetched, it is not requested again
+    :param concurrency: Max number of page requests in flight
+    :param rate_limiter: Optional token bucket of the page requests, for a client without the Politeness of
+                         run_crawler / run_poller which already holds them to RATE_LIMIT
+    :return:
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch_page(page_start: int) -> Dict:
+        if page_start == 0 and first_page:
+            return first_page
+        async with semaphore:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            return await send_request(client, page_start=page_start, page_size=PAGE_SIZE)
+
+    # gather returns the pages in offset order whatever order they finish in
+    pages: List[Dict] = await asyncio.gather(
+        *[fetch_page(page_start) for page_start in range(0, max_total_count, PAGE_SIZE)])
+    symbol_data_list: List[SymbolContent] = []
+    for response_dict in pages:
+        with metrics.timer("parse_seconds", page_type="screener"):
+            for quote in response_dict["finance"]["result"][0]["quotes"]:
+                parsed_content: SymbolContent = parse_symbol_content(quote)
+                if VERBOSE:
+                    print(parsed_content)
+                symbol_data_list.append(parsed_content)
+    return symbol_data_list
+
+
+async def send_request(client: httpx.AsyncClient, page_start: int, page_size: int, sort_field: Optional[str] = None,
+                       sort_type: Optional[str] = None) -> Dict[str, Any]:
     """
     Send request to Yahoo Finance API.
+    :param client: Shared http client
     :param page_start: Offset
     :param page_size: Size
+    :param sort_field: Screener sort field, e.g. percentchange, intradaymarketcap by default
+    :param sort_type: ASC or DESC, DESC by default
     :return:
     """
-    print(f"[send_request] page_start:{page_start}")
+    if VERBOSE:
+        print(f"[send_request] page_start:{page_start}")
     req_url = HOST + SYMBOL_QUERY_API_URI
     common_params, headers, common_payload_data = request_params_and_headers_factory()
     # 修改分页变动参数
     common_payload_data["offset"] = page_start
     common_payload_data["size"] = page_size
-
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url=req_url, params=common_params, json=common_payload_data, headers=headers,
-                                     timeout=30)
+    if sort_field:
+        common_payload_data["sortField"] = sort_field
+    if sort_type:
+        common_payload_data["sortType"] = sort_type
+
+    start = time.perf_counter()
+    response = await client.post(url=req_url, params=common_params, json=common_payload_data, headers=headers,
+                                 timeout=30)
+    record_response("screener", response.status_code, len(response.content), time.perf_counter() - start)
     if response.status_code != 200:
         raise Exception("An error occurred with the request, reason:", response.text)
     try:
-        response_dict: Dict = response.json()
+        with metrics.timer("parse_seconds", page_type="json"):
+            response_dict: Dict = response.json()
         return response_dict
     except Exception as e:
         raise e
 
 
-async def get_max_total_count() -> int:
+async def get_first_page(client: httpx.AsyncClient) -> Dict[str, Any]:
     """
-    Get the maximum number of currencies.
-    :return:
+    Get the first page, it carries the maximum number of currencies and the first PAGE_SIZE quotes.
+    :param client: Shared http client
+    :return: Response dict, empty on error
     """
     print("Start getting the maximum number of coins")
     try:
-        response_dict: Dict = await send_request(page_start=0, page_size=PAGE_SIZE)
-        total_num: int = response_dict["finance"]["result"][0]["total"]
-        print(f"Get {total_num} coins.")
-        return total_num
+        response_dict: Dict = await send_request(client, page_start=0, page_size=PAGE_SIZE)
+        print(f"Get {response_dict['finance']['result'][0]['total']} coins.")
+        return response_dict
     except Exception as e:
         print("Error occurred when getting the maximum number of coins, reason:", e)
-        return 0
+        return {}
+
+
+async def get_max_total_count(client: httpx.AsyncClient) -> int:
+    """
+    Get the maximum number of currencies.
+    :param client: Shared http client
+    :return:
+    """
+    response_dict: Dict = await get_first_page(client)
+    return response_dict["finance"]["result"][0]["total"] if response_dict else 0
+
+
+async def fetch_all_symbols(client: httpx.AsyncClient) -> List[SymbolContent]:
+    """
+    One full screener pass.
+    :param client: Shared http client
+    :return:
+    """
+    if CONCURRENT_FETCH:
+        # step1: Get the first page and the maximum number of currencies
+        first_page: Dict = await get_first_page(client)
+        max_total: int = first_page["finance"]["result"][0]["total"] if first_page else 0
+        # step2: Fetch the other pages concurrently
+        return await fetch_currency_data_list_concurrent(client, max_total, first_page)
+    # step1: Get the maximum number of currencies
+    max_total: int = await get_max_total_count(client)
+    # step2: Fetch currency data list
+    return await fetch_currency_data_list(client, max_total)
 
 
 async def save_data_to_csv(save_file_name: str, currency_data_list: List[SymbolContent]) -> None:
@@ -103,32 +198,44 @@ async def save_data_to_csv(save_file_name: str, currency_data_list: List[SymbolC
     :param currency_data_list:
     :return:
     """
-    async with aiofiles.open(save_file_name, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        # Write the header of the CSV file
-        await writer.writerow(SymbolContent.get_fields())
-
-        # Write all symbol data to the CSV file
-        for symbol in currency_data_list:
-            await writer.writerow([symbol.symbol, symbol.name, symbol.price, symbol.change_price, symbol.change_percent,
-                                   symbol.market_price])
+    # the rows are formatted in memory and written in large chunks, not one awaited write per row
+    async with SymbolCsvWriter(save_file_name) as writer:
+        await writer.extend(currency_data_list)
 
 
-async def run_crawler(save_file_name: str) -> None:
+async def run_crawler(save_file_name: str) -> List[SymbolContent]:
     """
     Run crawler.
     :param save_file_name:
-    :return:
+    :return: Symbols of the run, snapshot.symbols_to_frame() turns them into a columnar snapshot
     """
-    # step1: Get the maximum number of currencies
-    max_total: int = await get_max_total_count()
-    # step2: Fetch currency data list
-    data_list: List[SymbolContent] = await fetch_currency_data_list(max_total)
-    # step3: Save data to CSV
-    await save_data_to_csv(save_file_name, data_list)
+    metrics.reset()
+    # the screener is queried with POST, the payload is part of the cache key
+    # a recording run downloads every page, the revalidated ones would only record a 304
+    cache = ResponseCache(HTTP_CACHE_DIR, methods=("POST",)) if HTTP_CACHE_DIR and not RECORD_DIR else None
+    # rate limit, AIMD concurrency and retries of every request, retries included in the rate
+    politeness = Politeness(rate=RATE_LIMIT, initial_concurrency=FETCH_CONCURRENCY, max_concurrency=FETCH_CONCURRENCY)
+    # one pooled keep-alive client for the whole run
+    recorder = Cassette(RECORD_DIR) if RECORD_DIR else None
+    async with create_async_client(cache=cache, politeness=politeness, recorder=recorder) as client:
+        # step1 + step2: Fetch every page of the screener
+        data_list: List[SymbolContent] = await fetch_all_symbols(client)
+    # step3: Save data to CSV or Parquet
+    if save_file_name.endswith(".parquet"):
+        save_data_to_parquet(save_file_name, data_list)
+    else:
+        await save_data_to_csv(save_file_name, data_list)
+    if cache is not None:
+        print("HTTP cache: ", cache.stats())
+    print("Politeness: ", politeness.stats())
+    metrics.inc("symbols_total", len(data_list))
+    if METRICS_PATH:
+        metrics.write_snapshot(METRICS_PATH)
+        print("Metrics snapshot: ", METRICS_PATH)
+    return data_list
 
 
 if __name__ == '__main__':
     timestamp = int(time.time())
-    save_csv_file_name = f"symbol_data_{timestamp}.csv"
-    asyncio.run(run_crawler(save_csv_file_name))
+    save_file_name = f"symbol_data_{timestamp}.{EXPORT_FORMAT}"
+    asyncio.run(run_crawler(save_file_name))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/13 17:00
+# @Desc    : Benchmark the offset by offset screener walk vs the concurrent fan-out against a mocked screener API,
+#            run from yahoo-finance-crypto-crawler: python -m benchmarks.bench_concurrent_fetch
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+from typing import List
+
+import httpx
+
+import async_crawler
+from common import SymbolContent
+from crawler_kit.throttle import TokenBucket
+
+TOTAL = 2000  # symbols of the mocked screener
+LATENCY = 0.2  # seconds the mocked API sleeps per request
+
+
+def fmt(value: float) -> dict:
+    return {"raw": value, "fmt": f"{value:,.2f}"}
+
+
+async def mock_screener(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(LATENCY)
+    payload = json.loads(request.content)
+    offset, size = payload["offset"], payload["size"]
+    quotes = [{
+        "symbol": f"C{index}-USD",
+        "shortName": f"Coin {index} USD",
+        "regularMarketPrice": fmt(index * 1.5),
+        "regularMarketChange": fmt(index * 0.01),
+        "regularMarketChangePercent": fmt(0.5),
+        "marketCap": fmt(index * 1e6),
+    } for index in range(offset, min(offset + size, TOTAL))]
+    return httpx.Response(200, json={"finance": {"result": [{"total": TOTAL, "quotes": quotes}]}})
+
+
+async def crawl(concurrent: bool) -> List[SymbolContent]:
+    async with httpx.AsyncClient(transport=httpx.MockTransport(mock_screener)) as client:
+        if concurrent:
+            first_page = await async_crawler.get_first_page(client)
+            max_total = first_page["finance"]["result"][0]["total"]
+            # the mocked client has no Politeness, hold the fan-out to the crawler's rate
+            return await async_crawler.fetch_currency_data_list_concurrent(
+                client, max_total, first_page, rate_limiter=TokenBucket(async_crawler.RATE_LIMIT))
+        max_total = await async_crawler.get_max_total_count(client)
+        return await async_crawler.fetch_currency_data_list(client, max_total)
+
+
+def run_once(concurrent: bool) -> float:
+    start = time.perf_counter()
+    # the crawler prints every symbol, keep the benchmark output readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        symbols = asyncio.run(crawl(concurrent))
+    elapsed = time.perf_counter() - start
+    assert [symbol.symbol for symbol in symbols][:TOTAL] == [f"C{index}-USD" for index in range(TOTAL)]
+    return elapsed
+
+
+if __name__ == '__main__':
+    # the request factory reads the credentials from the environment
+    for name in ("YAHOO_COOKIE", "USER_AGENT", "CRUMB"):
+        os.environ.setdefault(name, "benchmark")
+
+    print(f"{TOTAL} symbols, {async_crawler.PAGE_SIZE} per page, {LATENCY * 1000:.0f}ms latency per request")
+    sequential = run_once(concurrent=False)
+    concurrent = run_once(concurrent=True)
+    print(f"offset by offset {sequential:8.2f}s")
+    print(f"concurrent       {concurrent:8.2f}s  speedup x{sequential / concurrent:.1f}")
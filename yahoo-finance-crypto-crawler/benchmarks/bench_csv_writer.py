@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/19 15:00
+# @Desc    : Benchmark the first save_data_to_csv, one awaited aiofiles write per row, vs the buffered
+#            SymbolCsvWriter on a large screener, run from yahoo-finance-crypto-crawler:
+#            python -m benchmarks.bench_csv_writer
+
+import asyncio
+import csv
+import os
+import tempfile
+import time
+from typing import List
+
+import aiofiles
+
+from async_crawler import save_data_to_csv
+from common import SymbolContent
+from storage import SymbolCsvWriter
+
+SYMBOLS = 100000  # rows of the screener
+
+
+async def legacy_save_data_to_csv(save_file_name: str, currency_data_list: List[SymbolContent]) -> None:
+    """
+    The first CSV export, every row goes through the aiofiles thread pool
+    :param save_file_name:
+    :param currency_data_list:
+    :return:
+    """
+    async with aiofiles.open(save_file_name, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        await writer.writerow(SymbolContent.get_fields())
+        for symbol in currency_data_list:
+            await writer.writerow([symbol.symbol, symbol.name, symbol.price, symbol.change_price, symbol.change_percent,
+                                   symbol.market_price])
+
+
+async def streaming_save(save_file_name: str, currency_data_list: List[SymbolContent]) -> None:
+    # a producer appending the symbols one by one while they are parsed
+    async with SymbolCsvWriter(save_file_name) as writer:
+        for symbol in currency_data_list:
+            await writer.append(symbol)
+
+
+def run_once(save, file_path: str, symbols: List[SymbolContent]) -> float:
+    start = time.perf_counter()
+    asyncio.run(save(file_path, symbols))
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    symbols = [SymbolContent(f"C{index}-USD", f"Coin {index} USD", f"{index * 1.5:,.2f}", f"{index * 0.01:,.2f}",
+                             "+0.50%", f"{index * 1e6 / 1e9:.3f}B") for index in range(SYMBOLS)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = {}
+        for label, save in (("legacy per-row await", legacy_save_data_to_csv),
+                            ("buffered extend", save_data_to_csv),
+                            ("buffered append", streaming_save)):
+            file_path = os.path.join(tmp_dir, label.replace(" ", "_") + ".csv")
+            elapsed = run_once(save, file_path, symbols)
+            with open(file_path, "rb") as f:
+                results[label] = f.read()
+            print(f"{label:<22s} {elapsed:7.3f}s  {SYMBOLS / elapsed:10.0f} rows/s")
+        assert len(set(results.values())) == 1, "the writers produced different files"
+        print(f"identical output, {len(results['legacy per-row await']) / 1024:.0f} KiB")
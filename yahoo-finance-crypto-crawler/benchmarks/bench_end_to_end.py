@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/23 11:00
+# @Desc    : End to end benchmark of run_crawler replaying a recorded screener cassette: pages/s, p50/p99 request
+#            latency and peak RSS, the crawler runs in its own process,
+#            run from yahoo-finance-crypto-crawler: python -m benchmarks.bench_end_to_end [--cassette DIR]
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+import async_crawler
+from benchmarks import bench_concurrent_fetch
+from crawler_kit.replay import Cassette, RecordingTransport, start_replay_server
+
+# record a real one by setting RECORD_DIR = "benchmarks/cassettes/screener" in async_crawler.py
+CASSETTE_DIR = os.path.join("benchmarks", "cassettes", "screener")
+TOTAL = 5000  # symbols of a synthesized cassette
+LATENCY = 0.2  # seconds the replay server sleeps per request
+JITTER = 0.1  # extra random seconds per request
+
+
+def configure(base_host: str):
+    """
+    Point the crawler to the replay server and turn off everything touching the disk or the console
+    :param base_host:
+    :return:
+    """
+    async_crawler.HOST = base_host
+    async_crawler.HTTP_CACHE_DIR = None
+    async_crawler.METRICS_PATH = None
+    async_crawler.RECORD_DIR = None
+    async_crawler.VERBOSE = False
+    # local server, no need to be polite
+    async_crawler.RATE_LIMIT = 1000.0
+
+
+def synthesize_cassette(dir_path: str, total: int):
+    """
+    Record the mocked screener of bench_concurrent_fetch, used when no real recording is available
+    :param dir_path: cassette directory
+    :param total: symbols of the screener
+    :return:
+    """
+    async def record():
+        transport = RecordingTransport(httpx.MockTransport(bench_concurrent_fetch.mock_screener), Cassette(dir_path))
+        async with httpx.AsyncClient(transport=transport) as client:
+            await async_crawler.fetch_all_symbols(client)
+
+    bench_concurrent_fetch.TOTAL = total
+    bench_concurrent_fetch.LATENCY = 0
+    async_crawler.VERBOSE = False
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(record())
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    Nearest rank percentile
+    :param sorted_values: ascending values
+    :param q: 0 to 1
+    :return:
+    """
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))]
+
+
+def run_child(base_host: str) -> Dict:
+    """
+    Run the crawler end to end in this process
+    :param base_host: replay server
+    :return: result line of the benchmark
+    """
+    configure(base_host)
+    # client side latency of every request, retries and politeness waits included
+    latencies: List[float] = []
+    record_response = async_crawler.record_response
+
+    def record_latency(endpoint: str, status_code: int, body_size: int, seconds: float, registry=None):
+        latencies.append(seconds)
+        record_response(endpoint, status_code, body_size, seconds, registry)
+
+    async_crawler.record_response = record_latency
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            symbols = asyncio.run(async_crawler.run_crawler(os.path.join(tmp_dir, "symbol_data.csv")))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "pages": len(latencies),
+        "symbols": len(symbols),
+        "seconds": elapsed,
+        "pages_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        # KiB on Linux
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="End to end crawler benchmark against a replayed cassette")
+    arg_parser.add_argument("--cassette", default=CASSETTE_DIR, help="cassette directory, synthesized if missing")
+    arg_parser.add_argument("--total", type=int, default=TOTAL, help="symbols of a synthesized cassette")
+    arg_parser.add_argument("--latency", type=float, default=LATENCY, help="seconds per request")
+    arg_parser.add_argument("--jitter", type=float, default=JITTER, help="extra random seconds per request")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="share of injected 503 answers")
+    arg_parser.add_argument("--reset-rate", type=float, default=0.0, help="share of injected connection resets")
+    arg_parser.add_argument("--seed", type=int, default=0, help="seed of the injected latency and errors")
+    arg_parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    arg_parser.add_argument("--base-host", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    # the request factory reads the credentials from the environment, the replay ignores them
+    for name in ("YAHOO_COOKIE", "USER_AGENT", "CRUMB"):
+        os.environ.setdefault(name, "benchmark")
+
+    if args.child:
+        # a fresh process, so the peak RSS is the crawler's own
+        print(json.dumps(run_child(args.base_host)))
+        sys.exit(0)
+
+    if not os.path.exists(os.path.join(args.cassette, "index.jsonl")):
+        print(f"No recording in {args.cassette}, synthesizing a screener of {args.total} symbols")
+        synthesize_cassette(args.cassette, args.total)
+    server, base_host = start_replay_server(args.cassette, latency=args.latency, jitter=args.jitter,
+                                            error_rate=args.error_rate, reset_rate=args.reset_rate, seed=args.seed)
+    print(f"Replay {len(server.cassette)} responses of {args.cassette}, {args.latency * 1000:.0f}ms "
+          f"+ up to {args.jitter * 1000:.0f}ms latency, {args.error_rate:.1%} errors, {args.reset_rate:.1%} resets")
+    child = subprocess.run([sys.executable, "-m", "benchmarks.bench_end_to_end", "--child", "--base-host", base_host],
+                           capture_output=True, text=True, check=True)
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    print(f"{'pages':>6s} {'symbols':>8s} {'seconds':>8s} {'pages/s':>8s} {'p50 ms':>8s} {'p99 ms':>8s} "
+          f"{'peak RSS MiB':>13s}")
+    print(f"{result['pages']:6d} {result['symbols']:8d} {result['seconds']:8.2f} {result['pages_per_second']:8.1f} "
+          f"{result['p50_ms']:8.1f} {result['p99_ms']:8.1f} {result['peak_rss_mib']:13.1f}")
+    print("Replay server: ", server.stats())
+    server.shutdown()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/10 10:30
+# @Desc    : Per-object memory of SymbolContent, slotted class vs the previous class-attribute version,
+#            run from yahoo-finance-crypto-crawler: python -m benchmarks.bench_model_memory
+
+import tracemalloc
+
+from common import SymbolContent
+
+OBJECTS_COUNT = 100_000
+
+
+class SymbolContentWithDict:
+    """
+    The previous SymbolContent, fields are class attributes shadowed by an instance __dict__
+    """
+    symbol: str = ""
+    name: str = ""
+    price: str = ""
+    change_price: str = ""
+    change_percent: str = ""
+    market_price: str = ""
+
+
+def bytes_per_object(cls) -> float:
+    """
+    Create OBJECTS_COUNT objects the way parse_symbol_content does and return the traced bytes per object
+    :param cls:
+    :return:
+    """
+    tracemalloc.start()
+    objects = []
+    for _ in range(OBJECTS_COUNT):
+        symbol_content = cls()
+        symbol_content.symbol = "BTC-USD"
+        symbol_content.name = "Bitcoin USD"
+        symbol_content.price = "87,123.45"
+        symbol_content.change_price = "-1,234.56"
+        symbol_content.change_percent = "-1.40%"
+        symbol_content.market_price = "1.725T"
+        objects.append(symbol_content)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return current / OBJECTS_COUNT
+
+
+if __name__ == '__main__':
+    before = bytes_per_object(SymbolContentWithDict)
+    after = bytes_per_object(SymbolContent)
+    print(f"SymbolContent  __dict__: {before:6.1f} B  slots: {after:6.1f} B  saved {1 - after / before:.0%}")
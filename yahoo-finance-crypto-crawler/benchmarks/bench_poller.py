@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/21 15:00
+# @Desc    : Bytes and rows stored by one poll a minute, a full CSV per poll vs the delta log, against a mocked
+#            screener where a few percent of the quotes move between two polls, run from yahoo-finance-crypto-crawler:
+#            python -m benchmarks.bench_poller
+
+import asyncio
+import contextlib
+import json
+import os
+import random
+import tempfile
+
+import httpx
+
+import async_crawler
+from crawler_kit.metrics import metrics
+from poller import DeltaStore, poll_once
+from storage import SymbolCsvWriter
+
+TOTAL = 2000  # symbols of the mocked screener
+POLLS = 60  # one hour of polls
+CHANGED_RATIO = 0.03  # quotes moving between two polls
+COMPACT_EVERY = 60
+
+prices = {index: 1.0 + index for index in range(TOTAL)}
+
+
+def quote(index: int) -> dict:
+    price = prices[index]
+    change = price - (1.0 + index)
+    return {
+        "symbol": f"C{index}-USD",
+        "shortName": f"Coin {index} USD",
+        "regularMarketPrice": {"raw": price, "fmt": f"{price:,.2f}"},
+        "regularMarketChange": {"raw": change, "fmt": f"{change:,.2f}"},
+        "regularMarketChangePercent": {"raw": change / (1.0 + index) * 100,
+                                       "fmt": f"{change / (1.0 + index) * 100:.2f}%"},
+        "marketCap": {"raw": price * 1e6, "fmt": f"{price:.3f}M"},
+    }
+
+
+async def mock_screener(request: httpx.Request) -> httpx.Response:
+    payload = json.loads(request.content)
+    offset, size = payload["offset"], payload["size"]
+    indexes = range(offset, min(offset + size, TOTAL))
+    if payload["sortField"] == "percentchange":
+        ranked = sorted(range(TOTAL), key=lambda index: prices[index] / (1.0 + index),
+                        reverse=payload["sortType"] == "DESC")
+        indexes = ranked[offset:offset + size]
+    quotes = [quote(index) for index in indexes]
+    return httpx.Response(200, json={"finance": {"result": [{"total": TOTAL, "quotes": quotes}]}})
+
+
+def move_prices():
+    for index in random.sample(range(TOTAL), int(TOTAL * CHANGED_RATIO)):
+        prices[index] = round(prices[index] * random.uniform(0.95, 1.05), 4)
+
+
+async def run(dir_path: str, top_n: int):
+    random.seed(1)
+    metrics.reset()
+    prices.update({index: 1.0 + index for index in range(TOTAL)})
+    csv_bytes = 0
+    with DeltaStore(dir_path, keep_compactions=POLLS) as store:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(mock_screener)) as client:
+            for poll_number in range(POLLS):
+                await poll_once(client, store, poll_number, top_n=top_n, compact_every=COMPACT_EVERY)
+                # what the first crawler wrote every poll: the whole screener
+                csv_path = os.path.join(dir_path, "full.csv")
+                async with SymbolCsvWriter(csv_path) as writer:
+                    await writer.extend(await async_crawler.fetch_all_symbols(client))
+                csv_bytes += os.path.getsize(csv_path)
+                move_prices()
+    return csv_bytes, store.bytes_written
+
+
+if __name__ == '__main__':
+    for name in ("YAHOO_COOKIE", "USER_AGENT", "CRUMB"):
+        os.environ.setdefault(name, "benchmark")
+    async_crawler.VERBOSE = False
+    async_crawler.RATE_LIMIT = 1e6
+
+    print(f"{TOTAL} symbols, {POLLS} polls, {CHANGED_RATIO:.0%} of the quotes move per poll, "
+          f"compaction every {COMPACT_EVERY} polls")
+    for top_n in (0, 50):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                csv_bytes, delta_bytes = asyncio.run(run(tmp_dir, top_n))
+            rows_written = sum(metrics.counters["poll_rows_written_total"].values())
+            label = "full polls" if not top_n else f"top {top_n} movers"
+            print(f"{label:<16s} full csv {csv_bytes / 1024:6.0f} KiB {TOTAL * POLLS:7d} rows  "
+                  f"delta log {delta_bytes / 1024:5.0f} KiB {rows_written:6.0f} rows  "
+                  f"saved {1 - delta_bytes / csv_bytes:.1%} bytes, {1 - rows_written / (TOTAL * POLLS):.1%} rows")
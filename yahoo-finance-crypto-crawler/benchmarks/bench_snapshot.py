@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/20 15:00
+# @Desc    : Benchmark the dashboard computations on a large screener, Python loops over the fmt strings vs the
+#            pandas snapshot built from the raw numbers, run from yahoo-finance-crypto-crawler (needs numpy and
+#            pandas): python -m benchmarks.bench_snapshot
+
+import time
+from typing import Dict, List
+
+from common import SymbolContent
+from snapshot import diff_snapshots, market_cap_buckets, rank_changes, symbols_to_frame
+from storage import parse_fmt_number
+
+SYMBOLS = 50000
+ROUNDS = 5
+
+
+def make_symbols(drift: float) -> List[SymbolContent]:
+    symbols = []
+    for index in range(SYMBOLS):
+        price = (index % 997 + 1) * 1.5 * drift
+        change_percent = (index % 201 - 100) / 10
+        market_cap = (index % 9973 + 1) * 1e6 * drift
+        symbols.append(SymbolContent(f"C{index}-USD", f"Coin {index} USD", f"{price:,.2f}", f"{price / 100:,.2f}",
+                                     f"{change_percent:+.2f}%", f"{market_cap / 1e9:.3f}B", price, price / 100,
+                                     change_percent, market_cap))
+    return symbols
+
+
+def python_loops(old: List[SymbolContent], new: List[SymbolContent]):
+    # what a dashboard did with the display strings: parse every row, sort, bucket and diff in Python
+    top = sorted(new, key=lambda symbol: parse_fmt_number(symbol.change_percent), reverse=True)[:10]
+    buckets: Dict[str, int] = {}
+    for symbol in new:
+        cap = parse_fmt_number(symbol.market_price)
+        label = "large" if cap >= 1e10 else "mid" if cap >= 1e9 else "small" if cap >= 1e8 else "micro"
+        buckets[label] = buckets.get(label, 0) + 1
+    old_prices = {symbol.symbol: parse_fmt_number(symbol.price) for symbol in old}
+    diff = {symbol.symbol: parse_fmt_number(symbol.price) - old_prices[symbol.symbol] for symbol in new
+            if symbol.symbol in old_prices}
+    return top, buckets, diff
+
+
+def vectorized(old_frame, new_frame):
+    return rank_changes(new_frame, 10), market_cap_buckets(new_frame).value_counts(), \
+        diff_snapshots(old_frame, new_frame)
+
+
+def best_of(func) -> float:
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+if __name__ == '__main__':
+    old, new = make_symbols(1.0), make_symbols(1.02)
+    old_frame, new_frame = symbols_to_frame(old), symbols_to_frame(new)
+    print(f"{SYMBOLS} symbols, best of {ROUNDS}")
+    print(f"  python loops on fmt strings   {best_of(lambda: python_loops(old, new)):8.1f} ms")
+    print(f"  build the two snapshots       {best_of(lambda: (symbols_to_frame(old), symbols_to_frame(new))):8.1f} ms")
+    print(f"  vectorized on the snapshots   {best_of(lambda: vectorized(old_frame, new_frame)):8.1f} ms")
@@ -3,25 +3,57 @@
 # @Time    : 2024/11/28 13:50
 # @Desc    : Cryptocurrency data model and request params and headers factory for Yahoo Finance API
 
+import importlib.util
 import os
-from typing import List
+from typing import List, Optional
 
 import dotenv
+import httpx
+
+from crawler_kit.http_cache import CachingTransport, ResponseCache
+from crawler_kit.replay import Cassette, RecordingTransport
+from crawler_kit.throttle import Politeness, PoliteTransport
 
 
 dotenv.load_dotenv(dotenv_path='./.env')
 
+MAX_CONNECTIONS = 20  # max number of open connections
+MAX_KEEPALIVE_CONNECTIONS = 10  # max number of idle connections kept alive
+KEEPALIVE_EXPIRY = 30.0  # seconds an idle connection is kept alive
+
 
 class SymbolContent:
     """
-    Basic symbol content container
+    Basic symbol content container, slotted so the fields live on the instance without a per-instance __dict__
     """
-    symbol: str = ""  # symbol
-    name: str = ""  # name
-    price: str = ""  # price
-    change_price: str = ""  # change price
-    change_percent: str = ""  # change percent
-    market_price: str = ""  # market price
+    __slots__ = (
+        "symbol",  # symbol
+        "name",  # name
+        "price",  # price
+        "change_price",  # change price
+        "change_percent",  # change percent
+        "market_price",  # market price
+        # raw numbers of the display strings above, None when the API did not send them
+        "price_raw",  # price
+        "change_price_raw",  # change price
+        "change_percent_raw",  # change percent, in percent: -3.45 for "-3.45%"
+        "market_price_raw",  # market cap
+    )
+
+    def __init__(self, symbol: str = "", name: str = "", price: str = "", change_price: str = "",
+                 change_percent: str = "", market_price: str = "", price_raw: Optional[float] = None,
+                 change_price_raw: Optional[float] = None, change_percent_raw: Optional[float] = None,
+                 market_price_raw: Optional[float] = None):
+        self.symbol = symbol
+        self.name = name
+        self.price = price
+        self.change_price = change_price
+        self.change_percent = change_percent
+        self.market_price = market_price
+        self.price_raw = price_raw
+        self.change_price_raw = change_price_raw
+        self.change_percent_raw = change_percent_raw
+        self.market_price_raw = market_price_raw
 
     def __str__(self):
         return f"""
@@ -35,9 +67,15 @@ class SymbolContent:
 
     @classmethod
     def get_fields(cls) -> List[str]:
-        return [
-            field for field in cls.__dict__.keys() if not field.startswith("__")
-        ]
+        """
+        Display fields, the columns of the CSV export
+        :return:
+        """
+        return [field for field in cls.__slots__ if not field.endswith("_raw")]
+
+    @classmethod
+    def get_raw_fields(cls) -> List[str]:
+        return [field for field in cls.__slots__ if field.endswith("_raw")]
 
 
 def request_params_and_headers_factory():
@@ -88,3 +126,33 @@ def request_params_and_headers_factory():
     }
 
     return common_params, headers, common_payload_data
+
+
+def create_async_client(max_connections: int = MAX_CONNECTIONS,
+                        max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry: float = KEEPALIVE_EXPIRY,
+                        cache: Optional[ResponseCache] = None,
+                        politeness: Optional[Politeness] = None,
+                        recorder: Optional[Cassette] = None) -> httpx.AsyncClient:
+    """
+    Create the async client shared by all requests of one crawl run, use it as `async with create_async_client()`.
+    HTTP/2 is used when the optional h2 package is installed (pip install httpx[http2]).
+    :param max_connections: max number of open connections
+    :param max_keepalive_connections: max number of idle connections kept alive
+    :param keepalive_expiry: seconds an idle connection is kept alive
+    :param cache: optional on-disk response cache, closed with the client
+    :param politeness: optional rate limit / adaptive concurrency / retry state, cache hits do not go through it
+    :param recorder: optional cassette storing every response received from the network, see replay.py
+    :return:
+    """
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                          keepalive_expiry=keepalive_expiry)
+    transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport(
+        limits=limits, http2=importlib.util.find_spec("h2") is not None)
+    if recorder is not None:
+        transport = RecordingTransport(transport, recorder)
+    if politeness is not None:
+        transport = PoliteTransport(transport, politeness)
+    if cache is not None:
+        transport = CachingTransport(transport, cache)
+    return httpx.AsyncClient(transport=transport)
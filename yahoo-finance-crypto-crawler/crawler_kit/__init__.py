@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/27 10:00
+# @Desc    : Entry of the crawler_kit package of the repository root, shared by both crawlers: running from this
+#            folder, `from crawler_kit.throttle import Politeness` loads ../crawler_kit/throttle.py
+
+import os
+
+__path__ = [os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "crawler_kit")]
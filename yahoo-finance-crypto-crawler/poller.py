@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/21 10:00
+# @Desc    : Long-running poll mode of the Yahoo Finance crawler: every poll is diffed by symbol against the previous
+#            one and only the changed rows are appended to a delta log, compacted into a full base file periodically
+
+import argparse
+import asyncio
+import csv
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+import async_crawler
+from async_crawler import fetch_all_symbols, parse_symbol_content, send_request
+from common import SymbolContent, create_async_client
+from crawler_kit.metrics import metrics
+from crawler_kit.throttle import Politeness
+
+POLL_DIR = "symbol_polls"  # base-<ts>.csv full snapshots and delta-<ts>.csv changes after them
+POLL_INTERVAL = 60.0  # seconds between the start of two polls
+COMPACT_EVERY = 60  # polls between two compactions, a reader replays at most this many polls of deltas
+KEEP_COMPACTIONS = 2  # base and delta files kept, the older ones are deleted after a compaction
+TOP_N = 0  # poll only the top N gainers and losers between full polls, 0 to poll the whole screener every time
+FULL_POLL_EVERY = 10  # with TOP_N, one full poll every N polls, listings and delistings are only seen there
+METRICS_PATH = "yahoo_poller_metrics.prom"  # metrics snapshot rewritten after every poll, None to skip
+
+
+# columns of the base files, the delta files add poll_time and deleted in front
+FIELDS = tuple(SymbolContent.__slots__)
+
+Row = Tuple[str, ...]
+
+
+def symbol_row(symbol: SymbolContent) -> Row:
+    """
+    CSV values of a symbol, compared as is with the row of the previous poll
+    :param symbol:
+    :return:
+    """
+    return tuple("" if value is None else repr(value) if isinstance(value, float) else str(value)
+                 for value in (getattr(symbol, field) for field in FIELDS))
+
+
+class DeltaStore:
+    """
+    Append-only storage of a polled screener. The last state is kept in memory: a poll writes one CSV line per symbol
+    whose row changed, listed or (on a complete poll) disappeared. compact() writes the whole state to a new base file
+    and starts a new delta file, the state at any poll is the base plus the deltas up to it. A restarted poller
+    reloads the last base and its deltas instead of writing everything again.
+    """
+
+    def __init__(self, dir_path: str, keep_compactions: int = KEEP_COMPACTIONS):
+        """
+        :param dir_path: directory of the base and delta files, created if missing
+        :param keep_compactions: base / delta file pairs kept
+        """
+        self.dir_path = dir_path
+        self.keep_compactions = keep_compactions
+        self.state: Dict[str, Row] = {}
+        self.compacted_at: Optional[int] = None
+        self.bytes_written = 0
+        self._delta_file = None
+        os.makedirs(dir_path, exist_ok=True)
+        self._restore()
+
+    def _path(self, kind: str, compacted_at: int) -> str:
+        return os.path.join(self.dir_path, f"{kind}-{compacted_at}.csv")
+
+    def _compactions(self) -> List[int]:
+        return sorted(int(name[len("base-"):-len(".csv")]) for name in os.listdir(self.dir_path)
+                      if name.startswith("base-") and name.endswith(".csv"))
+
+    def _restore(self):
+        compactions = self._compactions()
+        if not compactions:
+            return
+        self.compacted_at = compactions[-1]
+        with open(self._path("base", self.compacted_at), newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader)
+            for row in reader:
+                self.state[row[0]] = tuple(row)
+        delta_path = self._path("delta", self.compacted_at)
+        if os.path.exists(delta_path):
+            complete_size = self._replay_delta(delta_path)
+            if complete_size < os.path.getsize(delta_path):
+                # a crash in the middle of a write left a partial last row, the next rows would be glued to it
+                os.truncate(delta_path, complete_size)
+        self._open_delta(self.compacted_at)
+
+    def _replay_delta(self, delta_path: str) -> int:
+        """
+        Apply the complete rows of a delta file to the state
+        :param delta_path:
+        :return: bytes of the header and the complete rows, anything after them is a torn write
+        """
+        consumed = 0
+        terminated = False
+        complete_size = 0
+
+        def lines():
+            nonlocal consumed, terminated
+            for line in f:
+                consumed += len(line)
+                terminated = line.endswith(b"\n")
+                yield line.decode("utf-8", errors="replace")
+
+        with open(delta_path, "rb") as f:
+            for row_number, change in enumerate(csv.reader(lines())):
+                # a complete row has every column and its line terminator
+                if not terminated or (row_number and len(change) != len(FIELDS) + 2):
+                    break
+                complete_size = consumed
+                if not row_number:
+                    continue
+                if change[1]:
+                    self.state.pop(change[2], None)
+                else:
+                    self.state[change[2]] = tuple(change[2:])
+        return complete_size
+
+    def _open_delta(self, compacted_at: int):
+        delta_path = self._path("delta", compacted_at)
+        # a torn header was truncated to nothing
+        is_new = not os.path.exists(delta_path) or not os.path.getsize(delta_path)
+        self._delta_file = open(delta_path, "a", newline="", encoding="utf-8")
+        self._delta_writer = csv.writer(self._delta_file)
+        if is_new:
+            self._delta_writer.writerow(("poll_time", "deleted") + FIELDS)
+
+    def apply(self, symbols: List[SymbolContent], complete: bool, poll_time: int) -> Tuple[int, int]:
+        """
+        Diff a poll against the state and append the changes to the delta log
+        :param symbols: quotes of the poll
+        :param complete: the poll covers the whole screener, the symbols missing from it are deleted
+        :param poll_time: unix time of the poll
+        :return: rows upserted, rows deleted
+        """
+        if self._delta_file is None:
+            # first poll ever, the full state goes to the first base file
+            for symbol in symbols:
+                self.state[symbol.symbol] = symbol_row(symbol)
+            self.compact(poll_time)
+            return len(self.state), 0
+        changes: List[tuple] = []
+        seen = set()
+        for symbol in symbols:
+            seen.add(symbol.symbol)
+            row = symbol_row(symbol)
+            if self.state.get(symbol.symbol) != row:
+                self.state[symbol.symbol] = row
+                changes.append((poll_time, "") + row)
+        upserts = len(changes)
+        if complete:
+            for delisted in [name for name in self.state if name not in seen]:
+                del self.state[delisted]
+                changes.append((poll_time, "1", delisted) + ("",) * (len(FIELDS) - 1))
+        if changes:
+            position = self._delta_file.tell()
+            self._delta_writer.writerows(changes)
+            self._delta_file.flush()
+            self.bytes_written += self._delta_file.tell() - position
+        return upserts, len(changes) - upserts
+
+    def compact(self, poll_time: int):
+        """
+        Write the whole state to a new base file and start its delta file, then drop the old pairs
+        :param poll_time: unix time of the compaction
+        :return:
+        """
+        base_path = self._path("base", poll_time)
+        tmp_path = base_path + ".tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            writer.writerows(self.state.values())
+            f.flush()
+            os.fsync(f.fileno())
+            self.bytes_written += f.tell()
+        os.replace(tmp_path, base_path)
+        if self._delta_file is not None:
+            self._delta_file.close()
+        self.compacted_at = poll_time
+        self._open_delta(poll_time)
+        for compacted_at in self._compactions()[:-self.keep_compactions]:
+            for kind in ("base", "delta"):
+                if os.path.exists(self._path(kind, compacted_at)):
+                    os.remove(self._path(kind, compacted_at))
+
+    def close(self):
+        if self._delta_file is not None:
+            self._delta_file.flush()
+            os.fsync(self._delta_file.fileno())
+            self._delta_file.close()
+            self._delta_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+async def fetch_top_movers(client: httpx.AsyncClient, top_n: int) -> List[SymbolContent]:
+    """
+    Top gainers and losers of the screener, two requests sorted by percent change instead of a full pass
+    :param client: Shared http client
+    :param top_n: Symbols of each side
+    :return:
+    """
+    pages = await asyncio.gather(
+        send_request(client, page_start=0, page_size=top_n, sort_field="percentchange", sort_type="DESC"),
+        send_request(client, page_start=0, page_size=top_n, sort_field="percentchange", sort_type="ASC"))
+    movers: Dict[str, SymbolContent] = {}
+    for response_dict in pages:
+        for quote in response_dict["finance"]["result"][0]["quotes"]:
+            symbol_content = parse_symbol_content(quote)
+            movers[symbol_content.symbol] = symbol_content
+    return list(movers.values())
+
+
+async def poll_once(client: httpx.AsyncClient, store: DeltaStore, poll_number: int, top_n: int = TOP_N,
+                    full_every: int = FULL_POLL_EVERY, compact_every: int = COMPACT_EVERY):
+    """
+    One poll: fetch, diff, append the changes and compact when it is due
+    :param client: Shared http client
+    :param store:
+    :param poll_number: 0 for the first poll of the run
+    :param top_n: poll only the top movers between the full polls, 0 for full polls only
+    :param full_every: one full poll every N polls when top_n is set
+    :param compact_every: polls between two compactions
+    :return:
+    """
+    poll_time = int(time.time())
+    complete = not top_n or poll_number % full_every == 0
+    with metrics.timer("poll_seconds", kind="full" if complete else "movers"):
+        symbols = await fetch_all_symbols(client) if complete else await fetch_top_movers(client, top_n)
+    if complete and not symbols:
+        # a failed first page looks like an empty screener, do not delete every symbol
+        print("Empty full poll, skipped")
+        metrics.inc("poll_skipped_total")
+        return
+    upserts, deletes = store.apply(symbols, complete, poll_time)
+    if poll_number and poll_number % compact_every == 0:
+        store.compact(poll_time)
+        metrics.inc("poll_compactions_total")
+    metrics.inc("poll_rows_fetched_total", len(symbols))
+    metrics.inc("poll_rows_written_total", upserts + deletes)
+    print(f"Poll {poll_number}: {len(symbols)} symbols fetched, {upserts} changed, {deletes} delisted, "
+          f"{store.bytes_written / 1024:.0f} KiB written so far")
+
+
+async def run_poller(dir_path: str = POLL_DIR, interval: float = POLL_INTERVAL, top_n: int = TOP_N,
+                     max_polls: Optional[int] = None) -> None:
+    """
+    Poll the screener every `interval` seconds until interrupted or `max_polls` polls are done
+    :param dir_path: directory of the delta log
+    :param interval: seconds between the start of two polls
+    :param top_n: poll only the top N movers between the full polls, 0 to poll the whole screener every time
+    :param max_polls: stop after N polls, None to run forever
+    :return:
+    """
+    metrics.reset()
+    politeness = Politeness(rate=async_crawler.RATE_LIMIT, initial_concurrency=async_crawler.FETCH_CONCURRENCY,
+                            max_concurrency=async_crawler.FETCH_CONCURRENCY)
+    # no response cache, every poll must see the current quotes; one client for the whole run
+    with DeltaStore(dir_path) as store:
+        async with create_async_client(politeness=politeness) as client:
+            poll_number = 0
+            while max_polls is None or poll_number < max_polls:
+                started = time.monotonic()
+                try:
+                    await poll_once(client, store, poll_number, top_n)
+                except Exception as e:
+                    # a failed poll is retried at the next tick, the state is unchanged
+                    print(f"Poll {poll_number} failed, reason: {e}")
+                    metrics.inc("poll_failed_total")
+                if METRICS_PATH:
+                    metrics.write_snapshot(METRICS_PATH)
+                poll_number += 1
+                if max_polls is None or poll_number < max_polls:
+                    await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Poll the Yahoo Finance crypto screener and store the deltas")
+    arg_parser.add_argument("--dir", default=POLL_DIR, help=f"delta log directory, default {POLL_DIR}")
+    arg_parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="seconds between two polls")
+    arg_parser.add_argument("--top-n", type=int, default=TOP_N, help="poll only the top N movers between full polls")
+    arg_parser.add_argument("--polls", type=int, default=None, help="stop after N polls")
+    args = arg_parser.parse_args()
+
+    # one line per poll instead of one per symbol
+    async_crawler.VERBOSE = False
+    asyncio.run(run_poller(args.dir, args.interval, args.top_n, args.polls))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/20 10:00
+# @Desc    : Columnar snapshot of a crawl backed by pandas / NumPy, with vectorized helpers for the dashboards:
+#            change ranking, market cap buckets and the diff of two snapshots
+
+import time
+from typing import List, Optional, Sequence
+
+from common import SymbolContent
+from storage import parse_fmt_number
+
+# optional analysis dependencies, pip install numpy pandas
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    np = None
+    pd = None
+
+# market cap bucket bounds in USD and their labels
+MARKET_CAP_BOUNDS = (0, 1e7, 1e8, 1e9, 1e10, float("inf"))
+MARKET_CAP_LABELS = ("nano", "micro", "small", "mid", "large")
+
+# numeric columns of a snapshot, indexed by symbol
+NUMERIC_COLUMNS = ("price", "change_price", "change_percent", "market_cap")
+
+
+def _require_pandas():
+    if pd is None:
+        raise ImportError("snapshot needs numpy and pandas, pip install numpy pandas")
+
+
+def _raw_or_parsed(raw: Optional[float], fmt: str) -> float:
+    if raw is not None:
+        return raw
+    value = parse_fmt_number(fmt)
+    return value if value is not None else float("nan")
+
+
+def symbols_to_frame(symbols: List[SymbolContent], snapshot_time: Optional[float] = None) -> "pd.DataFrame":
+    """
+    Build the snapshot of a crawl: one row per symbol, float64 columns from the raw numbers, the fmt strings are only
+    parsed for the quotes without raw values
+    :param symbols: parsed quotes of one crawl
+    :param snapshot_time: unix time of the crawl, now by default
+    :return: DataFrame indexed by symbol with name, NUMERIC_COLUMNS and snapshot_time
+    """
+    _require_pandas()
+    # one pass over the objects per column, everything after this is vectorized
+    frame = pd.DataFrame({
+        "name": [symbol.name for symbol in symbols],
+        "price": np.fromiter((_raw_or_parsed(symbol.price_raw, symbol.price) for symbol in symbols),
+                             dtype=np.float64, count=len(symbols)),
+        "change_price": np.fromiter((_raw_or_parsed(symbol.change_price_raw, symbol.change_price)
+                                     for symbol in symbols), dtype=np.float64, count=len(symbols)),
+        "change_percent": np.fromiter((_raw_or_parsed(symbol.change_percent_raw, symbol.change_percent)
+                                       for symbol in symbols), dtype=np.float64, count=len(symbols)),
+        "market_cap": np.fromiter((_raw_or_parsed(symbol.market_price_raw, symbol.market_price)
+                                   for symbol in symbols), dtype=np.float64, count=len(symbols)),
+    }, index=pd.Index([symbol.symbol for symbol in symbols], name="symbol"))
+    frame["snapshot_time"] = pd.Timestamp(int(snapshot_time if snapshot_time is not None else time.time()), unit="s",
+                                          tz="UTC")
+    # a symbol listed twice by two overlapping pages keeps its first quote
+    return frame[~frame.index.duplicated()]
+
+
+def read_snapshot(file_path: str) -> "pd.DataFrame":
+    """
+    Load a snapshot from a parquet file written by storage.SymbolParquetWriter
+    :param file_path:
+    :return: DataFrame with the layout of symbols_to_frame
+    """
+    _require_pandas()
+    frame = pd.read_parquet(file_path, columns=["symbol", "name", "price_value", "change_price_value",
+                                                "change_percent_value", "market_price_value", "snapshot_time"])
+    frame = frame.rename(columns={"price_value": "price", "change_price_value": "change_price",
+                                  "change_percent_value": "change_percent", "market_price_value": "market_cap"})
+    frame = frame.set_index("symbol")
+    return frame[~frame.index.duplicated()]
+
+
+def rank_changes(frame: "pd.DataFrame", n: int = 10, by: str = "change_percent",
+                 min_market_cap: float = 0) -> "pd.DataFrame":
+    """
+    Top gainers and losers of a snapshot or of a snapshot diff
+    :param frame: snapshot or result of diff_snapshots
+    :param n: rows of each side
+    :param by: column to rank on, e.g. change_percent or price_change_percent of a diff
+    :param min_market_cap: skip the symbols below this market cap, the illiquid coins swing the most
+    :return: the n largest then the n smallest rows, with a side column: gainer or loser
+    """
+    _require_pandas()
+    if min_market_cap and "market_cap" in frame:
+        frame = frame[frame["market_cap"].to_numpy() >= min_market_cap]
+    ranked = frame[by].dropna()
+    gainers = frame.loc[ranked.nlargest(n).index].assign(side="gainer")
+    losers = frame.loc[ranked.nsmallest(n).index].assign(side="loser")
+    return pd.concat([gainers, losers])
+
+
+def market_cap_buckets(frame: "pd.DataFrame", bounds: Sequence[float] = MARKET_CAP_BOUNDS,
+                       labels: Sequence[str] = MARKET_CAP_LABELS) -> "pd.Series":
+    """
+    Market cap bucket of every symbol
+    :param frame: snapshot
+    :param bounds: increasing bucket bounds, a market cap in [bounds[i], bounds[i + 1]) gets labels[i]
+    :param labels: one label per bucket
+    :return: categorical Series indexed by symbol, NaN market caps get no bucket
+    """
+    _require_pandas()
+    return pd.cut(frame["market_cap"], bins=list(bounds), labels=list(labels), right=False)
+
+
+def bucket_summary(frame: "pd.DataFrame", bounds: Sequence[float] = MARKET_CAP_BOUNDS,
+                   labels: Sequence[str] = MARKET_CAP_LABELS) -> "pd.DataFrame":
+    """
+    Symbols, total market cap and median change of every market cap bucket
+    :param frame: snapshot
+    :param bounds:
+    :param labels:
+    :return: DataFrame indexed by bucket label
+    """
+    _require_pandas()
+    buckets = market_cap_buckets(frame, bounds, labels)
+    return frame.groupby(buckets, observed=False).agg(
+        symbols=("market_cap", "size"),
+        market_cap=("market_cap", "sum"),
+        median_change_percent=("change_percent", "median"),
+    )
+
+
+def diff_snapshots(old: "pd.DataFrame", new: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Change of every symbol between two snapshots, aligned on the symbol index
+    :param old: earlier snapshot
+    :param new: later snapshot
+    :return: DataFrame indexed by symbol with old/new price and market cap, their changes, and status:
+             listed (only in new), delisted (only in old) or kept
+    """
+    _require_pandas()
+    # the merge indicator tells where every symbol comes from, isin on a string index loops in Python
+    diff = pd.merge(old[["price", "market_cap"]], new[["price", "market_cap"]], how="outer", left_index=True,
+                    right_index=True, suffixes=("_old", "_new"), indicator="_source")
+    old_price = diff["price_old"].to_numpy()
+    new_price = diff["price_new"].to_numpy()
+    diff["price_change"] = new_price - old_price
+    with np.errstate(divide="ignore", invalid="ignore"):
+        diff["price_change_percent"] = np.where(old_price != 0, (new_price - old_price) / old_price * 100, np.nan)
+    diff["market_cap_change"] = diff["market_cap_new"].to_numpy() - diff["market_cap_old"].to_numpy()
+    source = diff.pop("_source").to_numpy()
+    diff["status"] = np.select([source == "both", source == "right_only"], ["kept", "listed"], default="delisted")
+    return diff
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/19 10:00
+# @Desc    : Export of the symbol snapshots: buffered CSV, and Parquet with the numeric columns parsed out of the
+#            Yahoo Finance fmt strings
+
+import csv
+import io
+import os
+import time
+from typing import Dict, List, Optional
+
+import aiofiles
+
+from common import SymbolContent
+
+# optional columnar export, pip install pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+CSV_FLUSH_BYTES = 1 << 20  # formatted rows buffered in memory before one file write
+CSV_CHUNK_ROWS = 1000  # rows formatted by one writerows call
+PARQUET_BATCH_SIZE = 1000  # symbols buffered before a record batch is written
+PARQUET_COMPRESSION = "zstd"
+# suffixes of the abbreviated fmt strings, e.g. marketCap "1.923T"
+FMT_MULTIPLIERS = {"k": 1e3, "K": 1e3, "M": 1e6, "B": 1e9, "T": 1e12}
+
+SYMBOL_COLUMNS = ("snapshot_time", "symbol", "name", "price", "change_price", "change_percent", "market_price",
+                  "price_value", "change_price_value", "change_percent_value", "market_price_value")
+
+
+class SymbolCsvWriter:
+    """
+    CSV writer formatting the rows into an in-memory buffer and handing it to the file in large chunks, one thread
+    pool hop per CSV_FLUSH_BYTES instead of one per row. Symbols can be appended while they are fetched:
+    `async with SymbolCsvWriter(path) as writer: await writer.append(symbol)`
+    """
+
+    def __init__(self, file_path: str, flush_bytes: int = CSV_FLUSH_BYTES):
+        """
+        :param file_path: output .csv file, truncated
+        :param flush_bytes: buffered bytes before a file write
+        """
+        self.file_path = file_path
+        self.flush_bytes = flush_bytes
+        self.count = 0
+        self._buffer = io.StringIO(newline="")
+        self._writer = csv.writer(self._buffer)
+        self._file = None
+
+    async def open(self):
+        self._file = await aiofiles.open(self.file_path, mode="w", newline="", encoding="utf-8")
+        self._writer.writerow(SymbolContent.get_fields())
+
+    async def append(self, symbol: SymbolContent):
+        self._writer.writerow([symbol.symbol, symbol.name, symbol.price, symbol.change_price, symbol.change_percent,
+                               symbol.market_price])
+        self.count += 1
+        if self._buffer.tell() >= self.flush_bytes:
+            await self.flush()
+
+    async def extend(self, symbols: List[SymbolContent]):
+        # writerows formats a chunk of rows in one C call, the buffer stays around flush_bytes
+        for start in range(0, len(symbols), CSV_CHUNK_ROWS):
+            self._writer.writerows([symbol.symbol, symbol.name, symbol.price, symbol.change_price,
+                                    symbol.change_percent, symbol.market_price]
+                                   for symbol in symbols[start:start + CSV_CHUNK_ROWS])
+            if self._buffer.tell() >= self.flush_bytes:
+                await self.flush()
+        self.count += len(symbols)
+
+    async def flush(self):
+        chunk = self._buffer.getvalue()
+        if chunk:
+            await self._file.write(chunk)
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    async def close(self):
+        if self._file is None:
+            return
+        await self.flush()
+        await self._file.close()
+        self._file = None
+
+    def __len__(self):
+        return self.count
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+def parse_fmt_number(fmt: str) -> Optional[float]:
+    """
+    Number of a Yahoo Finance fmt string
+    :param fmt: "97,123.45", "-1,234.56", "+1.25%", "1.923T"
+    :return: 97123.45, -1234.56, 1.25 (percent), 1.923e12, None if it is empty or not a number
+    """
+    if not fmt:
+        return None
+    text = fmt.strip().replace(",", "").rstrip("%")
+    multiplier = 1.0
+    if text and text[-1] in FMT_MULTIPLIERS:
+        multiplier = FMT_MULTIPLIERS[text[-1]]
+        text = text[:-1]
+    try:
+        return float(text) * multiplier
+    except ValueError:
+        return None
+
+
+def symbol_columns_schema():
+    return pa.schema([
+        ("snapshot_time", pa.timestamp("s", tz="UTC")),
+        ("symbol", pa.string()),
+        ("name", pa.string()),
+        ("price", pa.string()),
+        ("change_price", pa.string()),
+        ("change_percent", pa.string()),
+        ("market_price", pa.string()),
+        ("price_value", pa.float64()),
+        ("change_price_value", pa.float64()),
+        ("change_percent_value", pa.float64()),
+        ("market_price_value", pa.float64()),
+    ])
+
+
+class SymbolParquetWriter:
+    """
+    Write the symbols of one crawl run to a Parquet file in record batches. The fmt strings are kept and their
+    numbers are added as float columns, with the snapshot time of the run, so a directory of runs can be scanned
+    with pyarrow.dataset as one table.
+    """
+
+    def __init__(self, file_path: str, snapshot_time: Optional[float] = None, batch_size: int = PARQUET_BATCH_SIZE,
+                 compression: str = PARQUET_COMPRESSION):
+        """
+        :param file_path: output .parquet file, its directory is created if missing
+        :param snapshot_time: unix time of the snapshot, now by default
+        :param batch_size: symbols buffered before a record batch is written
+        :param compression: parquet codec
+        """
+        if pa is None:
+            raise ImportError("SymbolParquetWriter needs pyarrow, pip install pyarrow")
+        self.file_path = file_path
+        self.snapshot_time = int(snapshot_time if snapshot_time is not None else time.time())
+        self.batch_size = batch_size
+        self.count = 0
+        self._schema = symbol_columns_schema()
+        self._columns: Dict[str, list] = {name: [] for name in SYMBOL_COLUMNS}
+        self._buffered = 0
+        if os.path.dirname(file_path):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        self._writer = pq.ParquetWriter(file_path, self._schema, compression=compression)
+
+    def append(self, symbol_content: SymbolContent):
+        columns = self._columns
+        columns["snapshot_time"].append(self.snapshot_time)
+        for field in SymbolContent.get_fields():
+            value = getattr(symbol_content, field)
+            columns[field].append(value)
+            if field in ("price", "change_price", "change_percent", "market_price"):
+                # the raw number sent by the API, the fmt string is only parsed when it is missing
+                raw = getattr(symbol_content, field + "_raw")
+                columns[field + "_value"].append(float(raw) if raw is not None else parse_fmt_number(value))
+        self.count += 1
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def extend(self, symbols: List[SymbolContent]):
+        for symbol_content in symbols:
+            self.append(symbol_content)
+
+    def flush(self):
+        if not self._buffered:
+            return
+        self._writer.write_batch(pa.RecordBatch.from_pydict(self._columns, schema=self._schema))
+        self._buffered = 0
+        for column in self._columns.values():
+            column.clear()
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def save_data_to_parquet(save_file_name: str, currency_data_list: List[SymbolContent]) -> None:
+    """
+    Save data to Parquet.
+    :param save_file_name: Save file name
+    :param currency_data_list:
+    :return:
+    """
+    with SymbolParquetWriter(save_file_name) as writer:
+        writer.extend(currency_data_list)
@@ -20,13 +20,19 @@ params = {
     # fill in your params here
 }
 
-response = requests.get(
-    'https://query1.finance.yahoo.com/v1/finance/screener/predefined/saved',
-    params=params,
-    cookies=cookies,
-    headers=headers,
-)
+
+def send_test_request() -> requests.Response:
+    """
+    Send the converted request, only when the script is run: importing it (e.g. by a test collector) stays offline
+    :return:
+    """
+    return requests.get(
+        'https://query1.finance.yahoo.com/v1/finance/screener/predefined/saved',
+        params=params,
+        cookies=cookies,
+        headers=headers,
+    )
 
 
 if __name__ == '__main__':
-    pprint.pprint(response.json())
+    pprint.pprint(send_test_request().json())
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/26 10:00
+# @Desc    : poll mode delta store test code, run from yahoo-finance-crypto-crawler: python -m pytest
+
+import os
+import tempfile
+import unittest
+from typing import List
+
+from common import SymbolContent
+from poller import DeltaStore, symbol_row
+
+
+def quote(symbol: str, price: float) -> SymbolContent:
+    return SymbolContent(symbol=symbol, name=symbol.split("-")[0], price=f"{price:,.2f}", price_raw=price)
+
+
+class TestDeltaStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir_path = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def files(self, kind: str) -> List[str]:
+        return sorted(name for name in os.listdir(self.dir_path) if name.startswith(kind + "-"))
+
+    def delta_lines(self, compacted_at: int) -> List[str]:
+        with open(os.path.join(self.dir_path, f"delta-{compacted_at}.csv"), encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def test_apply_writes_only_changes(self):
+        with DeltaStore(self.dir_path) as store:
+            # the first poll is the first base file
+            self.assertEqual(store.apply([quote("BTC-USD", 1.0), quote("ETH-USD", 2.0)], True, 100), (2, 0))
+            self.assertEqual(self.files("base"), ["base-100.csv"])
+            self.assertEqual(store.apply([quote("BTC-USD", 1.0), quote("ETH-USD", 2.5)], True, 160), (1, 0))
+            # a movers poll does not delete the symbols it did not see
+            self.assertEqual(store.apply([quote("SOL-USD", 3.0)], False, 220), (1, 0))
+            self.assertEqual(store.apply([quote("BTC-USD", 1.0), quote("SOL-USD", 3.0)], True, 280), (0, 1))
+            self.assertEqual(sorted(store.state), ["BTC-USD", "SOL-USD"])
+        lines = self.delta_lines(100)
+        self.assertEqual(len(lines), 1 + 3)
+        self.assertTrue(lines[1].startswith("160,,ETH-USD,"))
+        self.assertTrue(lines[3].startswith("280,1,ETH-USD,"))
+
+    def test_compact_keeps_last_pairs(self):
+        with DeltaStore(self.dir_path, keep_compactions=2) as store:
+            for poll_time in (100, 160, 220):
+                store.apply([quote("BTC-USD", float(poll_time))], True, poll_time)
+                store.compact(poll_time + 1)
+            self.assertEqual(self.files("base"), ["base-161.csv", "base-221.csv"])
+            self.assertEqual(self.files("delta"), ["delta-161.csv", "delta-221.csv"])
+        # a new delta file only has its header
+        self.assertEqual(len(self.delta_lines(221)), 1)
+
+    def test_restore_base_and_deltas(self):
+        with DeltaStore(self.dir_path) as store:
+            store.apply([quote("BTC-USD", 1.0), quote("ETH-USD", 2.0)], True, 100)
+            store.apply([quote("BTC-USD", 1.5)], True, 160)
+            state = dict(store.state)
+        with DeltaStore(self.dir_path) as restored:
+            self.assertEqual(restored.state, state)
+            self.assertEqual(restored.state["BTC-USD"], symbol_row(quote("BTC-USD", 1.5)))
+            # nothing changed since the restart
+            self.assertEqual(restored.apply([quote("BTC-USD", 1.5)], True, 220), (0, 0))
+
+    def test_restore_after_torn_write(self):
+        with DeltaStore(self.dir_path) as store:
+            store.apply([quote("BTC-USD", 1.0), quote("ETH-USD", 2.0)], True, 100)
+            store.apply([quote("BTC-USD", 1.5)], False, 160)
+        delta_path = os.path.join(self.dir_path, "delta-100.csv")
+        # a crash in the middle of the next write
+        with open(delta_path, "ab") as f:
+            f.write(b"220,,ETH-USD,ETH,2.")
+
+        with DeltaStore(self.dir_path) as restored:
+            self.assertEqual(restored.state["BTC-USD"], symbol_row(quote("BTC-USD", 1.5)))
+            self.assertEqual(restored.state["ETH-USD"], symbol_row(quote("ETH-USD", 2.0)))
+            restored.apply([quote("BTC-USD", 1.5), quote("ETH-USD", 2.5)], True, 280)
+            # BTC-USD is delisted
+            restored.apply([quote("ETH-USD", 3.0)], True, 340)
+        self.assertEqual([line.split(",")[0] for line in self.delta_lines(100)[1:]], ["160", "280", "340", "340"])
+
+        # the rows written after the torn one survive the next restart
+        with DeltaStore(self.dir_path) as restored:
+            self.assertEqual(sorted(restored.state), ["ETH-USD"])
+            self.assertEqual(restored.state["ETH-USD"], symbol_row(quote("ETH-USD", 3.0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/26 11:30
+# @Desc    : pandas snapshot test code: frame building, ranking, market cap buckets and snapshot diff
+
+import math
+import unittest
+
+from common import SymbolContent
+from snapshot import diff_snapshots, market_cap_buckets, pd, rank_changes, symbols_to_frame
+
+
+def quote(symbol: str, price: float, change_percent: float, market_cap: float) -> SymbolContent:
+    return SymbolContent(symbol=symbol, name=symbol.split("-")[0], price=f"{price:,.2f}",
+                         change_percent=f"{change_percent:+.2f}%", market_price=f"{market_cap / 1e9:.3f}B",
+                         price_raw=price, change_percent_raw=change_percent, market_price_raw=market_cap)
+
+
+@unittest.skipIf(pd is None, "numpy / pandas are not installed")
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.old = symbols_to_frame([
+            quote("BTC-USD", 100.0, 1.0, 2e12),
+            quote("ETH-USD", 10.0, -2.0, 4e11),
+            quote("DOGE-USD", 0.0, 5.0, 5e6),
+        ], snapshot_time=1734600000)
+        self.new = symbols_to_frame([
+            quote("BTC-USD", 110.0, 3.0, 2.2e12),
+            quote("ETH-USD", 9.0, -4.0, 3.6e11),
+            quote("SOL-USD", 20.0, 8.0, 9e10),
+            # listed twice by two overlapping pages
+            quote("SOL-USD", 21.0, 9.0, 9e10),
+        ], snapshot_time=1734600060)
+
+    def test_frame(self):
+        self.assertEqual(list(self.new.index), ["BTC-USD", "ETH-USD", "SOL-USD"])
+        self.assertEqual(self.new.loc["SOL-USD", "price"], 20.0)
+        # a quote without raw numbers parses its fmt strings
+        frame = symbols_to_frame([SymbolContent(symbol="ADA-USD", price="1,234.50", change_percent="-1.5%",
+                                                market_price="1.2B")])
+        self.assertEqual(frame.loc["ADA-USD", ["price", "change_percent", "market_cap"]].tolist(),
+                         [1234.5, -1.5, 1.2e9])
+        self.assertTrue(math.isnan(frame.loc["ADA-USD", "change_price"]))
+
+    def test_diff_snapshots(self):
+        diff = diff_snapshots(self.old, self.new)
+        self.assertEqual(diff["status"].to_dict(), {"BTC-USD": "kept", "DOGE-USD": "delisted", "ETH-USD": "kept",
+                                                    "SOL-USD": "listed"})
+        self.assertEqual(diff.loc["BTC-USD", "price_change"], 10.0)
+        self.assertAlmostEqual(diff.loc["ETH-USD", "price_change_percent"], -10.0)
+        self.assertAlmostEqual(diff.loc["BTC-USD", "market_cap_change"], 2e11)
+        self.assertTrue(math.isnan(diff.loc["SOL-USD", "price_change"]))
+        self.assertTrue(math.isnan(diff.loc["DOGE-USD", "price_change_percent"]))
+
+    def test_rank_changes(self):
+        ranked = rank_changes(self.old, n=1)
+        self.assertEqual(list(zip(ranked.index, ranked["side"])), [("DOGE-USD", "gainer"), ("ETH-USD", "loser")])
+        # the coins below the market cap floor are skipped
+        ranked = rank_changes(self.old, n=1, min_market_cap=1e9)
+        self.assertEqual(list(ranked.index), ["BTC-USD", "ETH-USD"])
+        ranked = rank_changes(diff_snapshots(self.old, self.new), n=1, by="price_change_percent")
+        self.assertEqual(list(ranked.index), ["BTC-USD", "ETH-USD"])
+
+    def test_market_cap_buckets(self):
+        buckets = market_cap_buckets(self.old)
+        self.assertEqual(buckets.astype(str).to_dict(), {"BTC-USD": "large", "ETH-USD": "large",
+                                                         "DOGE-USD": "nano"})
+        # lower bound included
+        frame = symbols_to_frame([quote("MID-USD", 1.0, 0.0, 1e9)])
+        self.assertEqual(str(market_cap_buckets(frame)["MID-USD"]), "mid")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# @Author  : kelvin.chiu021@gmail.com
+# @Time    : 2024/12/26 11:00
+# @Desc    : symbol export test code: fmt number parsing, buffered CSV and Parquet writers
+
+import asyncio
+import csv
+import os
+import tempfile
+import unittest
+
+from common import SymbolContent
+from storage import SymbolCsvWriter, SymbolParquetWriter, pa, parse_fmt_number
+
+
+def make_symbols(count: int):
+    return [SymbolContent(symbol=f"C{index}-USD", name=f"Coin, {index}", price=f"{index:,.2f}",
+                          change_price="-0.50", change_percent="-1.25%", market_price="1.923T",
+                          price_raw=float(index) if index % 2 else None)
+            for index in range(count)]
+
+
+class TestParseFmtNumber(unittest.TestCase):
+    def test_separators_and_signs(self):
+        self.assertEqual(parse_fmt_number("97,123.45"), 97123.45)
+        self.assertEqual(parse_fmt_number("-1,234.56"), -1234.56)
+        self.assertEqual(parse_fmt_number("+1.25%"), 1.25)
+        self.assertEqual(parse_fmt_number("-0.05%"), -0.05)
+        self.assertEqual(parse_fmt_number(" 5 "), 5.0)
+
+    def test_suffixes(self):
+        self.assertEqual(parse_fmt_number("12.5k"), 12500.0)
+        self.assertEqual(parse_fmt_number("1.2M"), 1.2e6)
+        self.assertEqual(parse_fmt_number("-3.2B"), -3.2e9)
+        self.assertEqual(parse_fmt_number("1.923T"), 1.923e12)
+
+    def test_not_a_number(self):
+        self.assertIsNone(parse_fmt_number(""))
+        self.assertIsNone(parse_fmt_number(None))
+        self.assertIsNone(parse_fmt_number("N/A"))
+        self.assertIsNone(parse_fmt_number("T"))
+
+
+class TestSymbolCsvWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "symbol_data.csv")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_rows_in_order_across_flushes(self):
+        symbols = make_symbols(2500)
+
+        async def write():
+            # a tiny buffer, so the rows reach the file in many chunks
+            async with SymbolCsvWriter(self.file_path, flush_bytes=4096) as writer:
+                await writer.append(symbols[0])
+                await writer.extend(symbols[1:])
+                return len(writer)
+
+        self.assertEqual(asyncio.run(write()), len(symbols))
+        with open(self.file_path, newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], SymbolContent.get_fields())
+        self.assertEqual(len(rows), 1 + len(symbols))
+        self.assertEqual(rows[1], ["C0-USD", "Coin, 0", "0.00", "-0.50", "-1.25%", "1.923T"])
+        self.assertEqual(rows[-1][:3], ["C2499-USD", "Coin, 2499", "2,499.00"])
+
+    def test_file_truncated(self):
+        async def write(count: int):
+            async with SymbolCsvWriter(self.file_path) as writer:
+                await writer.extend(make_symbols(count))
+
+        asyncio.run(write(5))
+        asyncio.run(write(2))
+        with open(self.file_path, newline="", encoding="utf-8") as f:
+            self.assertEqual(len(list(csv.reader(f))), 1 + 2)
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed")
+class TestSymbolParquetWriter(unittest.TestCase):
+    def test_raw_numbers_first(self):
+        import pyarrow.parquet as pq
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "snapshots", "symbols.parquet")
+            with SymbolParquetWriter(file_path, snapshot_time=1734600000, batch_size=2) as writer:
+                writer.extend(make_symbols(5))
+            table = pq.read_table(file_path)
+        self.assertEqual(table.num_rows, 5)
+        columns = table.to_pydict()
+        # odd symbols have a raw price, the others parse the fmt string
+        self.assertEqual(columns["price_value"], [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(columns["change_percent_value"], [-1.25] * 5)
+        self.assertEqual(columns["market_price_value"], [1.923e12] * 5)
+        self.assertEqual(columns["name"][1], "Coin, 1")
+
+
+if __name__ == '__main__':
+    unittest.main()